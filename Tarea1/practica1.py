@@ -3,13 +3,17 @@
 # Developer: Diego Cruz Aguilar
 # Date: 02/02/2024
 # Versión: 2.0
+import gzip
+import os
 import re
-from collections import Counter
+from collections import Counter, OrderedDict
+from collections.abc import Iterator
 from dataclasses import dataclass
+from itertools import islice, tee
+from multiprocessing import Pool
 
-from nltk import word_tokenize
-from nltk.stem import PorterStemmer
-from nltk.stem.wordnet import WordNetLemmatizer
+from recuperacion.instrumentation import NO_METRICS
+from recuperacion.paths import DATASET, DOCUMENTS, FREQ, QUERIES
 
 
 def load_stopwords(stopwords_file: str) -> list[str]:
@@ -56,22 +60,47 @@ def get_metadata(title: str) -> tuple[str, str, str]:
     return id_date[0], id_date[1].rstrip(), page[1]
 
 
-def load_documents(documents_path: str) -> list[Document]:
-    """load and preprocessing documents
+def iter_fragments(file_path: str, marker: str, buffer_size=1 << 20):
+    """Stream the fragments of a file that follow each occurrence of marker
 
-    Args:
-        documents_path: Path form documents
+    Equivalent to text.split(marker)[1:], but the file is read line by line
+    and only the current fragment is held in memory.
 
-    Returns: List of Documents
+    Args:
+        file_path: Path of the file
+        marker: Separator between fragments
+        buffer_size: Size of the read buffer
 
+    Returns: Iterator of fragments
     """
-    with open(documents_path, "r") as file:
-        text = file.read()
+    with open(file_path, "r", buffering=buffer_size) as file:
+        fragment = None
+        for line in file:
+            if marker not in line:
+                if fragment is not None:
+                    fragment.append(line)
+                continue
+            parts = line.split(marker)
+            if fragment is not None:
+                fragment.append(parts[0])
+                yield "".join(fragment)
+            for part in parts[1:-1]:
+                yield part
+            fragment = [parts[-1]]
+        if fragment is not None:
+            yield "".join(fragment)
+
+
+def iter_documents(documents_path: str) -> Iterator[Document]:
+    """Stream and preprocess documents
 
-    documents = []
+    Args:
+        documents_path: Path form documents
 
+    Returns: Iterator of Documents
+    """
     # Split docucuents from title
-    fragments = text.split("*TEXT")[1:]
+    fragments = iter_fragments(documents_path, "*TEXT")
 
     for id, fragment in enumerate(fragments, start=1):
         # Split document for extract metadata
@@ -82,10 +111,33 @@ def load_documents(documents_path: str) -> list[Document]:
             id_psical, date, page = get_metadata(lines[0])
             content = " ".join(lines[1:])
             # Create new document
-            document = Document(id, id_psical, date, page, content)
-            documents.append(document)
+            yield Document(id, id_psical, date, page, content)
+
+
+def load_documents(documents_path: str) -> list[Document]:
+    """load and preprocessing documents
+
+    Args:
+        documents_path: Path form documents
+
+    Returns: List of Documents
+
+    """
+    return list(iter_documents(documents_path))
+
 
-    return documents
+def iter_queries(queries_path: str) -> Iterator[str]:
+    """Stream and preprocess queries
+
+    Args:
+        queries_path: Path from queries
+
+    Returns: Iterator of queries
+    """
+    for fragment in iter_fragments(queries_path, "*FIND"):
+        lines = fragment.strip().split("\n", maxsplit=1)
+        if lines:
+            yield lines[1]
 
 
 def load_queries(queries_path: str) -> list[str]:
@@ -97,43 +149,149 @@ def load_queries(queries_path: str) -> list[str]:
     Returns: List of queries
 
     """
-    with open(queries_path, "r") as file:
-        text = file.read()
+    return list(iter_queries(queries_path))
 
-    queries = []
 
-    fragments = text.split("*FIND")[1:]
+class TermCache:
+    """Bounded cache of token -> normalized term with LRU eviction
 
-    for id, fragment in enumerate(fragments, start=1):
-        lines = fragment.strip().split("\n", maxsplit=1)
-        if lines:
-            queries.append(lines[1])
+    Attributes:
+        max_size: Maximum number of cached tokens
+        terms: OrderedDict from least to most recently used token
+        hits: Number of lookups found in the cache
+        misses: Number of lookups not found in the cache
+        new_terms: Dict collecting every put, or None to not track them
+    """
+
+    def __init__(self, max_size=100_000) -> None:
+        self.max_size = max_size
+        self.terms = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.new_terms = None
+
+    def get(self, token: str):
+        term = self.terms.get(token)
+        if term is None:
+            self.misses += 1
+        else:
+            self.terms.move_to_end(token)
+            self.hits += 1
+        return term
+
+    def put(self, token: str, term: str):
+        if self.new_terms is not None:
+            self.new_terms[token] = term
+        self.terms[token] = term
+        self.terms.move_to_end(token)
+        if len(self.terms) > self.max_size:
+            self.terms.popitem(last=False)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def save(self, cache_file: str):
+        """Write the cache, least recently used token first
+
+        Args:
+            cache_file: Output file
+        """
+        with open(cache_file, "w") as file:
+            for token, term in self.terms.items():
+                file.write(f"{token} {term}\n")
 
-    return queries
+    @classmethod
+    def load(cls, cache_file: str, max_size=100_000):
+        """Load a cache written by save, or an empty one if it does not exist
 
+        Args:
+            cache_file: Input file
+            max_size: Maximum number of cached tokens
 
-class IRSystem1:
-    """Class creating an information retrieval system
+        Returns: TermCache
+        """
+        cache = cls(max_size)
+        if os.path.exists(cache_file):
+            with open(cache_file, "r") as file:
+                for line in file:
+                    token, term = line.split()
+                    cache.put(token, term)
+        return cache
+
+
+# Tokens left by the two re.sub passes of the NLTK path: runs of word
+# characters that are not digits
+TOKEN_PATTERN = re.compile(r"[^\W\d]+")
+# Contractions word_tokenize splits even in text without punctuation
+TREEBANK_SPLITS = {
+    "cannot": ("can", "not"),
+    "gimme": ("gim", "me"),
+    "gonna": ("gon", "na"),
+    "gotta": ("got", "ta"),
+    "lemme": ("lem", "me"),
+    "wanna": ("wan", "na"),
+}
+
+
+class Preprocessor:
+    """Text normalization pipeline: cleaning, tokenization, stopword removal,
+    stemming and lemmatization
 
     Attributes:
-        stop_words: List of stopwords
-        documents: List of Documents
+        stop_words: Set of stopwords
         wordnet_lemmatizer: Instance of WordNetLemmatizer
         ps: Instance of PorterStemmer algorihtm
+        cache: TermCache with the stem and lemma of seen tokens
+        fast: Whether tokenize uses the compiled pattern instead of re.sub
+            and word_tokenize; both give the same tokens
     """
 
-    def __init__(self, dataset_prefix_path: str) -> None:
+    def __init__(self, stop_words, cache=None, fast=True) -> None:
         """Contructor
 
         Args:
-            dataset_prefix_path: Relative Path of dataset files
+            stop_words: List of stopwords
+            cache: TermCache to use, a new empty one by default
+            fast: Use the compiled tokenizer
         """
-        self.stop_words = load_stopwords(dataset_prefix_path + ".STP")
-        self.documents = load_documents(dataset_prefix_path + ".ALL")
+        # NLTK takes about a second to import, so it is only loaded here
+        from nltk.stem import PorterStemmer
+        from nltk.stem.wordnet import WordNetLemmatizer
+
+        self.stop_words = frozenset(stop_words)
+        self.fast = fast
         self.wordnet_lemmatizer = WordNetLemmatizer()
         self.ps = PorterStemmer()
-
-    def preprocess_doc(self, text: str) -> list:
+        self.cache = TermCache() if cache is None else cache
+
+    def normalize(self, token: str) -> str:
+        """Stem and lemmatize a token, reusing cached results"""
+        term = self.cache.get(token)
+        if term is None:
+            term = self.wordnet_lemmatizer.lemmatize(self.ps.stem(token))
+            self.cache.put(token, term)
+        return term
+
+    def warm_up(self):
+        """Force the lazy loading of WordNet before the first document"""
+        self.wordnet_lemmatizer.lemmatize(self.ps.stem("documents"))
+
+    def tokenize(self, text: str) -> list:
+        """Lowercase words of a text, without digits or punctuation"""
+        if self.fast:
+            word_tokens = []
+            for token in TOKEN_PATTERN.findall(text):
+                token = token.lower()
+                split = TREEBANK_SPLITS.get(token)
+                if split is None:
+                    word_tokens.append(token)
+                else:
+                    word_tokens.extend(split)
+            return word_tokens
+
+        from nltk import word_tokenize
 
         text = re.sub(r"[^\w]", " ", text)
         text = re.sub(r"[^\D]", " ", text)
@@ -141,36 +299,236 @@ class IRSystem1:
 
         text = text.lower()
 
-        word_tokens = word_tokenize(text)
+        return word_tokenize(text)
+
+    def __call__(self, text: str) -> list:
+        stop_words = self.stop_words
+        filtered_word_tokens = [w for w in self.tokenize(text) if w not in stop_words]
 
-        stop_words = set(self.stop_words)
-        filtered_word_tokens = [w for w in word_tokens if w not in stop_words]
+        # retrieve stem and lemma from words
+        return [self.normalize(w) for w in filtered_word_tokens]
 
-        # retrieve stem from words
-        ps = PorterStemmer()
-        stemming = []
 
-        for w in filtered_word_tokens:
-            stem = ps.stem(w)
-            stemming.append(stem)
+# Preprocessor of each worker process, created once by init_worker
+worker_preprocessor = None
 
-        wordnet_lemmatizer = WordNetLemmatizer()
 
-        lemmatization = []
-        for w in stemming:
-            lemma = wordnet_lemmatizer.lemmatize(w)
-            lemmatization.append(lemma)
+def init_worker(stop_words: list[str], terms=(), max_size=100_000):
+    """Create and warm up the Preprocessor of a worker process
 
-        return lemmatization
+    Args:
+        stop_words: List of stopwords
+        terms: (token, term) pairs of the parent cache, least recently used
+            first, that warm up the worker cache
+        max_size: Maximum number of tokens of the worker cache
+    """
+    global worker_preprocessor
+    cache = TermCache(max_size)
+    for token, term in terms:
+        cache.put(token, term)
+    cache.new_terms = {}
+    worker_preprocessor = Preprocessor(stop_words, cache)
+    worker_preprocessor.warm_up()
+
+
+def worker_term_frequency(text: str) -> tuple[Counter, dict[str, str], int, int]:
+    """Term frequencies of a text, computed in a worker process
+
+    Returns: Counter, the tokens normalized for the first time by this
+        worker, and the cache hits and misses of the text, all to be merged
+        into the cache of the parent process
+    """
+    frequencies = Counter(worker_preprocessor(text))
+    cache = worker_preprocessor.cache
+    new_terms, hits, misses = cache.new_terms, cache.hits, cache.misses
+    cache.new_terms = {}
+    cache.hits = cache.misses = 0
+    return frequencies, new_terms, hits, misses
 
-    def extract_vocabulary(self):
-        """Create file with words frequencies"""
-        for document in self.documents:
-            self.write_term_frecuency(
-                f"{document.Id}-{document.Id_Psical}",
-                Counter(self.preprocess_doc(document.Content)),
-                "../freq/documents",
-            )
+
+def format_frequencies(prefix: str, id: str, document_word_fecuency) -> str:
+    """Format a .FRQ line: prefix and id followed by word-frequency pairs"""
+    return f"{prefix}{id}" + "".join(
+        f" {word}-{freq}" for word, freq in document_word_fecuency.items()
+    )
+
+
+class FrequencyWriter:
+    """Writes the lines of a .FRQ file through a single buffered handle
+
+    Attributes:
+        prefix: Prefix of the line identifiers
+        file: Open handle of the output file
+    """
+
+    def __init__(
+        self, doc_name: str, prefix="Doc", compress=False, mode="a", buffer_size=1 << 20
+    ) -> None:
+        """Contructor
+
+        Args:
+            doc_name: Output file name, without extension
+            prefix: Prefix of the line identifiers
+            compress: Write a gzip compressed doc_name.FRQ.gz file instead
+            mode: "a" to append to the file or "w" to overwrite it
+            buffer_size: Bytes buffered before writing to disk
+        """
+        self.prefix = prefix
+        if compress:
+            self.file = gzip.open(doc_name + ".FRQ.gz", mode + "t")
+        else:
+            self.file = open(doc_name + ".FRQ", mode, buffering=buffer_size)
+
+    def write(self, id: str, document_word_fecuency: Counter):
+        """Write the frequencies of a document
+
+        Args:
+            id: identifier for element
+            document_word_fecuency: Dict with words and frequencies
+        """
+        self.file.write(format_frequencies(self.prefix, id, document_word_fecuency))
+        self.file.write("\n")
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class IRSystem1:
+    """Class creating an information retrieval system
+
+    Attributes:
+        stop_words: List of stopwords
+        documents_path: Path of the documents file
+        queries_path: Path of the queries file
+        documents: List of Documents, loaded on first access
+        preprocessor: Preprocessor used for documents and queries
+        cache_file: File where the TermCache is persisted, if any
+        metrics: Metrics timing preprocess_doc, disabled unless a Metrics
+            instance is assigned
+    """
+
+    metrics = NO_METRICS
+
+    def __init__(self, dataset_prefix_path: str, cache_file=None) -> None:
+        """Contructor
+
+        Args:
+            dataset_prefix_path: Relative Path of dataset files
+            cache_file: File to load the TermCache from and save it to
+        """
+        self.stop_words = load_stopwords(dataset_prefix_path + ".STP")
+        self.documents_path = dataset_prefix_path + ".ALL"
+        self.queries_path = dataset_prefix_path + ".QUE"
+        self.__documents = None
+        self.cache_file = cache_file
+        cache = TermCache.load(cache_file) if cache_file else None
+        self.preprocessor = Preprocessor(self.stop_words, cache)
+
+    @property
+    def documents(self) -> list[Document]:
+        if self.__documents is None:
+            self.__documents = load_documents(self.documents_path)
+        return self.__documents
+
+    def save_cache(self):
+        """Persist the TermCache of the preprocessor to cache_file"""
+        if self.cache_file:
+            self.preprocessor.cache.save(self.cache_file)
+
+    def preprocess_doc(self, text: str) -> list:
+        with self.metrics.stage("preprocess"):
+            terms = self.preprocessor(text)
+        self.metrics.count("terms", len(terms))
+        return terms
+
+    def term_frequencies(self, texts, workers=1, chunksize=8):
+        """Term frequencies of each text, in the same order as texts
+
+        Texts are consumed lazily: in parallel mode at most a few chunks per
+        worker are read ahead of the results. Workers start from a copy of
+        the preprocessor cache, and their new terms and hit and miss counts
+        are merged back into it.
+
+        Args:
+            texts: Iterable of texts
+            workers: Number of processes, None uses every CPU
+            chunksize: Texts sent to a worker at a time
+
+        Returns: Iterator of Counter
+        """
+        if workers == 1:
+            for text in texts:
+                yield Counter(self.preprocess_doc(text))
+            return
+        workers = workers or os.cpu_count()
+        texts = iter(texts)
+        cache = self.preprocessor.cache
+        with Pool(
+            workers,
+            initializer=init_worker,
+            initargs=(self.stop_words, list(cache.terms.items()), cache.max_size),
+        ) as pool:
+            # Pool.imap reads its whole input eagerly, so feed it in windows
+            while window := list(islice(texts, 4 * workers * chunksize)):
+                for frequencies, new_terms, hits, misses in pool.imap(
+                    worker_term_frequency, window, chunksize
+                ):
+                    for token, term in new_terms.items():
+                        cache.put(token, term)
+                    cache.hits += hits
+                    cache.misses += misses
+                    yield frequencies
+
+    def extract_vocabulary(
+        self, workers=1, compress=False, documents_name=DOCUMENTS, mode="a"
+    ) -> int:
+        """Create file with words frequencies
+
+        Args:
+            workers: Number of preprocessing processes, None uses every CPU
+            compress: Write a gzip compressed .FRQ.gz file
+            documents_name: Output file name, without extension
+            mode: "a" to append to the file or "w" to overwrite it
+
+        Returns: Number of documents written
+        """
+        documents, contents = tee(iter_documents(self.documents_path))
+        frequencies = self.term_frequencies(
+            (document.Content for document in contents), workers
+        )
+        num_documents = 0
+        with FrequencyWriter(documents_name, compress=compress, mode=mode) as writer:
+            for document, document_frequency in zip(documents, frequencies):
+                writer.write(f"{document.Id}-{document.Id_Psical}", document_frequency)
+                num_documents += 1
+        return num_documents
+
+    def extract_queries(
+        self, workers=1, compress=False, queries_name=QUERIES, mode="a"
+    ) -> int:
+        """Create file with the words frequencies of the queries
+
+        Args:
+            workers: Number of preprocessing processes, None uses every CPU
+            compress: Write a gzip compressed .FRQ.gz file
+            queries_name: Output file name, without extension
+            mode: "a" to append to the file or "w" to overwrite it
+
+        Returns: Number of queries written
+        """
+        frequencies = self.term_frequencies(iter_queries(self.queries_path), workers)
+        num_queries = 0
+        with FrequencyWriter(queries_name, "Que", compress, mode) as writer:
+            for id, query_frequency in enumerate(frequencies, start=1):
+                writer.write(f"{id}", query_frequency)
+                num_queries += 1
+        return num_queries
 
     @staticmethod
     def write_term_frecuency(
@@ -183,19 +541,13 @@ class IRSystem1:
             document_word_fecuency: Dict with words and frequencies
             doc_name: Output file name
         """
-        line = f"{prefix}{id}"
-        for word, freq in document_word_fecuency.items():
-            line += f" {word}-{freq}"
-        with open(doc_name + ".FRQ", "a") as file:
-            file.write(line + "\n")
+        with FrequencyWriter(doc_name, prefix) as writer:
+            writer.write(id, document_word_fecuency)
 
 
 if __name__ == "__main__":
-    dataset_prefix_path = "../dataset/TIME"
-    ir_system = IRSystem1(dataset_prefix_path)
-    ir_system.extract_vocabulary()
-    queries = load_queries(dataset_prefix_path + ".QUE")
-    for id, query in enumerate(queries, start=1):
-        ir_system.write_term_frecuency(
-            f"{id}", Counter(ir_system.preprocess_doc(query)), "../freq/queries", "Que"
-        )
+    dataset_prefix_path = DATASET
+    ir_system = IRSystem1(dataset_prefix_path, os.path.join(FREQ, "terms.cache"))
+    ir_system.extract_vocabulary(workers=None)
+    ir_system.extract_queries(workers=None)
+    ir_system.save_cache()
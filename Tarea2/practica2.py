@@ -5,7 +5,8 @@
 
 # import csv
 import math
-from dataclasses import dataclass
+from array import array
+from dataclasses import dataclass, field
 from typing import Union
 
 
@@ -20,6 +21,18 @@ class DocumentFrequency(Document):
     id_psical: str
 
 
+@dataclass(slots=True)
+class Postings:
+    """Posting list of a term, sorted by doc id"""
+
+    doc_ids: array = field(default_factory=lambda: array("i"))
+    weights: array = field(default_factory=lambda: array("d"))
+
+    def append(self, doc_id: int, weight: float):
+        self.doc_ids.append(doc_id)
+        self.weights.append(weight)
+
+
 def load_frequencies(
     frequencies_name: str, query=False
 ) -> Union[list[DocumentFrequency], list[Document]]:
@@ -72,10 +85,21 @@ class TestIR:
 
 
 class IRSystem2:
+    """TF-IDF retrieval system backed by an inverted index
+
+    Attributes:
+        documents_frequencies: List of DocumentFrequency
+        vocabulary: Dict with words and document frequencies
+        idf: Dict with words and inverse document frequencies
+        index: Dict with words and their Postings
+        documents_norms: Euclidean norm of each document vector
+    """
+
     def __init__(self, documents_frequencies) -> None:
         self.documents_frequencies = documents_frequencies
         self.vocabulary = self.__get_vocabulary()
-        self.documents_vectors = self.__vectorize_documents()
+        self.idf = self.__get_idf()
+        self.index, self.documents_norms = self.__index_documents()
 
     def __get_vocabulary(self):
         vocabulary = {}
@@ -87,40 +111,60 @@ class IRSystem2:
                     vocabulary[word] = 1
         return vocabulary
 
-    def __vectorize_documents(self):
-        documents_vectors = []
+    def __get_idf(self):
         num_doc = len(self.documents_frequencies)
-        for doc_freq in self.documents_frequencies:
-            document_vector = {}
+        return {
+            word: math.log(num_doc / (1 + frecuency))
+            for word, frecuency in self.vocabulary.items()
+        }
+
+    def __index_documents(self):
+        index = {word: Postings() for word in self.vocabulary}
+        documents_norms = array("d")
+        for doc_id, doc_freq in enumerate(self.documents_frequencies, start=1):
             size_document = sum(doc_freq.frequencies.values())
-            for word, frecuency in self.vocabulary.items():
-                tf = doc_freq.frequencies.get(word, 0) / size_document
-                idf = math.log(num_doc / (1 + frecuency))
-                document_vector[word] = tf * idf
-            documents_vectors.append(document_vector)
-        return documents_vectors
+            norm = 0.0
+            for word, frecuency in doc_freq.frequencies.items():
+                weight = frecuency / size_document * self.idf[word]
+                index[word].append(doc_id, weight)
+                norm += weight**2
+            documents_norms.append(math.sqrt(norm))
+        return index, documents_norms
 
     def __vectorize_query(self, query: Document):
-        query_vector = {}
-        for word in self.vocabulary:
-            if word in query.frequencies:
-                query_vector[word] = 1
-            else:
-                query_vector[word] = 0
-        return query_vector
-
-    def __cosine_similarity(self, query, document):
-        dot_product = sum(query[word] * document[word] for word in query)
-        norm_query = math.sqrt(sum(query[word] ** 2 for word in query))
-        norm_document = math.sqrt(sum(document[word] ** 2 for word in document))
-        if norm_query * norm_document == 0:
-            return 0
-        return dot_product / (norm_query * norm_document)
+        return {word: 1 for word in query.frequencies if word in self.index}
+
+    def __cosine_similarities(self, query):
+        """Score only the documents sharing at least one term with the query
+
+        Args:
+            query: Sparse query vector
+
+        Returns: Dict with doc ids and cosine similarities
+        """
+        norm_query = math.sqrt(sum(weight**2 for weight in query.values()))
+        if norm_query == 0:
+            return {}
+        dot_products = {}
+        for word, query_weight in query.items():
+            postings = self.index.get(word)
+            if postings is None or query_weight == 0:
+                continue
+            for doc_id, weight in zip(postings.doc_ids, postings.weights):
+                dot_products[doc_id] = dot_products.get(doc_id, 0.0) + (
+                    query_weight * weight
+                )
+        similarities = {}
+        for doc_id, dot_product in dot_products.items():
+            norm_document = self.documents_norms[doc_id - 1]
+            if norm_document != 0:
+                similarities[doc_id] = dot_product / (norm_query * norm_document)
+        return similarities
 
     def find(self, query):
-        query_vector = self.__vectorize_query(query)
-        for doc_id, document_vector in enumerate(self.documents_vectors, start=1):
-            similarity = self.__cosine_similarity(query_vector, document_vector)
+        similarities = self.__cosine_similarities(self.__vectorize_query(query))
+        for doc_id in sorted(similarities):
+            similarity = similarities[doc_id]
             if similarity > 0:
                 yield doc_id, similarity
 
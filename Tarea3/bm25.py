@@ -0,0 +1,224 @@
+# bm25.py
+# Description: Okapi BM25 and BM25+ ranking over an inverted index of raw
+# term frequencies. Document length normalization is precomputed for the
+# chosen k1 and b, and search prunes posting lists with MaxScore.
+
+import math
+import os
+from array import array
+
+from recuperacion.instrumentation import NO_METRICS
+from recuperacion.paths import DATASET, DOCUMENTS, QUERIES, RESULT
+
+from .evaluation import (
+    CUTOFFS,
+    RESULT_DEPTH,
+    Qrels,
+    evaluate_rankings,
+    format_trec_eval,
+)
+from .practica3 import Document, Postings, TestIR, load_frequencies, max_score
+
+
+class BM25IRSystem:
+    """BM25 retrieval system, BM25+ when delta is greater than zero
+
+    A document d scores, for every query term t it contains,
+    idf(t) * (tf * (k1 + 1) / (tf + k1 * (1 - b + b * |d| / avgdl)) + delta)
+
+    Attributes:
+        documents_frequencies: List of DocumentFrequency
+        vocabulary: Dict with words and document frequencies
+        idf: Dict with words and BM25 inverse document frequencies
+        index: Dict with words and Postings whose weights hold the raw tf
+        documents_lengths: Number of words of each document
+        average_length: Mean of documents_lengths
+        k1: Term frequency saturation
+        b: Strength of the document length normalization
+        delta: Lower bound of the contribution of a matching term (BM25+)
+        generation: Counter increased whenever the parameters change
+        metrics: Metrics collecting stage timings and counters, disabled
+            unless a Metrics instance is assigned
+    """
+
+    metrics = NO_METRICS
+
+    def __init__(self, documents_frequencies, k1=1.2, b=0.75, delta=0.0) -> None:
+        """Contructor
+
+        Args:
+            documents_frequencies: List of DocumentFrequency
+            k1: Term frequency saturation, usually between 1.2 and 2
+            b: Document length normalization, between 0 and 1
+            delta: BM25+ lower bound, 0 gives plain BM25
+        """
+        self.documents_frequencies = documents_frequencies
+        self.vocabulary = {}
+        self.index = {}
+        self.documents_lengths = array("d")
+        for doc_id, doc_freq in enumerate(documents_frequencies, start=1):
+            for word, frequency in doc_freq.frequencies.items():
+                self.vocabulary[word] = self.vocabulary.get(word, 0) + 1
+                self.index.setdefault(word, Postings()).append(doc_id, frequency)
+            self.documents_lengths.append(sum(doc_freq.frequencies.values()))
+        self.average_length = sum(self.documents_lengths) / max(
+            len(self.documents_lengths), 1
+        )
+        self.idf = self.__get_idf()
+        self.generation = 0
+        self.set_parameters(k1, b, delta)
+
+    def __get_idf(self):
+        # The + 1 keeps the idf of terms in most documents positive
+        num_doc = len(self.documents_frequencies)
+        return {
+            word: math.log(1 + (num_doc - frequency + 0.5) / (frequency + 0.5))
+            for word, frequency in self.vocabulary.items()
+        }
+
+    def set_parameters(self, k1=1.2, b=0.75, delta=0.0):
+        """Change k1, b and delta, recomputing the length norms and bounds
+
+        Args:
+            k1: Term frequency saturation
+            b: Document length normalization
+            delta: BM25+ lower bound
+        """
+        self.k1 = k1
+        self.b = b
+        self.delta = delta
+        average_length = self.average_length or 1.0
+        # Denominator term of each document, k1 * (1 - b + b * |d| / avgdl)
+        self.__length_norms = array(
+            "d",
+            (
+                k1 * (1 - b + b * length / average_length)
+                for length in self.documents_lengths
+            ),
+        )
+        self.__bounds = self.__get_bounds()
+        self.generation += 1
+
+    def __term_score(self, tf, doc_id):
+        return tf * (self.k1 + 1) / (tf + self.__length_norms[doc_id - 1]) + self.delta
+
+    def __get_bounds(self):
+        """(min, max) of the idf weighted score of each term over its postings"""
+        bounds = {}
+        for word, postings in self.index.items():
+            scores = [
+                self.__term_score(tf, doc_id)
+                for doc_id, tf in zip(postings.doc_ids, postings.weights)
+            ]
+            idf = self.idf[word]
+            bounds[word] = (
+                idf * min(scores, default=0.0),
+                idf * max(scores, default=0.0),
+            )
+        return bounds
+
+    def __vectorize_query(self, query: Document):
+        return {word: 1 for word in query.frequencies if word in self.index}
+
+    def __scores(self, query):
+        scores = {}
+        for word, query_weight in query.items():
+            postings = self.index.get(word)
+            if postings is None or query_weight == 0:
+                continue
+            self.metrics.count("postings", len(postings.doc_ids))
+            weight = query_weight * self.idf[word]
+            for doc_id, tf in zip(postings.doc_ids, postings.weights):
+                scores[doc_id] = scores.get(doc_id, 0.0) + weight * self.__term_score(
+                    tf, doc_id
+                )
+        self.metrics.count("documents_scored", len(scores))
+        return scores
+
+    def find(self, query, vector=False):
+        metrics = self.metrics
+        metrics.count("queries")
+        with metrics.profile():
+            with metrics.stage("vectorize"):
+                if not vector:
+                    query = self.__vectorize_query(query)
+            with metrics.stage("score"):
+                scores = self.__scores(query)
+        for doc_id in sorted(scores):
+            score = scores[doc_id]
+            if score > 0:
+                yield doc_id, score
+
+    def search(self, query, k=10, vector=False):
+        """Retrieve the k highest scoring documents with MaxScore pruning
+
+        Args:
+            query: Document, or sparse query vector if vector is True
+            k: Number of documents to retrieve
+            vector: Whether query is already vectorized
+
+        Returns: List of (doc_id, score) sorted by decreasing score
+        """
+        metrics = self.metrics
+        metrics.count("queries")
+        with metrics.profile():
+            with metrics.stage("vectorize"):
+                if not vector:
+                    query = self.__vectorize_query(query)
+            if k <= 0:
+                return []
+            with metrics.stage("score"):
+                heap = self.__max_score(query, k)
+            with metrics.stage("select"):
+                return [
+                    (-doc_id, score) for score, doc_id in sorted(heap, reverse=True)
+                ]
+
+    def __max_score(self, query, k):
+        """MaxScore traversal of the query posting lists
+
+        Returns: Heap with the (score, -doc_id) of the top k
+        """
+        terms = []
+        for word, query_weight in query.items():
+            if word not in self.index or query_weight == 0:
+                continue
+            low, high = self.__bounds[word]
+            upper_bound = max(query_weight * low, query_weight * high, 0.0)
+            terms.append((upper_bound, query_weight * self.idf[word], self.index[word]))
+        return max_score(terms, k, self.__posting_score, self.metrics)
+
+    def __posting_score(self, weight, tf, doc_id):
+        return weight * self.__term_score(tf, doc_id)
+
+    def find_batch(self, queries, k=10, vector=False):
+        """Retrieve the top k documents of every query
+
+        Args:
+            queries: List of Document, or of sparse query vectors if vector
+            k: Number of documents to retrieve per query
+            vector: Whether queries are already vectorized
+
+        Returns: List with the (doc_id, score) ranking of each query
+        """
+        return [self.search(query, k, vector) for query in queries]
+
+
+if __name__ == "__main__":
+    test = TestIR(DATASET + ".REL")
+    queries_frequencies = load_frequencies(QUERIES, True)
+    ir_system = BM25IRSystem(load_frequencies(DOCUMENTS))
+    rankings = ir_system.find_batch(queries_frequencies, max(CUTOFFS))
+    with open(os.path.join(RESULT, "retrieved_documents-BM25.REL"), "w") as output_file:
+        for qu_id, retrieved_documents_score in enumerate(rankings, start=1):
+            output_line = f"Q{qu_id} "
+            for doc_id, score in retrieved_documents_score[:RESULT_DEPTH]:
+                output_line += f"D{doc_id} {score} "
+            retrieved_documents = [
+                d for d, _ in retrieved_documents_score[:RESULT_DEPTH]
+            ]
+            precision, recall, f_measure, ap = test.evaluate(qu_id, retrieved_documents)
+            output_line += f"P{precision} R{recall} F{f_measure} AP{ap}\n"
+            print(output_line)
+            output_file.write(output_line)
+    print(format_trec_eval(evaluate_rankings(Qrels.load(DATASET + ".REL"), rankings)))
@@ -0,0 +1,472 @@
+# compressed.py
+# Description: TF-IDF index with compressed posting lists. Postings are cut
+# into blocks of delta-encoded doc ids and raw term frequencies, both
+# variable-byte encoded, with the last doc id of every block kept as a skip
+# pointer. Saved indexes are memory-mapped and only the blocks a query needs
+# are decoded, so the postings can be much larger than RAM.
+
+import math
+import os
+
+import numpy as np
+
+from recuperacion.instrumentation import NO_METRICS
+from recuperacion.paths import DATASET, DOCUMENTS, QUERIES
+
+from .evaluation import (
+    CUTOFFS,
+    RESULT_DEPTH,
+    Qrels,
+    evaluate_rankings,
+    format_trec_eval,
+)
+from .practica3 import (
+    Document,
+    TestIR,
+    load_frequencies,
+    top_k_documents,
+)
+from .storage import pack_strings, read_arrays, unpack_strings, write_arrays
+
+COMPRESSED_VERSION = 1
+BLOCK_SIZE = 128
+
+
+def encode_varbyte(values) -> np.ndarray:
+    """Variable-byte encode non-negative integers
+
+    Each value is written 7 bits at a time, lowest bits first, and the high
+    bit marks the last byte of a value.
+
+    Args:
+        values: Sequence of non-negative integers
+
+    Returns: uint8 array
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    lengths = np.ones(len(values), dtype=np.int64)
+    for shift in range(7, 64, 7):
+        longer = values >= np.uint64(1 << shift)
+        if not longer.any():
+            break
+        lengths += longer
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1])).astype(np.int64)
+    encoded = np.empty(int(lengths.sum()), dtype=np.uint8)
+    for position in range(int(lengths.max(initial=0))):
+        mask = lengths > position
+        encoded[starts[mask] + position] = (
+            values[mask] >> np.uint64(7 * position)
+        ) & np.uint64(0x7F)
+    encoded[starts + lengths - 1] |= 0x80
+    return encoded
+
+
+def decode_varbyte(encoded) -> np.ndarray:
+    """Inverse of encode_varbyte
+
+    Args:
+        encoded: uint8 array
+
+    Returns: int64 array
+    """
+    encoded = np.asarray(encoded, dtype=np.uint8)
+    if len(encoded) == 0:
+        return np.empty(0, dtype=np.int64)
+    ends = np.flatnonzero(encoded & 0x80)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    shifts = 7 * (np.arange(len(encoded)) - np.repeat(starts, ends - starts + 1))
+    return np.add.reduceat((encoded & 0x7F).astype(np.int64) << shifts, starts)
+
+
+def merge_scores(doc_ids, scores, new_ids, new_scores):
+    """Sum two sparse score vectors in linear time
+
+    Args:
+        doc_ids: Sorted unique doc ids of the first vector
+        scores: Scores of doc_ids
+        new_ids: Sorted unique doc ids of the second vector
+        new_scores: Scores of new_ids
+
+    Returns: Sorted unique doc ids of both vectors and their summed scores
+    """
+    positions = np.searchsorted(doc_ids, new_ids)
+    found = positions < len(doc_ids)
+    found[found] = doc_ids[positions[found]] == new_ids[found]
+    scores = scores.copy()
+    scores[positions[found]] += new_scores[found]
+    missing = ~found
+    return (
+        np.insert(doc_ids, positions[missing], new_ids[missing]),
+        np.insert(scores, positions[missing], new_scores[missing]),
+    )
+
+
+class CompressedIndex:
+    """TF-IDF cosine retrieval over block-compressed posting lists
+
+    Uses the same weighting as IRSystem2. The postings of term row r are the
+    blocks term_blocks[r] to term_blocks[r + 1]; block b holds the gaps
+    between its doc ids (the first relative to the last doc id of the
+    previous block of the term) followed by their term frequencies, all
+    variable-byte encoded in data[block_offsets[b]:block_offsets[b + 1]].
+
+    Attributes:
+        words: Dict with words and their row
+        document_frequencies: Number of documents of each row
+        idf: Inverse document frequency of each row
+        bounds: (min, max) normalized weight of the postings of each row
+        term_blocks: First block of each row, plus the number of blocks
+        block_last: Last doc id of each block, the skip pointers
+        block_offsets: Start of each block in data, plus the data length
+        data: uint8 array with the encoded blocks
+        block_size: Postings per block, only the last block of a term may
+            hold fewer
+        documents_sizes: Number of words of each document
+        documents_norms: Euclidean norm of each document vector
+        inverse_norms: 1 / documents_norms, 0 for empty documents
+        metrics: Metrics collecting stage timings and counters, disabled
+            unless a Metrics instance is assigned
+    """
+
+    metrics = NO_METRICS
+
+    def __init__(self, documents_frequencies, block_size=BLOCK_SIZE) -> None:
+        """Contructor
+
+        Args:
+            documents_frequencies: List of DocumentFrequency
+            block_size: Postings per block
+        """
+        self.block_size = block_size
+        vocabulary = {}
+        postings = {}
+        sizes = []
+        norms = []
+        for doc_freq in documents_frequencies:
+            for word in doc_freq.frequencies:
+                vocabulary[word] = vocabulary.get(word, 0) + 1
+        num_doc = len(documents_frequencies)
+        idf = {
+            word: math.log(num_doc / (1 + frecuency))
+            for word, frecuency in vocabulary.items()
+        }
+        for doc_id, doc_freq in enumerate(documents_frequencies, start=1):
+            size_document = sum(doc_freq.frequencies.values())
+            norm = 0.0
+            for word, frecuency in doc_freq.frequencies.items():
+                postings.setdefault(word, ([], []))
+                postings[word][0].append(doc_id)
+                postings[word][1].append(frecuency)
+                norm += (frecuency / size_document * idf[word]) ** 2
+            sizes.append(size_document)
+            norms.append(math.sqrt(norm))
+        self.words = {word: row for row, word in enumerate(vocabulary)}
+        self.document_frequencies = np.fromiter(vocabulary.values(), dtype=np.int32)
+        self.idf = np.fromiter(idf.values(), dtype=np.float64)
+        self.documents_sizes = np.array(sizes, dtype=np.int64)
+        self.documents_norms = np.array(norms, dtype=np.float64)
+        self.inverse_norms = self.__inverse_norms()
+        term_blocks = [0]
+        block_last = []
+        block_offsets = [0]
+        chunks = []
+        bounds = np.zeros((len(vocabulary), 2))
+        for row, word in enumerate(vocabulary):
+            doc_ids = np.array(postings[word][0], dtype=np.int64)
+            frequencies = np.array(postings[word][1], dtype=np.int64)
+            norms = self.documents_norms[doc_ids - 1]
+            normalized = self.__weights(row, doc_ids, frequencies)[norms != 0] / (
+                norms[norms != 0]
+            )
+            if len(normalized):
+                bounds[row] = normalized.min(), normalized.max()
+            previous = 0
+            for start in range(0, len(doc_ids), block_size):
+                block_ids = doc_ids[start : start + block_size]
+                gaps = np.diff(block_ids, prepend=previous)
+                chunk = encode_varbyte(
+                    np.concatenate((gaps, frequencies[start : start + block_size]))
+                )
+                chunks.append(chunk)
+                block_offsets.append(block_offsets[-1] + len(chunk))
+                block_last.append(block_ids[-1])
+                previous = block_ids[-1]
+            term_blocks.append(len(block_last))
+        self.bounds = bounds
+        self.term_blocks = np.array(term_blocks, dtype=np.int64)
+        self.block_last = np.array(block_last, dtype=np.int32)
+        self.block_offsets = np.array(block_offsets, dtype=np.int64)
+        self.data = np.concatenate(chunks) if chunks else np.empty(0, dtype=np.uint8)
+
+    def __weights(self, row, doc_ids, frequencies):
+        # Same operations as IRSystem2: frecuency / size_document * idf
+        return frequencies / self.documents_sizes[doc_ids - 1] * self.idf[row]
+
+    def __decode_block(self, block, previous):
+        """Doc ids and term frequencies of a block
+
+        Args:
+            block: Block number
+            previous: Last doc id of the previous block of the term, or 0
+        """
+        values = decode_varbyte(
+            self.data[self.block_offsets[block] : self.block_offsets[block + 1]]
+        )
+        size = len(values) // 2
+        return previous + np.cumsum(values[:size]), values[size:]
+
+    def __previous(self, row, block):
+        return int(self.block_last[block - 1]) if block > self.term_blocks[row] else 0
+
+    def postings(self, word: str):
+        """Decode the whole posting list of a word
+
+        Returns: int64 array of doc ids and float64 array of tf-idf weights
+        """
+        return self.__decode_postings(self.words[word])
+
+    def __decode_postings(self, row):
+        # The blocks of a term are contiguous, so they are decoded at once
+        first, last = self.term_blocks[row], self.term_blocks[row + 1]
+        values = decode_varbyte(
+            self.data[self.block_offsets[first] : self.block_offsets[last]]
+        )
+        positions = np.arange(len(values) // 2)
+        blocks, offsets = np.divmod(positions, self.block_size)
+        sizes = np.minimum(self.block_size, len(positions) - blocks * self.block_size)
+        gaps = 2 * self.block_size * blocks + offsets
+        # Gaps chain across blocks, so one cumsum restores every doc id
+        doc_ids = np.cumsum(values[gaps])
+        frequencies = values[gaps + sizes]
+        self.metrics.count("blocks", int(last - first))
+        self.metrics.count("postings", len(doc_ids))
+        return doc_ids, self.__weights(row, doc_ids, frequencies)
+
+    def __probe(self, row, doc_ids):
+        """tf-idf weights of a term in the given sorted doc ids, 0 if absent
+
+        Only the blocks whose skip pointers cover some doc id are decoded.
+        """
+        first, last = self.term_blocks[row], self.term_blocks[row + 1]
+        blocks = first + np.searchsorted(self.block_last[first:last], doc_ids)
+        weights = np.zeros(len(doc_ids))
+        inside = blocks < last
+        for block in np.unique(blocks[inside]):
+            block_ids, frequencies = self.__decode_block(
+                block, self.__previous(row, block)
+            )
+            self.metrics.count("blocks")
+            self.metrics.count("postings", len(block_ids))
+            positions = np.flatnonzero(blocks == block)
+            matches = np.searchsorted(block_ids, doc_ids[positions])
+            found = block_ids[np.minimum(matches, len(block_ids) - 1)] == (
+                doc_ids[positions]
+            )
+            weights[positions[found]] = self.__weights(
+                row, block_ids[matches[found]], frequencies[matches[found]]
+            )
+        return weights
+
+    def __vectorize_query(self, query: Document):
+        return {word: 1 for word in query.frequencies if word in self.words}
+
+    def __query_terms(self, query):
+        terms = []
+        for word, query_weight in query.items():
+            row = self.words.get(word)
+            if row is not None and query_weight != 0:
+                low, high = self.bounds[row]
+                terms.append(
+                    (
+                        max(query_weight * low, query_weight * high, 0.0),
+                        min(query_weight * low, query_weight * high, 0.0),
+                        query_weight,
+                        row,
+                    )
+                )
+        return terms
+
+    def __inverse_norms(self):
+        return np.divide(
+            1.0,
+            self.documents_norms,
+            out=np.zeros(len(self.documents_norms)),
+            where=self.documents_norms != 0,
+        )
+
+    def find(self, query, vector=False):
+        if not vector:
+            query = self.__vectorize_query(query)
+        norm_query = math.sqrt(sum(weight**2 for weight in query.values()))
+        if norm_query == 0:
+            return
+        doc_ids = [np.empty(0, dtype=np.int64)]
+        scores = [np.empty(0)]
+        for _, _, query_weight, row in self.__query_terms(query):
+            term_ids, weights = self.__decode_postings(row)
+            doc_ids.append(term_ids)
+            scores.append(query_weight * weights)
+        doc_ids, inverse = np.unique(np.concatenate(doc_ids), return_inverse=True)
+        dot_products = np.bincount(
+            inverse, weights=np.concatenate(scores), minlength=len(doc_ids)
+        )
+        similarities = dot_products * self.inverse_norms[doc_ids - 1] / norm_query
+        positive = similarities > 0
+        yield from zip(doc_ids[positive].tolist(), similarities[positive].tolist())
+
+    def search(self, query, k=10, vector=False):
+        """Retrieve the k most similar documents
+
+        Terms are scored in decreasing order of their upper bound. Once the
+        remaining terms cannot lift an unseen document into the top k, they
+        are only probed for the surviving candidates, decoding just the
+        blocks that contain them. Scores are only kept for the doc ids decoded
+        so far, so a query costs no work or memory per document of the
+        collection.
+
+        Args:
+            query: Document, or sparse query vector if vector is True
+            k: Number of documents to retrieve
+            vector: Whether query is already vectorized
+
+        Returns: List of (doc_id, similarity) sorted by decreasing similarity
+        """
+        metrics = self.metrics
+        metrics.count("queries")
+        with metrics.profile():
+            with metrics.stage("vectorize"):
+                if not vector:
+                    query = self.__vectorize_query(query)
+                norm_query = math.sqrt(sum(weight**2 for weight in query.values()))
+            if norm_query == 0 or k <= 0:
+                return []
+            with metrics.stage("score"):
+                doc_ids, similarities = self.__pruned_similarities(query, k)
+            with metrics.stage("select"):
+                # doc_ids is sorted, so ties still go to the lowest doc id
+                return [
+                    (int(doc_ids[position - 1]), similarity)
+                    for position, similarity in top_k_documents(
+                        similarities / norm_query, k
+                    )
+                ]
+
+    def __pruned_similarities(self, query, k):
+        terms = sorted(self.__query_terms(query), key=lambda term: -term[0])
+        # Bounds of the contribution of the terms after each position
+        upper_rest = np.cumsum([term[0] for term in terms][::-1])[::-1].tolist()
+        lower_rest = np.cumsum([term[1] for term in terms][::-1])[::-1].tolist()
+        upper_rest.append(0.0)
+        lower_rest.append(0.0)
+        # Sorted doc ids seen so far, or the surviving candidates once pruned
+        doc_ids = np.empty(0, dtype=np.int64)
+        dot_products = np.empty(0)
+        pruned = False
+        for position, (_, _, query_weight, row) in enumerate(terms):
+            if pruned:
+                dot_products += query_weight * self.__probe(row, doc_ids)
+                continue
+            term_ids, weights = self.__decode_postings(row)
+            doc_ids, dot_products = merge_scores(
+                doc_ids, dot_products, term_ids, query_weight * weights
+            )
+            if len(doc_ids) < k:
+                continue
+            partial = dot_products * self.inverse_norms[doc_ids - 1]
+            lowest = partial + lower_rest[position + 1]
+            kth = -np.partition(-lowest, k - 1)[k - 1]
+            # Unseen documents score at most upper_rest
+            if upper_rest[position + 1] < kth:
+                candidates = partial + upper_rest[position + 1] >= kth
+                doc_ids, dot_products = doc_ids[candidates], dot_products[candidates]
+                pruned = True
+        return doc_ids, dot_products * self.inverse_norms[doc_ids - 1]
+
+    def find_batch(self, queries, k=10, vector=False):
+        """Retrieve the top k documents of every query
+
+        Args:
+            queries: List of Document, or of sparse query vectors if vector
+            k: Number of documents to retrieve per query
+            vector: Whether queries are already vectorized
+
+        Returns: List with the (doc_id, similarity) ranking of each query
+        """
+        return [self.search(query, k, vector) for query in queries]
+
+    def save(self, path: str):
+        """Write the index to a versioned binary file
+
+        Args:
+            path: Output file
+        """
+        write_arrays(
+            path,
+            "CompressedIndex",
+            COMPRESSED_VERSION,
+            {
+                "words": pack_strings(self.words),
+                "document_frequencies": self.document_frequencies,
+                "idf": self.idf,
+                "bounds": self.bounds,
+                "term_blocks": self.term_blocks,
+                "block_last": self.block_last,
+                "block_offsets": self.block_offsets,
+                "data": self.data,
+                "documents_sizes": self.documents_sizes,
+                "documents_norms": self.documents_norms,
+            },
+            {"block_size": self.block_size},
+        )
+
+    @classmethod
+    def load(cls, path: str):
+        """Load an index written by save, memory-mapping its blocks
+
+        Args:
+            path: Input file
+
+        Returns: CompressedIndex
+        """
+        metadata, arrays = read_arrays(path, "CompressedIndex", COMPRESSED_VERSION)
+        index = cls.__new__(cls)
+        index.block_size = metadata["block_size"]
+        index.words = {
+            word: row for row, word in enumerate(unpack_strings(arrays["words"]))
+        }
+        index.document_frequencies = arrays["document_frequencies"]
+        index.idf = np.asarray(arrays["idf"])
+        index.bounds = np.asarray(arrays["bounds"])
+        index.term_blocks = np.asarray(arrays["term_blocks"])
+        index.block_last = arrays["block_last"]
+        index.block_offsets = arrays["block_offsets"]
+        index.data = arrays["data"]
+        index.documents_sizes = np.asarray(arrays["documents_sizes"])
+        index.documents_norms = np.asarray(arrays["documents_norms"])
+        index.inverse_norms = index.__inverse_norms()
+        return index
+
+
+if __name__ == "__main__":
+    test = TestIR(DATASET + ".REL")
+    queries_frequencies = load_frequencies(QUERIES, True)
+    documents_name = DOCUMENTS
+    index_path = documents_name + ".cidx"
+    if os.path.exists(index_path) and os.path.getmtime(index_path) >= os.path.getmtime(
+        documents_name + ".FRQ"
+    ):
+        ir_system = CompressedIndex.load(index_path)
+    else:
+        ir_system = CompressedIndex(load_frequencies(documents_name))
+        ir_system.save(index_path)
+    print(
+        f"{len(ir_system.data)} bytes of postings in {len(ir_system.block_last)} blocks"
+    )
+    rankings = ir_system.find_batch(queries_frequencies, max(CUTOFFS))
+    for qu_id, retrieved_documents_similarity in enumerate(rankings, start=1):
+        retrieved_documents = [
+            d for d, _ in retrieved_documents_similarity[:RESULT_DEPTH]
+        ]
+        precision, recall, f_measure, ap = test.evaluate(qu_id, retrieved_documents)
+        print(f"Q{qu_id} P{precision} R{recall} F{f_measure} AP{ap}")
+    print(format_trec_eval(evaluate_rankings(Qrels.load(DATASET + ".REL"), rankings)))
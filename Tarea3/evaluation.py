@@ -0,0 +1,188 @@
+# evaluation.py
+# Description: Batched evaluation of rankings against relevance judgments.
+# Every query of a run is scored at once over a boolean query x document
+# relevance matrix, with the measures and output layout of trec_eval.
+
+import sys
+
+import numpy as np
+
+CUTOFFS = (5, 10, 15, 20, 30, 100)
+# Documents per query the drivers write and score with TestIR, while their
+# trec_eval summaries rank to max(CUTOFFS)
+RESULT_DEPTH = 10
+
+
+class Qrels:
+    """Binary relevance judgments
+
+    Attributes:
+        query_ids: Sorted list of judged query ids
+        rows: Dict with query ids and their row in matrix
+        matrix: Boolean matrix, matrix[row, doc_id] is True if relevant
+        num_relevant: Number of relevant documents of each row
+    """
+
+    def __init__(self, relevant_documents_per_query: dict[int, list[int]]) -> None:
+        self.query_ids = sorted(relevant_documents_per_query)
+        self.rows = {query_id: row for row, query_id in enumerate(self.query_ids)}
+        max_doc = max(
+            (max(docs, default=0) for docs in relevant_documents_per_query.values()),
+            default=0,
+        )
+        self.matrix = np.zeros((len(self.query_ids), max_doc + 1), dtype=bool)
+        for query_id, docs in relevant_documents_per_query.items():
+            self.matrix[self.rows[query_id], list(docs)] = True
+        # Doc id 0 pads short rankings and is never relevant
+        self.matrix[:, 0] = False
+        self.num_relevant = self.matrix.sum(axis=1)
+
+    @classmethod
+    def load(cls, qrels_file: str):
+        """Load a .REL file with lines "query_id doc_id doc_id ..."
+
+        Args:
+            qrels_file: Path of the judgments file
+
+        Returns: Qrels
+        """
+        data = {}
+        with open(qrels_file, "r") as file:
+            for line in file:
+                words = line.split()
+                if words:
+                    data[int(words[0])] = [int(x) for x in words[1:]]
+        return cls(data)
+
+
+def load_run(run_file: str) -> dict[int, list[int]]:
+    """Load the rankings of a run file
+
+    Reads both the drivers output ("Q1 D308 0.36 D257 0.33 ... P0.7 R1.0 ...")
+    and TREC run files ("1 Q0 308 1 0.36 tag"). Like trec_eval, the ranks
+    of a TREC run are ignored: documents are sorted by decreasing score,
+    ties by decreasing docno.
+
+    Args:
+        run_file: Path of the run
+
+    Returns: Dict with query ids and ranked doc ids
+    """
+    run = {}
+    scored = {}
+    with open(run_file, "r") as file:
+        for line in file:
+            words = line.split()
+            if not words:
+                continue
+            if len(words) >= 5 and words[1] == "Q0":
+                scored.setdefault(int(words[0]), []).append((float(words[4]), words[2]))
+                continue
+            query_id = int(words[0].lstrip("Q"))
+            run[query_id] = [
+                int(word[1:])
+                for word in words[1::2]
+                if word.startswith("D") and word[1:].isdigit()
+            ]
+    for query_id, documents in scored.items():
+        run[query_id] = [int(docno) for _, docno in sorted(documents, reverse=True)]
+    return run
+
+
+def evaluate(qrels: Qrels, run: dict[int, list[int]], cutoffs=CUTOFFS) -> dict:
+    """Score every query of a run in one pass
+
+    Queries without judgments are ignored and, like trec_eval, the averages
+    are taken over the judged queries present in the run.
+
+    Args:
+        qrels: Relevance judgments
+        run: Dict with query ids and ranked doc ids
+        cutoffs: Ranks used for P@k and nDCG@k
+
+    Returns: Dict with "query_ids" and one array per measure
+    """
+    query_ids = [query_id for query_id in sorted(run) if query_id in qrels.rows]
+    depth = max([len(run[query_id]) for query_id in query_ids] + list(cutoffs) + [1])
+    ranks = np.zeros((len(query_ids), depth), dtype=np.int64)
+    for position, query_id in enumerate(query_ids):
+        ranks[position, : len(run[query_id])] = run[query_id]
+    # Documents never judged relevant fall outside the matrix
+    ranks[ranks >= qrels.matrix.shape[1]] = 0
+    rows = np.array([qrels.rows[query_id] for query_id in query_ids], dtype=np.int64)
+    relevant = qrels.matrix[rows[:, None], ranks]
+    num_relevant = qrels.num_relevant[rows]
+    retrieved = np.array([len(run[query_id]) for query_id in query_ids])
+    hits = np.cumsum(relevant, axis=1)
+    positions = np.arange(1, depth + 1)
+    discounts = 1 / np.log2(positions + 1)
+    # The ideal ranking holds every relevant document, even past depth
+    ideal_depth = max(depth, int(qrels.num_relevant[rows].max(initial=0)))
+    ideal = np.cumsum(1 / np.log2(np.arange(2, ideal_depth + 2)))
+    safe_relevant = np.maximum(num_relevant, 1)
+
+    results = {
+        "query_ids": query_ids,
+        "num_ret": retrieved,
+        "num_rel": num_relevant,
+        "num_rel_ret": hits[:, -1],
+        "map": (relevant * hits / positions).sum(axis=1) / safe_relevant,
+    }
+    first = np.argmax(relevant, axis=1)
+    results["recip_rank"] = np.where(relevant.any(axis=1), 1 / (first + 1), 0.0)
+    r_cut = np.clip(num_relevant, 1, depth) - 1
+    results["Rprec"] = hits[np.arange(len(query_ids)), r_cut] / safe_relevant
+    gains = relevant * discounts
+    results["ndcg"] = gains.sum(axis=1) / ideal[np.maximum(num_relevant, 1) - 1]
+    for k in cutoffs:
+        results[f"P_{k}"] = hits[:, k - 1] / k
+    for k in cutoffs:
+        ideal_k = ideal[np.clip(np.minimum(num_relevant, k), 1, None) - 1]
+        results[f"ndcg_cut_{k}"] = gains[:, :k].sum(axis=1) / ideal_k
+    for measure, values in results.items():
+        if measure != "query_ids":
+            results[measure] = np.where(num_relevant > 0, values, 0)
+    return results
+
+
+def evaluate_rankings(qrels: Qrels, rankings, cutoffs=CUTOFFS) -> dict:
+    """Evaluate find_batch output, whose i-th ranking belongs to query i + 1"""
+    run = {
+        query_id: [doc_id for doc_id, _ in ranking]
+        for query_id, ranking in enumerate(rankings, start=1)
+    }
+    return evaluate(qrels, run, cutoffs)
+
+
+def format_trec_eval(results: dict, per_query=False) -> str:
+    """Format results as trec_eval does: measure, query id (or all), value"""
+    lines = []
+    counts = ("num_ret", "num_rel", "num_rel_ret")
+    measures = [measure for measure in results if measure != "query_ids"]
+    if per_query:
+        for position, query_id in enumerate(results["query_ids"]):
+            for measure in measures:
+                value = results[measure][position]
+                value = f"{int(value)}" if measure in counts else f"{value:.4f}"
+                lines.append(f"{measure:<22}\t{query_id}\t{value}")
+    lines.append(f"{'num_q':<22}\tall\t{len(results['query_ids'])}")
+    for measure in measures:
+        values = results[measure]
+        if measure in counts:
+            lines.append(f"{measure:<22}\tall\t{int(values.sum())}")
+        else:
+            mean = values.mean() if len(values) else 0.0
+            lines.append(f"{measure:<22}\tall\t{mean:.4f}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    # python -m Tarea3.evaluation [-q] qrels_file run_file
+    arguments = sys.argv[1:]
+    per_query = "-q" in arguments
+    qrels_file, run_file = [argument for argument in arguments if argument != "-q"]
+    print(
+        format_trec_eval(
+            evaluate(Qrels.load(qrels_file), load_run(run_file)), per_query
+        )
+    )
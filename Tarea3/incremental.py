@@ -0,0 +1,226 @@
+# incremental.py
+# Description: TF-IDF index that accepts new and deleted documents without a
+# rebuild. Postings store raw tf, so idf (and the document norms that depend
+# on it) are applied at query time from the live document frequencies.
+
+import heapq
+import math
+from dataclasses import dataclass, field
+
+from .practica3 import Document, Postings
+
+
+@dataclass
+class Segment:
+    """Immutable group of documents indexed together
+
+    Attributes:
+        postings: Dict with words and Postings whose weights hold the tf
+        terms: Dict with the doc ids of the segment and their words
+    """
+
+    postings: dict[str, Postings] = field(default_factory=dict)
+    terms: dict[int, tuple[str, ...]] = field(default_factory=dict)
+
+
+class IncrementalIndex:
+    """Segmented TF-IDF index with add_documents and delete_documents
+
+    Every add_documents call writes a new segment; when merge_factor segments
+    of the same size level accumulate at the tail they are merged into one,
+    dropping deleted documents, so the number of segments stays logarithmic.
+
+    Attributes:
+        segments: List of Segment, oldest first
+        vocabulary: Dict with words and document frequencies of live documents
+        deleted: Doc ids deleted but still present in some segment
+        merge_factor: Segments of one level merged together
+        num_documents: Number of live documents
+        generation: Counter increased on every change of the index
+    """
+
+    def __init__(self, documents_frequencies=(), merge_factor=10) -> None:
+        self.segments = []
+        self.vocabulary = {}
+        self.deleted = set()
+        self.merge_factor = merge_factor
+        self.num_documents = 0
+        self.generation = 0
+        self.__next_doc_id = 1
+        self.__norms = {}
+        self.__norms_generation = -1
+        if documents_frequencies:
+            self.add_documents(documents_frequencies)
+
+    def add_documents(self, documents_frequencies) -> list[int]:
+        """Index new documents in a new segment
+
+        Args:
+            documents_frequencies: List of DocumentFrequency
+
+        Returns: Doc ids assigned to the documents
+        """
+        segment = Segment()
+        doc_ids = []
+        for doc_freq in documents_frequencies:
+            doc_id = self.__next_doc_id
+            self.__next_doc_id += 1
+            size_document = sum(doc_freq.frequencies.values())
+            for word, frecuency in doc_freq.frequencies.items():
+                postings = segment.postings.setdefault(word, Postings())
+                postings.append(doc_id, frecuency / size_document)
+                self.vocabulary[word] = self.vocabulary.get(word, 0) + 1
+            segment.terms[doc_id] = tuple(doc_freq.frequencies)
+            doc_ids.append(doc_id)
+        if doc_ids:
+            self.segments.append(segment)
+            self.num_documents += len(doc_ids)
+            self.generation += 1
+            self.__maybe_merge()
+        return doc_ids
+
+    def delete_documents(self, doc_ids):
+        """Delete documents; their postings are purged on the next merge
+
+        Args:
+            doc_ids: Doc ids returned by add_documents
+        """
+        for doc_id in doc_ids:
+            if doc_id in self.deleted:
+                continue
+            for segment in self.segments:
+                terms = segment.terms.get(doc_id)
+                if terms is not None:
+                    break
+            else:
+                continue
+            for word in terms:
+                self.vocabulary[word] -= 1
+                if self.vocabulary[word] == 0:
+                    del self.vocabulary[word]
+            self.deleted.add(doc_id)
+            self.num_documents -= 1
+            self.generation += 1
+
+    def __level(self, segment):
+        size, level = len(segment.terms), 0
+        while size >= self.merge_factor:
+            size //= self.merge_factor
+            level += 1
+        return level
+
+    def __maybe_merge(self):
+        while len(self.segments) >= self.merge_factor:
+            tail = self.segments[-self.merge_factor :]
+            if len({self.__level(segment) for segment in tail}) != 1:
+                break
+            self.segments[-self.merge_factor :] = [self.__merge(tail)]
+
+    def __merge(self, segments):
+        merged = Segment()
+        for segment in segments:
+            for word, postings in segment.postings.items():
+                target = merged.postings.get(word)
+                for doc_id, tf in zip(postings.doc_ids, postings.weights):
+                    if doc_id in self.deleted:
+                        continue
+                    if target is None:
+                        target = merged.postings[word] = Postings()
+                    target.append(doc_id, tf)
+            for doc_id, terms in segment.terms.items():
+                if doc_id in self.deleted:
+                    self.deleted.discard(doc_id)
+                else:
+                    merged.terms[doc_id] = terms
+        return merged
+
+    def force_merge(self):
+        """Merge every segment into one, purging all deleted documents"""
+        if len(self.segments) > 1 or self.deleted:
+            merged = self.__merge(self.segments)
+            self.segments = [merged] if merged.terms else []
+
+    def idf(self, word: str) -> float:
+        return math.log(self.num_documents / (1 + self.vocabulary[word]))
+
+    def __documents_norms(self):
+        # Norms depend on every idf, so they are recomputed once per change
+        if self.__norms_generation != self.generation:
+            idf = {word: self.idf(word) for word in self.vocabulary}
+            norms = {}
+            for segment in self.segments:
+                for word, postings in segment.postings.items():
+                    if word not in idf:
+                        continue
+                    word_idf = idf[word]
+                    for doc_id, tf in zip(postings.doc_ids, postings.weights):
+                        norms[doc_id] = norms.get(doc_id, 0.0) + (tf * word_idf) ** 2
+            self.__norms = {
+                doc_id: math.sqrt(norm)
+                for doc_id, norm in norms.items()
+                if doc_id not in self.deleted
+            }
+            self.__norms_generation = self.generation
+        return self.__norms
+
+    def __cosine_similarities(self, query):
+        norm_query = math.sqrt(sum(weight**2 for weight in query.values()))
+        if norm_query == 0:
+            return {}
+        dot_products = {}
+        for word, query_weight in query.items():
+            if word not in self.vocabulary or query_weight == 0:
+                continue
+            weight = query_weight * self.idf(word)
+            for segment in self.segments:
+                postings = segment.postings.get(word)
+                if postings is None:
+                    continue
+                for doc_id, tf in zip(postings.doc_ids, postings.weights):
+                    if doc_id not in self.deleted:
+                        dot_products[doc_id] = dot_products.get(doc_id, 0.0) + (
+                            weight * tf
+                        )
+        norms = self.__documents_norms()
+        similarities = {}
+        for doc_id, dot_product in dot_products.items():
+            norm_document = norms[doc_id]
+            if norm_document != 0:
+                similarities[doc_id] = dot_product / (norm_query * norm_document)
+        return similarities
+
+    def __vectorize_query(self, query: Document):
+        return {word: 1 for word in query.frequencies if word in self.vocabulary}
+
+    def find(self, query, vector=False):
+        if not vector:
+            query = self.__vectorize_query(query)
+        similarities = self.__cosine_similarities(query)
+        for doc_id in sorted(similarities):
+            similarity = similarities[doc_id]
+            if similarity > 0:
+                yield doc_id, similarity
+
+    def search(self, query, k=10, vector=False):
+        """Retrieve the k most similar live documents
+
+        Args:
+            query: Document, or sparse query vector if vector is True
+            k: Number of documents to retrieve
+            vector: Whether query is already vectorized
+
+        Returns: List of (doc_id, similarity) sorted by decreasing similarity
+        """
+        return heapq.nlargest(k, self.find(query, vector), key=lambda x: (x[1], -x[0]))
+
+    def find_batch(self, queries, k=10, vector=False):
+        """Retrieve the top k live documents of every query
+
+        Args:
+            queries: List of Document, or of sparse query vectors if vector
+            k: Number of documents to retrieve per query
+            vector: Whether queries are already vectorized
+
+        Returns: List with the (doc_id, similarity) ranking of each query
+        """
+        return [self.search(query, k, vector) for query in queries]
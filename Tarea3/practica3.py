@@ -3,10 +3,34 @@
 # Date: 18/03/2024
 # Versión: 1.0
 
+import gzip
+import heapq
 import math
-from dataclasses import dataclass
+import operator
+import os
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping, Sequence
+from dataclasses import dataclass, field
+from itertools import accumulate
 from typing import Union
 
+import numpy as np
+
+from recuperacion.instrumentation import NO_METRICS
+from recuperacion.paths import DATASET, DOCUMENTS, QUERIES, RESULT
+
+from .evaluation import (
+    CUTOFFS,
+    RESULT_DEPTH,
+    Qrels,
+    evaluate_rankings,
+    format_trec_eval,
+)
+from .storage import pack_strings, read_arrays, unpack_strings, write_arrays
+
+INDEX_VERSION = 1
+
 
 @dataclass
 class Document:
@@ -19,24 +43,115 @@ class DocumentFrequency(Document):
     id_psical: str
 
 
+@dataclass(slots=True)
+class Postings:
+    """Posting list of a term, sorted by doc id"""
+
+    doc_ids: array = field(default_factory=lambda: array("i"))
+    weights: array = field(default_factory=lambda: array("d"))
+
+    def append(self, doc_id: int, weight: float):
+        self.doc_ids.append(doc_id)
+        self.weights.append(weight)
+
+
+class StoredPostings(Mapping):
+    """Read-only word -> Postings mapping over the arrays of a saved index
+
+    Posting lists are copied out of the memory-mapped file only when a word
+    is looked up, so loading an index does not touch the postings at all.
+    """
+
+    def __init__(self, words, offsets, doc_ids, weights) -> None:
+        self.rows = {word: row for row, word in enumerate(words)}
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.weights = weights
+
+    def __getitem__(self, word):
+        row = self.rows[word]
+        start, end = self.offsets[row], self.offsets[row + 1]
+        postings = Postings()
+        postings.doc_ids.frombytes(self.doc_ids[start:end].tobytes())
+        postings.weights.frombytes(self.weights[start:end].tobytes())
+        return postings
+
+    def __contains__(self, word):
+        return word in self.rows
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+
+class StoredDocuments(Sequence):
+    """Read-only list of DocumentFrequency over the arrays of a saved index"""
+
+    def __init__(self, ids, ids_psical, words, offsets, terms, frequencies) -> None:
+        self.ids = ids
+        self.ids_psical = ids_psical
+        self.words = words
+        self.offsets = offsets
+        self.terms = terms
+        self.frequencies = frequencies
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(len(self)))]
+        position = operator.index(position)
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError("document index out of range")
+        start, end = self.offsets[position], self.offsets[position + 1]
+        return DocumentFrequency(
+            id=self.ids[position],
+            id_psical=self.ids_psical[position],
+            frequencies={
+                self.words[term]: int(frequency)
+                for term, frequency in zip(
+                    self.terms[start:end], self.frequencies[start:end]
+                )
+            },
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+
 def load_frequencies(
     frequencies_name: str, query=False
 ) -> Union[list[DocumentFrequency], list[Document]]:
+    """Load a .FRQ file, or its gzip compressed .FRQ.gz variant
+
+    Args:
+        frequencies_name: File name, without extension
+        query: Whether lines hold queries (Que1) instead of documents (Doc1-017)
+
+    Returns: List of Document for queries, of DocumentFrequency otherwise
+    """
     documents_frequencies = []
-    with open(f"{frequencies_name}.FRQ", "r") as file:
+    if os.path.exists(f"{frequencies_name}.FRQ"):
+        file = open(f"{frequencies_name}.FRQ", "r", buffering=1 << 20)
+    else:
+        file = gzip.open(f"{frequencies_name}.FRQ.gz", "rt")
+    # Words never contain "-", so each line is split in a single pass into
+    # the identifier fields followed by alternating words and frequencies
+    start = 1 if query else 2
+    with file:
         for line in file:
-            words_frequency = line.split()
-            if not words_frequency:
+            tokens = line.replace("-", " ").split()
+            if not tokens:
                 break
+            frequencies = dict(zip(tokens[start::2], map(int, tokens[start + 1 :: 2])))
             if query:
-                id = words_frequency[0]
-                doc = Document(id=id, frequencies={})
+                doc = Document(id=tokens[0], frequencies=frequencies)
             else:
-                id, id_psical = words_frequency[0].split("-")
-                doc = DocumentFrequency(id=id, id_psical=id_psical, frequencies={})
-            for word_frequency in words_frequency[1:]:
-                word, frquency = word_frequency.split("-")
-                doc.frequencies[word] = int(frquency)
+                doc = DocumentFrequency(
+                    id=tokens[0], id_psical=tokens[1], frequencies=frequencies
+                )
             documents_frequencies.append(doc)
     return documents_frequencies
 
@@ -73,7 +188,8 @@ class TestIR:
     def evaluate(self, id_query: int, retrieved_documents: list):
         relevant_documents = self.relevant_documents_per_query[id_query]
         true_positives = len(set(relevant_documents) & set(retrieved_documents))
-        precision = true_positives / len(retrieved_documents)
+        # A query may retrieve nothing, e.g. when none of its terms is indexed
+        precision = true_positives / max(len(retrieved_documents), 1)
         recall = true_positives / len(relevant_documents)
         if precision + recall == 0:
             f_measure = 0
@@ -84,10 +200,35 @@ class TestIR:
 
 
 class IRSystem2:
-    def __init__(self, documents_frequencies) -> None:
+    """TF-IDF retrieval system backed by an inverted index
+
+    Attributes:
+        documents_frequencies: List of DocumentFrequency
+        vocabulary: Dict with words and document frequencies
+        idf: Dict with words and inverse document frequencies
+        index: Dict with words and their Postings
+        documents_norms: Euclidean norm of each document vector
+        bounds: Dict with words and the (min, max) normalized weight of their
+            postings, used as score upper bounds by search
+        metrics: Metrics collecting stage timings and counters, disabled
+            unless a Metrics instance is assigned
+    """
+
+    metrics = NO_METRICS
+
+    def __init__(self, documents_frequencies, idf=None) -> None:
+        """Contructor
+
+        Args:
+            documents_frequencies: List of DocumentFrequency
+            idf: Dict with words and inverse document frequencies computed
+                over a larger collection, used by the shards of an index
+        """
         self.documents_frequencies = documents_frequencies
         self.vocabulary = self.__get_vocabulary()
-        self.documents_vectors = self.__vectorize_documents()
+        self.idf = self.__get_idf() if idf is None else idf
+        self.index, self.documents_norms = self.__index_documents()
+        self.bounds = self.__get_bounds()
 
     def __get_vocabulary(self):
         vocabulary = {}
@@ -99,75 +240,661 @@ class IRSystem2:
                     vocabulary[word] = 1
         return vocabulary
 
-    def __vectorize_documents(self):
-        documents_vectors = []
+    def __get_idf(self):
         num_doc = len(self.documents_frequencies)
-        for doc_freq in self.documents_frequencies:
-            document_vector = {}
+        return {
+            word: math.log(num_doc / (1 + frecuency))
+            for word, frecuency in self.vocabulary.items()
+        }
+
+    def __index_documents(self):
+        index = {word: Postings() for word in self.vocabulary}
+        documents_norms = array("d")
+        for doc_id, doc_freq in enumerate(self.documents_frequencies, start=1):
             size_document = sum(doc_freq.frequencies.values())
-            for word, frecuency in self.vocabulary.items():
-                tf = doc_freq.frequencies.get(word, 0) / size_document
-                idf = math.log(num_doc / (1 + frecuency))
-                document_vector[word] = tf * idf
-            documents_vectors.append(document_vector)
-        return documents_vectors
+            norm = 0.0
+            for word, frecuency in doc_freq.frequencies.items():
+                weight = frecuency / size_document * self.idf[word]
+                index[word].append(doc_id, weight)
+                norm += weight**2
+            documents_norms.append(math.sqrt(norm))
+        return index, documents_norms
+
+    def __get_bounds(self):
+        bounds = {}
+        for word, postings in self.index.items():
+            normalized = [
+                weight / self.documents_norms[doc_id - 1]
+                for doc_id, weight in zip(postings.doc_ids, postings.weights)
+                if self.documents_norms[doc_id - 1] != 0
+            ]
+            bounds[word] = (min(normalized, default=0.0), max(normalized, default=0.0))
+        return bounds
 
     def __vectorize_query(self, query: Document):
-        query_vector = {}
-        for word in self.vocabulary:
-            if word in query.frequencies:
-                query_vector[word] = 1
-            else:
-                query_vector[word] = 0
-        return query_vector
+        return {word: 1 for word in query.frequencies if word in self.index}
+
+    def __cosine_similarities(self, query):
+        """Score only the documents sharing at least one term with the query
+
+        Args:
+            query: Sparse query vector
+
+        Returns: Dict with doc ids and cosine similarities
+        """
+        norm_query = math.sqrt(sum(weight**2 for weight in query.values()))
+        if norm_query == 0:
+            return {}
+        dot_products = {}
+        for word, query_weight in query.items():
+            postings = self.index.get(word)
+            if postings is None or query_weight == 0:
+                continue
+            self.metrics.count("postings", len(postings.doc_ids))
+            for doc_id, weight in zip(postings.doc_ids, postings.weights):
+                dot_products[doc_id] = dot_products.get(doc_id, 0.0) + (
+                    query_weight * weight
+                )
+        self.metrics.count("documents_scored", len(dot_products))
+        return self.__normalize_dot_products(norm_query, dot_products)
+
+    def __normalize_dot_products(self, norm_query, dot_products):
+        similarities = {}
+        for doc_id, dot_product in dot_products.items():
+            norm_document = self.documents_norms[doc_id - 1]
+            if norm_document != 0:
+                similarities[doc_id] = dot_product / (norm_query * norm_document)
+        return similarities
+
+    def __document_vector(self, doc_id):
+        doc_freq = self.documents_frequencies[doc_id - 1]
+        size_document = sum(doc_freq.frequencies.values())
+        return {
+            word: frecuency / size_document * self.idf[word]
+            for word, frecuency in doc_freq.frequencies.items()
+        }
+
+    def save(self, path: str):
+        """Write the index to a versioned binary file
 
-    def __cosine_similarity(self, query, document):
-        dot_product = sum(query[word] * document[word] for word in query)
-        norm_query = math.sqrt(sum(query[word] ** 2 for word in query))
-        norm_document = math.sqrt(sum(document[word] ** 2 for word in document))
-        if norm_query * norm_document == 0:
-            return 0
-        return dot_product / (norm_query * norm_document)
+        Args:
+            path: Output file
+        """
+        words = list(self.index)
+        rows = {word: row for row, word in enumerate(words)}
+        postings = [self.index[word] for word in words]
+        lengths = np.fromiter((len(p.doc_ids) for p in postings), dtype=np.int64)
+        terms = []
+        frequencies = []
+        documents_lengths = []
+        for doc_freq in self.documents_frequencies:
+            terms.extend(rows[word] for word in doc_freq.frequencies)
+            frequencies.extend(doc_freq.frequencies.values())
+            documents_lengths.append(len(doc_freq.frequencies))
+        write_arrays(
+            path,
+            "IRSystem2",
+            INDEX_VERSION,
+            {
+                "words": pack_strings(words),
+                "document_frequencies": np.array(
+                    [self.vocabulary[word] for word in words], dtype=np.int32
+                ),
+                "idf": np.array([self.idf[word] for word in words]),
+                "bounds": np.array(
+                    [self.bounds[word] for word in words], dtype=np.float64
+                ).reshape(-1, 2),
+                "postings_offsets": np.concatenate(([0], np.cumsum(lengths))),
+                "postings_doc_ids": np.concatenate(
+                    [np.frombuffer(p.doc_ids, dtype=np.int32) for p in postings]
+                    + [np.empty(0, dtype=np.int32)]
+                ),
+                "postings_weights": np.concatenate(
+                    [np.frombuffer(p.weights, dtype=np.float64) for p in postings]
+                    + [np.empty(0, dtype=np.float64)]
+                ),
+                "documents_norms": np.frombuffer(
+                    self.documents_norms, dtype=np.float64
+                ),
+                "documents_ids": pack_strings(
+                    doc.id for doc in self.documents_frequencies
+                ),
+                "documents_ids_psical": pack_strings(
+                    doc.id_psical for doc in self.documents_frequencies
+                ),
+                "documents_offsets": np.concatenate(
+                    ([0], np.cumsum(documents_lengths, dtype=np.int64))
+                ),
+                "documents_terms": np.array(terms, dtype=np.int32),
+                "documents_term_frequencies": np.array(frequencies, dtype=np.int32),
+            },
+        )
+
+    @classmethod
+    def load(cls, path: str):
+        """Load an index written by save, memory-mapping its arrays
+
+        Args:
+            path: Input file
+
+        Returns: IRSystem2
+        """
+        _, arrays = read_arrays(path, "IRSystem2", INDEX_VERSION)
+        words = unpack_strings(arrays["words"])
+        ir_system = cls.__new__(cls)
+        ir_system.vocabulary = dict(zip(words, arrays["document_frequencies"].tolist()))
+        ir_system.idf = dict(zip(words, arrays["idf"].tolist()))
+        ir_system.bounds = dict(zip(words, map(tuple, arrays["bounds"].tolist())))
+        ir_system.index = StoredPostings(
+            words,
+            arrays["postings_offsets"],
+            arrays["postings_doc_ids"],
+            arrays["postings_weights"],
+        )
+        ir_system.documents_norms = array("d")
+        ir_system.documents_norms.frombytes(arrays["documents_norms"].tobytes())
+        ir_system.documents_frequencies = StoredDocuments(
+            unpack_strings(arrays["documents_ids"]),
+            unpack_strings(arrays["documents_ids_psical"]),
+            words,
+            arrays["documents_offsets"],
+            arrays["documents_terms"],
+            arrays["documents_term_frequencies"],
+        )
+        return ir_system
+
+    def __centroid(self, doc_ids):
+        """Mean of the document vectors, summed over their own terms only"""
+        centroid = {}
+        for doc_id in doc_ids:
+            for word, weight in self.__document_vector(doc_id).items():
+                centroid[word] = centroid.get(word, 0.0) + weight
+        for word in centroid:
+            centroid[word] /= len(doc_ids)
+        return centroid
 
     def rocchio_feedback(
-        self, query, relevant_docs, irrelevant_docs, alpha, beta, gamma
+        self,
+        query,
+        relevant_docs,
+        irrelevant_docs,
+        alpha,
+        beta,
+        gamma,
+        max_terms=None,
     ):
-        query_vector = self.__vectorize_query(query)
-        relevant_vectors = [
-            self.documents_vectors[doc_id - 1] for doc_id in relevant_docs
-        ]
-        irrelevant_vectors = [
-            self.documents_vectors[doc_id - 1] for doc_id in irrelevant_docs
-        ]
-        updated_query_vector = {}
-        for word in self.vocabulary:
-            relevant_term = sum(doc_vector[word] for doc_vector in relevant_vectors)
-            irrelevant_term = sum(doc_vector[word] for doc_vector in irrelevant_vectors)
+        """Move the query vector towards the relevant documents (Rocchio)
+
+        Args:
+            query: Document to expand
+            relevant_docs: Doc ids judged relevant
+            irrelevant_docs: Doc ids judged irrelevant
+            alpha: Weight of the original query
+            beta: Weight of the relevant centroid
+            gamma: Weight of the irrelevant centroid
+            max_terms: Keep only the max_terms highest weighted terms
+
+        Returns: Sparse query vector
+        """
+        updated_query_vector = {
+            word: alpha * weight
+            for word, weight in self.__vectorize_query(query).items()
+        }
+        for word, weight in self.__centroid(relevant_docs).items():
+            updated_query_vector[word] = (
+                updated_query_vector.get(word, 0) + beta * weight
+            )
+        for word, weight in self.__centroid(irrelevant_docs).items():
             updated_query_vector[word] = (
-                alpha * query_vector[word]
-                + beta * (relevant_term / len(relevant_docs))
-                - gamma * (irrelevant_term / len(irrelevant_docs))
+                updated_query_vector.get(word, 0) - gamma * weight
+            )
+        if max_terms is not None and len(updated_query_vector) > max_terms:
+            updated_query_vector = dict(
+                heapq.nlargest(
+                    max_terms, updated_query_vector.items(), key=lambda x: x[1]
+                )
             )
         return updated_query_vector
 
+    def pseudo_relevance_feedback(
+        self,
+        query,
+        k=10,
+        relevant=3,
+        irrelevant=0,
+        alpha=1,
+        beta=0.75,
+        gamma=0.25,
+        max_terms=50,
+    ):
+        """Search, assume the top results are relevant and search again
+
+        Args:
+            query: Document to search
+            k: Number of documents to retrieve
+            relevant: Top documents of the first search taken as relevant
+            irrelevant: Following documents taken as irrelevant
+            alpha: Weight of the original query
+            beta: Weight of the relevant centroid
+            gamma: Weight of the irrelevant centroid
+            max_terms: Terms kept in the expanded query, None keeps all
+
+        Returns: List of (doc_id, similarity) sorted by decreasing similarity
+        """
+        with self.metrics.profile():
+            ranking = [
+                doc_id for doc_id, _ in self.search(query, relevant + irrelevant)
+            ]
+            if not ranking:
+                return []
+            with self.metrics.stage("feedback"):
+                expanded_query = self.rocchio_feedback(
+                    query,
+                    ranking[:relevant],
+                    ranking[relevant:],
+                    alpha,
+                    beta,
+                    gamma,
+                    max_terms,
+                )
+            return self.search(expanded_query, k, vector=True)
+
+    def search(self, query, k=10, vector=False):
+        """Retrieve the k most similar documents with MaxScore pruning
+
+        Posting lists are traversed document at a time; once the heap is full,
+        the lists whose summed upper bounds cannot beat the k-th score are only
+        probed for documents found in the remaining lists.
+
+        Args:
+            query: Document, or sparse query vector if vector is True
+            k: Number of documents to retrieve
+            vector: Whether query is already vectorized
+
+        Returns: List of (doc_id, similarity) sorted by decreasing similarity
+        """
+        metrics = self.metrics
+        metrics.count("queries")
+        with metrics.profile():
+            with metrics.stage("vectorize"):
+                if not vector:
+                    query = self.__vectorize_query(query)
+                norm_query = math.sqrt(sum(weight**2 for weight in query.values()))
+            if norm_query == 0 or k <= 0:
+                return []
+            with metrics.stage("score"):
+                heap = self.__max_score(query, k)
+            with metrics.stage("select"):
+                return [
+                    (-doc_id, score / norm_query)
+                    for score, doc_id in sorted(heap, reverse=True)
+                ]
+
+    def __max_score(self, query, k):
+        """MaxScore traversal of the query posting lists
+
+        Returns: Heap with the (unnormalized score, -doc_id) of the top k
+        """
+        terms = []
+        for word, query_weight in query.items():
+            if word not in self.index or query_weight == 0:
+                continue
+            low, high = self.bounds[word]
+            upper_bound = max(query_weight * low, query_weight * high, 0.0)
+            terms.append((upper_bound, query_weight, self.index[word]))
+        return max_score(terms, k, self.__posting_score, self.metrics)
+
+    def __posting_score(self, query_weight, weight, doc_id):
+        norm_document = self.documents_norms[doc_id - 1]
+        inverse_norm = 1 / norm_document if norm_document != 0 else 0.0
+        return query_weight * weight * inverse_norm
+
+    def find_batch(self, queries, k=10, vector=False):
+        """Retrieve the top k documents of every query in one pass over the index
+
+        Queries are grouped by term, so each posting list is traversed once
+        for the whole batch instead of once per query.
+
+        Args:
+            queries: List of Document, or of sparse query vectors if vector
+            k: Number of documents to retrieve per query
+            vector: Whether queries are already vectorized
+
+        Returns: List with the (doc_id, similarity) ranking of each query
+        """
+        metrics = self.metrics
+        metrics.count("queries", len(queries))
+        with metrics.profile():
+            with metrics.stage("vectorize"):
+                if not vector:
+                    queries = [self.__vectorize_query(query) for query in queries]
+            with metrics.stage("score"):
+                dot_products = self.__batch_dot_products(queries)
+            with metrics.stage("select"):
+                rankings = []
+                for query, query_dot_products in zip(queries, dot_products):
+                    norm_query = math.sqrt(sum(w**2 for w in query.values()))
+                    similarities = self.__normalize_dot_products(
+                        norm_query, query_dot_products
+                    )
+                    rankings.append(
+                        heapq.nlargest(
+                            k,
+                            ((d, sim) for d, sim in similarities.items() if sim > 0),
+                            key=lambda x: (x[1], -x[0]),
+                        )
+                    )
+        return rankings
+
+    def __batch_dot_products(self, queries):
+        queries_per_word = {}
+        for position, query in enumerate(queries):
+            for word, query_weight in query.items():
+                if word in self.index and query_weight != 0:
+                    queries_per_word.setdefault(word, []).append(
+                        (position, query_weight)
+                    )
+        dot_products = [{} for _ in queries]
+        for word, queries_weights in queries_per_word.items():
+            postings = self.index[word]
+            self.metrics.count("postings", len(postings.doc_ids))
+            for doc_id, weight in zip(postings.doc_ids, postings.weights):
+                for position, query_weight in queries_weights:
+                    accumulator = dot_products[position]
+                    accumulator[doc_id] = accumulator.get(doc_id, 0.0) + (
+                        query_weight * weight
+                    )
+        if self.metrics.enabled:
+            self.metrics.count(
+                "documents_scored", sum(len(products) for products in dot_products)
+            )
+        return dot_products
+
     def find(self, query, vector=False):
-        if not vector:
-            query = self.__vectorize_query(query)
-        for doc_id, document_vector in enumerate(self.documents_vectors, start=1):
-            similarity = self.__cosine_similarity(query, document_vector)
+        metrics = self.metrics
+        metrics.count("queries")
+        with metrics.profile():
+            with metrics.stage("vectorize"):
+                if not vector:
+                    query = self.__vectorize_query(query)
+            with metrics.stage("score"):
+                similarities = self.__cosine_similarities(query)
+        for doc_id in sorted(similarities):
+            similarity = similarities[doc_id]
             if similarity > 0:
                 yield doc_id, similarity
 
 
-if __name__ == "__main__":
-    import heapq
+def max_score(terms, k: int, score, metrics=NO_METRICS):
+    """Top k documents of a query by a MaxScore traversal of its posting lists
 
-    test = TestIR("../dataset/TIME.REL")
-    queries_frequencies = load_frequencies("../freq/queries", True)
-    ir_system = IRSystem2(load_frequencies("../freq/documents"))
-    with open("../result/retrieved_documents_rocchio.REL", "w") as output_file:
-        for qu_id, tmp_query in enumerate(queries_frequencies[:10], start=1):
-            output_line = f"Q{qu_id} "
+    Posting lists are traversed document at a time; once the heap is full,
+    the lists whose summed upper bounds cannot beat the k-th score are only
+    probed for documents found in the remaining lists.
+
+    Args:
+        terms: List of (upper_bound, query_weight, Postings) of the query
+            terms, upper_bound being the largest contribution of the term
+        k: Number of documents to retrieve
+        score: Callable(query_weight, posting_weight, doc_id) returning the
+            contribution of a term to a document
+        metrics: Metrics counting the documents scored and postings read
+
+    Returns: Heap with the (score, -doc_id) of the top k
+    """
+    terms = sorted(terms, key=lambda term: term[0])
+    upper_bounds = list(accumulate(term[0] for term in terms))
+    pointers = [0] * len(terms)
+    heap = []
+    threshold = 0.0
+    essential = 0
+    scored = 0
+    while True:
+        # Lists before `essential` cannot lift a document over the threshold
+        while essential < len(terms) and upper_bounds[essential] <= threshold:
+            essential += 1
+        candidates = [
+            terms[i][2].doc_ids[pointers[i]]
+            for i in range(essential, len(terms))
+            if pointers[i] < len(terms[i][2].doc_ids)
+        ]
+        if not candidates:
+            break
+        doc_id = min(candidates)
+        scored += 1
+        document_score = 0.0
+        for i in range(essential, len(terms)):
+            _, query_weight, postings = terms[i]
+            pointer = pointers[i]
+            if pointer < len(postings.doc_ids) and postings.doc_ids[pointer] == doc_id:
+                document_score += score(query_weight, postings.weights[pointer], doc_id)
+                pointers[i] = pointer + 1
+        for i in range(essential - 1, -1, -1):
+            if document_score + upper_bounds[i] <= threshold:
+                break
+            _, query_weight, postings = terms[i]
+            pointer = bisect_left(postings.doc_ids, doc_id, pointers[i])
+            if pointer < len(postings.doc_ids) and postings.doc_ids[pointer] == doc_id:
+                document_score += score(query_weight, postings.weights[pointer], doc_id)
+                pointer += 1
+            pointers[i] = pointer
+        if document_score > threshold:
+            heapq.heappush(heap, (document_score, -doc_id))
+            if len(heap) > k:
+                heapq.heappop(heap)
+            if len(heap) == k:
+                threshold = heap[0][0]
+    metrics.count("documents_scored", scored)
+    metrics.count("postings", sum(pointers))
+    return heap
+
+
+def top_k_documents(similarities, k: int, doc_ids=None) -> list[tuple[int, float]]:
+    """Select the k highest positive similarities without a full sort
+
+    Ties are broken by lowest doc id, as heapq.nlargest does over find.
+
+    Args:
+        similarities: Array with the similarity of every document
+        k: Number of documents to retrieve
+        doc_ids: Doc ids of the similarities, in any order, when they only
+            cover some documents; all documents in order if None
+
+    Returns: List of (doc_id, similarity) sorted by decreasing similarity
+    """
+    if k <= 0:
+        return []
+    candidates = np.flatnonzero(similarities > 0)
+    ids = candidates + 1 if doc_ids is None else np.asarray(doc_ids)[candidates]
+    if k < len(candidates):
+        scores = similarities[candidates]
+        kth = -np.partition(-scores, k - 1)[k - 1]
+        above = scores > kth
+        tied = np.flatnonzero(scores == kth)
+        tied = tied[np.argsort(ids[tied], kind="stable")][: k - np.count_nonzero(above)]
+        kept = np.concatenate((np.flatnonzero(above), tied))
+        candidates, ids = candidates[kept], ids[kept]
+    order = np.lexsort((ids, -similarities[candidates]))
+    return list(zip(ids[order].tolist(), similarities[candidates[order]].tolist()))
+
+
+class MatrixIRSystem2:
+    """TF-IDF retrieval system backed by a sparse document-term matrix
+
+    Uses the same weighting as IRSystem2, but documents are stored as the rows
+    of a CSR matrix normalized to unit length once, so scoring a query is a
+    single sparse matrix-vector product.
+
+    Attributes:
+        documents_frequencies: List of DocumentFrequency
+        vocabulary: Dict with words and document frequencies
+        terms: Dict with words and their column in the matrix
+        idf: Array with the inverse document frequency of each column
+        documents_matrix: CSR matrix with the L2-normalized document vectors
+        metrics: Metrics collecting stage timings and counters, disabled
+            unless a Metrics instance is assigned
+    """
+
+    metrics = NO_METRICS
+
+    def __init__(self, documents_frequencies) -> None:
+        self.documents_frequencies = documents_frequencies
+        self.vocabulary = self.__get_vocabulary()
+        self.terms = {word: column for column, word in enumerate(self.vocabulary)}
+        self.idf = self.__get_idf()
+        self.documents_matrix = self.__vectorize_documents()
+
+    def __get_vocabulary(self):
+        vocabulary = {}
+        for document in self.documents_frequencies:
+            for word in document.frequencies:
+                vocabulary[word] = vocabulary.get(word, 0) + 1
+        return vocabulary
+
+    def __get_idf(self):
+        num_doc = len(self.documents_frequencies)
+        frequencies = np.fromiter(self.vocabulary.values(), dtype=np.float64)
+        return np.log(num_doc / (1 + frequencies))
+
+    def __vectorize_documents(self):
+        # SciPy is imported on first use to keep startup fast
+        from scipy.sparse import csr_matrix
+
+        indptr = [0]
+        indices = []
+        tf = []
+        for doc_freq in self.documents_frequencies:
+            size_document = sum(doc_freq.frequencies.values())
+            for word, frecuency in doc_freq.frequencies.items():
+                indices.append(self.terms[word])
+                tf.append(frecuency / size_document)
+            indptr.append(len(indices))
+        indices = np.array(indices, dtype=np.int32)
+        data = np.array(tf, dtype=np.float64) * self.idf[indices]
+        return self.__normalize_rows(
+            csr_matrix(
+                (data, indices, np.array(indptr)),
+                shape=(len(self.documents_frequencies), len(self.terms)),
+            )
+        )
+
+    @staticmethod
+    def __normalize_rows(matrix):
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        inverse_norms = np.divide(
+            1.0, norms, out=np.zeros_like(norms), where=norms != 0
+        )
+        matrix.data *= np.repeat(inverse_norms, np.diff(matrix.indptr))
+        return matrix
+
+    def vectorize_queries(self, queries, vector=False):
+        """Build the L2-normalized query matrix
+
+        Args:
+            queries: List of Document, or of sparse query vectors if vector
+            vector: Whether queries are already vectorized
+
+        Returns: CSR matrix with one row per query
+        """
+        from scipy.sparse import csr_matrix
+
+        indptr = [0]
+        indices = []
+        data = []
+        for query in queries:
+            weights = query if vector else dict.fromkeys(query.frequencies, 1)
+            for word, weight in weights.items():
+                column = self.terms.get(word)
+                if column is not None and weight != 0:
+                    indices.append(column)
+                    data.append(weight)
+            indptr.append(len(indices))
+        return self.__normalize_rows(
+            csr_matrix(
+                (np.array(data, dtype=np.float64), indices, indptr),
+                shape=(len(queries), len(self.terms)),
+            )
+        )
+
+    def similarities(self, queries_matrix):
+        """Cosine similarity of every query against every document
+
+        The product stays sparse, so a batch needs memory for the documents
+        sharing a term with each query rather than for every document.
+
+        Args:
+            queries_matrix: Matrix returned by vectorize_queries
+
+        Returns: CSR matrix of shape (queries, documents)
+        """
+        return (queries_matrix @ self.documents_matrix.T).tocsr()
+
+    def search(self, query, k=10, vector=False):
+        return self.find_batch([query], k, vector)[0]
+
+    def find_batch(self, queries, k=10, vector=False):
+        """Retrieve the top k documents of every query with one matrix product
+
+        Args:
+            queries: List of Document, or of sparse query vectors if vector
+            k: Number of documents to retrieve per query
+            vector: Whether queries are already vectorized
+
+        Returns: List with the (doc_id, similarity) ranking of each query
+        """
+        metrics = self.metrics
+        metrics.count("queries", len(queries))
+        with metrics.profile():
+            with metrics.stage("vectorize"):
+                queries_matrix = self.vectorize_queries(queries, vector)
+            with metrics.stage("score"):
+                similarities = self.similarities(queries_matrix)
+            if metrics.enabled:
+                metrics.count("documents_scored", np.count_nonzero(similarities.data))
+            with metrics.stage("select"):
+                indptr = similarities.indptr
+                return [
+                    top_k_documents(
+                        similarities.data[start:end],
+                        k,
+                        similarities.indices[start:end] + 1,
+                    )
+                    for start, end in zip(indptr[:-1], indptr[1:])
+                ]
+
+    def find(self, query, vector=False):
+        metrics = self.metrics
+        metrics.count("queries")
+        with metrics.profile():
+            with metrics.stage("vectorize"):
+                queries_matrix = self.vectorize_queries([query], vector)
+            with metrics.stage("score"):
+                similarities = self.similarities(queries_matrix)
+        similarities.sort_indices()
+        positive = similarities.data > 0
+        yield from zip(
+            (similarities.indices[positive] + 1).tolist(),
+            similarities.data[positive].tolist(),
+        )
+
+
+if __name__ == "__main__":
+    test = TestIR(DATASET + ".REL")
+    queries_frequencies = load_frequencies(QUERIES, True)
+    documents_name = DOCUMENTS
+    index_path = documents_name + ".idx"
+    if os.path.exists(index_path) and os.path.getmtime(index_path) >= os.path.getmtime(
+        documents_name + ".FRQ"
+    ):
+        ir_system = IRSystem2.load(index_path)
+    else:
+        ir_system = IRSystem2(load_frequencies(documents_name))
+        ir_system.save(index_path)
+    with open(
+        os.path.join(RESULT, "retrieved_documents_rocchio.REL"), "w"
+    ) as output_file:
+        feedback_queries = []
+        for tmp_query in queries_frequencies:
             rd = ir_system.find(tmp_query)
             rdc = list(map(lambda x: x[0], sorted(rd, key=lambda x: x[1])))
             relevant_docs = rdc[:3]
@@ -176,23 +903,28 @@ if __name__ == "__main__":
             # irrelevant_docs = rdc - relevant_docs
             # relevant_docs = test.relevant_documents_per_query.get(qu_id, [])
             # irrelevant_docs = list(
-            #     set(range(1, len(ir_system.documents_vectors) + 1)) - set(relevant_docs)
+            #     set(range(1, len(ir_system.documents_norms) + 1)) - set(relevant_docs)
             # )
-            query = ir_system.rocchio_feedback(
-                tmp_query,
-                relevant_docs,
-                irrelevant_docs,
-                alpha=1,
-                beta=0.75,
-                gamma=0.25,
-            )
-            retrieved_documents_similarity = heapq.nlargest(
-                10, ir_system.find(query, True), key=lambda x: x[1]
+            feedback_queries.append(
+                ir_system.rocchio_feedback(
+                    tmp_query,
+                    relevant_docs,
+                    irrelevant_docs,
+                    alpha=1,
+                    beta=0.75,
+                    gamma=0.25,
+                )
             )
-            for doc_id, sim in retrieved_documents_similarity:
+        rankings = ir_system.find_batch(feedback_queries, max(CUTOFFS), vector=True)
+        for qu_id, retrieved_documents_similarity in enumerate(rankings, start=1):
+            output_line = f"Q{qu_id} "
+            for doc_id, sim in retrieved_documents_similarity[:RESULT_DEPTH]:
                 output_line += f"D{doc_id} {sim} "
-            retrieved_documents = [d for d, _ in retrieved_documents_similarity]
+            retrieved_documents = [
+                d for d, _ in retrieved_documents_similarity[:RESULT_DEPTH]
+            ]
             precision, recall, f_measure, ap = test.evaluate(qu_id, retrieved_documents)
             output_line += f"P{precision} R{recall} F{f_measure} AP{ap}\n"
             print(output_line)
             output_file.write(output_line)
+    print(format_trec_eval(evaluate_rankings(Qrels.load(DATASET + ".REL"), rankings)))
@@ -0,0 +1,178 @@
+# query_cache.py
+# Description: Query result cache placed in front of a retrieval system.
+# Rankings are keyed on the term frequencies of the preprocessed query, kept
+# in LRU order with an optional time to live, and dropped whenever the
+# generation of the underlying index changes.
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class QueryCache:
+    """LRU + TTL cache of search rankings
+
+    Wraps any system with search(query, k) and find_batch(queries, k), such
+    as IRSystem2, MatrixIRSystem2, IRSystem4 or IncrementalIndex. A ranking
+    cached for k documents also answers queries asking for fewer, since
+    every system breaks ties by doc id. It never answers queries asking for
+    more: approximate and pruned searches can return short rankings that do
+    not hold every matching document.
+
+    Attributes:
+        system: Wrapped retrieval system
+        max_size: Maximum number of cached queries
+        ttl: Seconds an entry stays valid, None keeps it until evicted
+        rankings: OrderedDict from least to most recently used key, with
+            (expiration, k, ranking) values
+        generation: Generation of system the cached rankings belong to
+        hits: Number of lookups answered from the cache
+        misses: Number of lookups forwarded to system
+        evictions: Entries dropped to respect max_size
+        expirations: Entries dropped because their ttl passed
+        invalidations: Times the whole cache was dropped
+    """
+
+    def __init__(self, system, max_size=1024, ttl=None) -> None:
+        """Contructor
+
+        Args:
+            system: Retrieval system to wrap
+            max_size: Maximum number of cached queries
+            ttl: Seconds an entry stays valid, None disables expiration
+        """
+        self.system = system
+        self.max_size = max_size
+        self.ttl = ttl
+        self.rankings = OrderedDict()
+        self.generation = self.__system_generation()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.__lock = threading.Lock()
+
+    def __system_generation(self):
+        # Systems without a generation are never modified after being built
+        return getattr(self.system, "generation", 0)
+
+    @staticmethod
+    def key(query, vector=False):
+        """Cache key of a query: its preprocessed terms and frequencies
+
+        Args:
+            query: Document, or sparse query vector if vector is True
+            vector: Whether query is already vectorized
+        """
+        return vector, frozenset(query.items() if vector else query.frequencies.items())
+
+    def invalidate(self):
+        """Drop every cached ranking"""
+        with self.__lock:
+            self.__invalidate()
+
+    def __invalidate(self):
+        self.rankings.clear()
+        self.generation = self.__system_generation()
+        self.invalidations += 1
+
+    def get(self, key, k: int):
+        """Cached ranking of at least k documents, or None
+
+        Args:
+            key: Key returned by QueryCache.key
+            k: Number of documents wanted
+        """
+        with self.__lock:
+            if self.generation != self.__system_generation():
+                self.__invalidate()
+            entry = self.rankings.get(key)
+            if entry is not None:
+                expiration, cached_k, ranking = entry
+                if expiration is not None and expiration <= time.monotonic():
+                    del self.rankings[key]
+                    self.expirations += 1
+                elif cached_k >= k:
+                    self.rankings.move_to_end(key)
+                    self.hits += 1
+                    return ranking[:k]
+            self.misses += 1
+            return None
+
+    def put(self, key, k: int, ranking):
+        with self.__lock:
+            if self.generation != self.__system_generation():
+                self.__invalidate()
+            expiration = None if self.ttl is None else time.monotonic() + self.ttl
+            self.rankings[key] = (expiration, k, list(ranking))
+            self.rankings.move_to_end(key)
+            if len(self.rankings) > self.max_size:
+                self.rankings.popitem(last=False)
+                self.evictions += 1
+
+    def search(self, query, k=10, vector=False):
+        """Cached search of the wrapped system
+
+        Args:
+            query: Document, or sparse query vector if vector is True
+            k: Number of documents to retrieve
+            vector: Whether query is already vectorized
+
+        Returns: List of (doc_id, similarity) sorted by decreasing similarity
+        """
+        key = self.key(query, vector)
+        ranking = self.get(key, k)
+        if ranking is None:
+            if vector:
+                ranking = self.system.search(query, k, vector=True)
+            else:
+                ranking = self.system.search(query, k)
+            self.put(key, k, ranking)
+        return ranking
+
+    def find_batch(self, queries, k=10, vector=False):
+        """Cached find_batch, only the missing queries reach the system
+
+        Args:
+            queries: List of Document, or of sparse query vectors if vector
+            k: Number of documents to retrieve per query
+            vector: Whether queries are already vectorized
+
+        Returns: List with the (doc_id, similarity) ranking of each query
+        """
+        keys = [self.key(query, vector) for query in queries]
+        rankings = [self.get(key, k) for key in keys]
+        missing = {}
+        for position, ranking in enumerate(rankings):
+            if ranking is None:
+                # Repeated queries inside the batch are scored once
+                missing.setdefault(keys[position], []).append(position)
+        if missing:
+            batch = [queries[positions[0]] for positions in missing.values()]
+            if vector:
+                results = self.system.find_batch(batch, k, vector=True)
+            else:
+                results = self.system.find_batch(batch, k)
+            for (key, positions), ranking in zip(missing.items(), results):
+                self.put(key, k, ranking)
+                for position in positions:
+                    rankings[position] = ranking
+        return rankings
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self.rankings),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
@@ -0,0 +1,335 @@
+# server.py
+# Description: asyncio HTTP/JSON search server over a saved IRSystem2 index.
+# Queries arriving within a short window are grouped into one find_batch call
+# that runs in a thread or process pool, together with the preprocessing of
+# text queries, so neither blocks the event loop. Latency and batching metrics are served at /metrics.
+#
+# Usage: python -m Tarea3.server --index freq/documents.idx --port 8080
+#   curl -d '{"terms": ["kennedi", "vietnam"], "k": 5}' localhost:8080/search
+
+import argparse
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Union
+
+from recuperacion.paths import DOCUMENTS
+
+from .practica3 import Document, IRSystem2
+
+# System and preprocessor of each worker process, loaded once by init_worker
+worker_system = None
+worker_preprocessor = None
+
+
+def init_worker(index_path: str, preprocessor=None):
+    global worker_system, worker_preprocessor
+    worker_system = IRSystem2.load(index_path)
+    worker_preprocessor = preprocessor
+
+
+def worker_find_batch(queries, k):
+    return worker_system.find_batch(preprocess_queries(worker_preprocessor, queries), k)
+
+
+def preprocess_queries(preprocessor, queries) -> list[Document]:
+    """Documents of a batch, preprocessing the texts of "text" queries"""
+    documents = []
+    for query in queries:
+        if isinstance(query, str):
+            frequencies = {}
+            for word in preprocessor(query):
+                frequencies[word] = frequencies.get(word, 0) + 1
+            query = Document(id="", frequencies=frequencies)
+        documents.append(query)
+    return documents
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[
+        min(int(fraction * len(sorted_values)), len(sorted_values) - 1)
+    ]
+
+
+class SearchServer:
+    """Batching search front end of an IRSystem2 index
+
+    Attributes:
+        index_path: Saved index served
+        ir_system: IRSystem2 loaded in this process for the thread pool,
+            None when the process pool workers load their own copy
+        preprocessor: Optional callable turning query text into terms, run
+            with the batch of the query in the pool
+        batch_window: Seconds a batch waits for more queries after the first
+        max_batch: Maximum number of queries per batch
+        workers: Number of threads or processes scoring batches
+        latencies: Seconds from arrival to answer of the latest requests
+        num_requests: Requests answered
+        num_batches: Batches scored
+    """
+
+    def __init__(
+        self,
+        index_path: str,
+        batch_window=0.002,
+        max_batch=64,
+        workers=4,
+        processes=False,
+        preprocessor=None,
+        window_size=10_000,
+    ) -> None:
+        """Contructor
+
+        Args:
+            index_path: File written by IRSystem2.save
+            batch_window: Seconds to wait for more queries before scoring
+            max_batch: Maximum number of queries per batch
+            workers: Number of threads or processes scoring batches
+            processes: Score in a process pool instead of a thread pool
+            preprocessor: Callable(text) -> list of terms, enables "text"
+                queries
+            window_size: Number of latest requests kept for the percentiles
+        """
+        self.index_path = index_path
+        self.ir_system = None
+        self.preprocessor = preprocessor
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.workers = workers
+        if processes:
+            self.executor = ProcessPoolExecutor(
+                workers, initializer=init_worker, initargs=(index_path, preprocessor)
+            )
+            self.find_batch = worker_find_batch
+        else:
+            self.ir_system = IRSystem2.load(index_path)
+            self.executor = ThreadPoolExecutor(workers)
+            self.find_batch = self.__thread_find_batch
+        # The TermCache of a preprocessor is not safe to share between threads
+        self.__preprocessor_lock = threading.Lock()
+        self.latencies = deque(maxlen=window_size)
+        self.num_requests = 0
+        self.num_batches = 0
+        self.num_batched_queries = 0
+        self.__queue = None
+        self.__slots = None
+        self.__tasks = set()
+
+    def __thread_find_batch(self, queries, k):
+        if any(isinstance(query, str) for query in queries):
+            with self.__preprocessor_lock:
+                queries = preprocess_queries(self.preprocessor, queries)
+        return self.ir_system.find_batch(queries, k)
+
+    async def search(self, query, k: int):
+        """Queue a query for the next batch and wait for its ranking
+
+        Args:
+            query: Document, or text to preprocess
+            k: Number of documents to retrieve
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self.__queue.put((query, k, future))
+        return await future
+
+    async def __batcher(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.__queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.__queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            # At most `workers` batches are scored at once
+            await self.__slots.acquire()
+            task = loop.create_task(self.__score(batch))
+            self.__tasks.add(task)
+            task.add_done_callback(self.__tasks.discard)
+
+    async def __score(self, batch):
+        try:
+            queries = [query for query, _, _ in batch]
+            k = max(k for _, k, _ in batch)
+            rankings = await asyncio.get_running_loop().run_in_executor(
+                self.executor, self.find_batch, queries, k
+            )
+            self.num_batches += 1
+            self.num_batched_queries += len(batch)
+            for (_, query_k, future), ranking in zip(batch, rankings):
+                if not future.done():
+                    future.set_result(ranking[:query_k])
+        except Exception as error:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+        finally:
+            self.__slots.release()
+
+    def parse_query(self, body: dict) -> tuple[Union[Document, str], int]:
+        """Build the query of a /search request
+
+        The body holds "terms", as a list of preprocessed terms or a dict of
+        term frequencies, or "text" if the server has a preprocessor, plus
+        an optional positive integer "k" (10 by default). Texts are returned
+        as is, to be preprocessed with their batch off the event loop.
+        """
+        k = body.get("k", 10)
+        if isinstance(k, bool) or not isinstance(k, int) or k < 1:
+            raise ValueError(f'"k" must be a positive integer, not {k!r}')
+        if "terms" in body:
+            terms = body["terms"]
+            if isinstance(terms, dict):
+                frequencies = {str(word): int(tf) for word, tf in terms.items()}
+            else:
+                frequencies = {}
+                for word in terms:
+                    frequencies[str(word)] = frequencies.get(str(word), 0) + 1
+        elif "text" in body and self.preprocessor is not None:
+            if not isinstance(body["text"], str):
+                raise ValueError('"text" must be a string')
+            return body["text"], k
+        else:
+            raise ValueError('missing "terms"')
+        return Document(id=str(body.get("id", "")), frequencies=frequencies), k
+
+    def metrics(self) -> dict:
+        latencies = sorted(self.latencies)
+        return {
+            "requests": self.num_requests,
+            "batches": self.num_batches,
+            "mean_batch_size": self.num_batched_queries / max(self.num_batches, 1),
+            "latency_ms": {
+                "p50": percentile(latencies, 0.5) * 1000,
+                "p95": percentile(latencies, 0.95) * 1000,
+                "p99": percentile(latencies, 0.99) * 1000,
+                "max": (latencies[-1] if latencies else 0.0) * 1000,
+            },
+        }
+
+    async def __route(self, method, path, body):
+        if method == "GET" and path == "/health":
+            return 200, {"status": "ok"}
+        if method == "GET" and path == "/metrics":
+            return 200, self.metrics()
+        if method == "POST" and path == "/search":
+            start = time.perf_counter()
+            try:
+                query, k = self.parse_query(json.loads(body or b"{}"))
+            except (ValueError, TypeError, AttributeError) as error:
+                return 400, {"error": str(error)}
+            ranking = await self.search(query, k)
+            latency = time.perf_counter() - start
+            self.latencies.append(latency)
+            self.num_requests += 1
+            return 200, {
+                "results": [
+                    {"doc_id": doc_id, "score": score} for doc_id, score in ranking
+                ],
+                "latency_ms": latency * 1000,
+            }
+        return 404, {"error": f"no route for {method} {path}"}
+
+    async def handle(self, reader, writer):
+        """Serve the HTTP/1.1 requests of one connection"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                body = await reader.readexactly(length) if length else b""
+                try:
+                    status, payload = await self.__route(method, path, body)
+                except Exception as error:
+                    status, payload = 500, {"error": str(error)}
+                data = json.dumps(payload).encode()
+                keep_alive = headers.get("connection", "").lower() != "close"
+                writer.write(
+                    f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode()
+                    + data
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8080, ready=None):
+        """Run the server until cancelled
+
+        Args:
+            host: Interface to listen on
+            port: TCP port, 0 picks a free one
+            ready: Optional callable(port) called once listening
+        """
+        self.__queue = asyncio.Queue()
+        self.__slots = asyncio.Semaphore(self.workers)
+        batcher = asyncio.create_task(self.__batcher())
+        server = await asyncio.start_server(self.handle, host, port)
+        if ready is not None:
+            ready(server.sockets[0].getsockname()[1])
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+            self.executor.shutdown(cancel_futures=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--index", default=DOCUMENTS + ".idx")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--processes", action="store_true")
+    parser.add_argument("--batch-window", type=float, default=0.002)
+    parser.add_argument("--max-batch", type=int, default=64)
+    parser.add_argument(
+        "--stopwords", help="Stopwords file, enables preprocessing of text queries"
+    )
+    arguments = parser.parse_args()
+    preprocessor = None
+    if arguments.stopwords:
+        from Tarea1.practica1 import Preprocessor, load_stopwords
+
+        preprocessor = Preprocessor(load_stopwords(arguments.stopwords))
+        preprocessor.warm_up()
+    search_server = SearchServer(
+        arguments.index,
+        arguments.batch_window,
+        arguments.max_batch,
+        arguments.workers,
+        arguments.processes,
+        preprocessor,
+    )
+    try:
+        asyncio.run(
+            search_server.serve(
+                arguments.host,
+                arguments.port,
+                lambda port: print(f"Listening on {arguments.host}:{port}"),
+            )
+        )
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,348 @@
+# sharding.py
+# Description: Sharded indexes with scatter-gather query execution. The
+# documents are split into contiguous shards saved as separate files; every
+# query batch is sent to all shards in a process pool and the per-shard top
+# k rankings are merged. Term statistics are global, so the rankings are the
+# same as those of the unsharded system.
+
+import heapq
+import json
+import math
+import os
+import shutil
+import tempfile
+import weakref
+from multiprocessing import Pool
+
+import numpy as np
+
+from recuperacion.paths import DATASET, DOCUMENTS, QUERIES
+
+from .evaluation import CUTOFFS, Qrels, evaluate_rankings, format_trec_eval
+from .practica3 import IRSystem2, load_frequencies, top_k_documents
+
+MANIFEST = "shards.json"
+VOCABULARY = "vocabulary.txt"
+
+# Shards of each worker process, loaded once by init_worker
+worker_shards = None
+
+
+def load_shards(kind: str, paths: list[str]):
+    """Load saved shards, memory-mapping their arrays
+
+    Args:
+        kind: "IRSystem2" for saved indexes, "matrix" for .npy matrices
+        paths: Files of the shards
+
+    Returns: List with the system or matrix of each shard
+    """
+    if kind == "IRSystem2":
+        return [IRSystem2.load(path) for path in paths]
+    return [np.load(path, mmap_mode="r") for path in paths]
+
+
+def init_worker(kind: str, paths: list[str]):
+    global worker_shards
+    worker_shards = load_shards(kind, paths)
+
+
+def score_shard(shards, shard: int, queries, k: int, vector=False):
+    """Top k rankings of a batch in one shard, with doc ids local to it
+
+    Args:
+        shards: List returned by load_shards
+        shard: Shard number
+        queries: Queries of find_batch, or a matrix of normalized query
+            embeddings for matrix shards
+        k: Number of documents to retrieve per query
+        vector: Whether IRSystem2 queries are already vectorized
+    """
+    system = shards[shard]
+    if isinstance(system, IRSystem2):
+        return system.find_batch(queries, k, vector)
+    return [top_k_documents(row, k) for row in queries @ system.T]
+
+
+def worker_score_shard(shard: int, queries, k: int, vector=False):
+    return score_shard(worker_shards, shard, queries, k, vector)
+
+
+def shard_offsets(num_documents: int, num_shards: int) -> list[int]:
+    """Start of each contiguous shard, plus the number of documents"""
+    num_shards = max(1, min(num_shards, num_documents))
+    return [num_documents * shard // num_shards for shard in range(num_shards + 1)]
+
+
+def merge_rankings(shards_rankings, offsets, k: int):
+    """Merge the per-shard rankings of every query
+
+    Args:
+        shards_rankings: For each shard, the rankings of every query with
+            local doc ids
+        offsets: Start of each shard
+        k: Number of documents to retrieve per query
+
+    Returns: List with the (doc_id, similarity) ranking of each query
+    """
+    return [
+        heapq.nlargest(
+            k,
+            (
+                (doc_id + offset, similarity)
+                for offset, ranking in zip(offsets, rankings)
+                for doc_id, similarity in ranking
+            ),
+            key=lambda x: (x[1], -x[0]),
+        )
+        for rankings in zip(*shards_rankings)
+    ]
+
+
+class ShardedSystem:
+    """Scatter-gather execution over saved shards
+
+    The worker pool is created on the first scatter; close, or a with
+    block, stops it. A system discarded without closing terminates its
+    workers when it is garbage collected.
+
+    Attributes:
+        directory: Directory with the shard files and their manifest
+        kind: Type of the shards, "IRSystem2" or "matrix"
+        offsets: Start of each shard in the global doc ids, plus the number
+            of documents
+        paths: File of each shard
+        workers: Processes of the pool, 1 scores the shards sequentially
+            in this process
+    """
+
+    def __init__(self, directory: str, workers=None) -> None:
+        """Open the shards listed in the manifest of a directory
+
+        Args:
+            directory: Directory written by ShardedIRSystem2 or
+                ShardedIRSystem4
+            workers: Number of processes, None uses one per shard up to
+                the number of CPUs
+        """
+        self.directory = directory
+        with open(os.path.join(directory, MANIFEST), "r") as file:
+            manifest = json.load(file)
+        self.kind = manifest["kind"]
+        self.offsets = manifest["offsets"]
+        self.paths = [os.path.join(directory, name) for name in manifest["shards"]]
+        self.workers = workers or min(len(self.paths), os.cpu_count())
+        self.__temporary = None
+        self.__shards = None
+        self.__pool = None
+        self.__pool_finalizer = None
+
+    @staticmethod
+    def write_manifest(directory, kind, offsets, names):
+        with open(os.path.join(directory, MANIFEST), "w") as file:
+            json.dump({"kind": kind, "offsets": offsets, "shards": names}, file)
+
+    def mark_temporary(self):
+        """Delete the directory on close, or when garbage collected"""
+        self.__temporary = weakref.finalize(
+            self, shutil.rmtree, self.directory, ignore_errors=True
+        )
+
+    @property
+    def num_shards(self) -> int:
+        return len(self.paths)
+
+    def scatter(self, queries, k=10, vector=False):
+        """Score a batch in every shard and merge the rankings
+
+        Args:
+            queries: Queries forwarded to score_shard
+            k: Number of documents to retrieve per query
+            vector: Whether IRSystem2 queries are already vectorized
+
+        Returns: List with the (doc_id, similarity) ranking of each query
+        """
+        tasks = [(shard, queries, k, vector) for shard in range(self.num_shards)]
+        if self.workers == 1:
+            if self.__shards is None:
+                self.__shards = load_shards(self.kind, self.paths)
+            shards_rankings = [score_shard(self.__shards, *task) for task in tasks]
+        else:
+            if self.__pool is None:
+                self.__pool = Pool(
+                    self.workers,
+                    initializer=init_worker,
+                    initargs=(self.kind, self.paths),
+                )
+                self.__pool_finalizer = weakref.finalize(self, self.__pool.terminate)
+            shards_rankings = self.__pool.starmap(worker_score_shard, tasks)
+        return merge_rankings(shards_rankings, self.offsets[:-1], k)
+
+    def close(self):
+        """Stop the worker processes, deleting temporary shards"""
+        if self.__pool is not None:
+            self.__pool_finalizer.detach()
+            self.__pool.close()
+            self.__pool.join()
+            self.__pool = None
+        self.__shards = None
+        if self.__temporary is not None:
+            self.__temporary()
+            self.__temporary = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ShardedIRSystem2(ShardedSystem):
+    """IRSystem2 split into shards that share the global idf
+
+    Queries are vectorized here over the global vocabulary, since a shard
+    only knows its own words and would compute a different query norm.
+
+    Attributes:
+        vocabulary: Set with the words of the whole collection
+    """
+
+    def __init__(
+        self, documents_frequencies, num_shards=4, directory=None, workers=None
+    ) -> None:
+        """Build and save the shards of a collection
+
+        Args:
+            documents_frequencies: List of DocumentFrequency
+            num_shards: Number of shards
+            directory: Output directory, a temporary one deleted on close
+                by default
+            workers: Number of processes, None uses one per shard up to
+                the number of CPUs
+        """
+        temporary = directory is None
+        if temporary:
+            directory = tempfile.mkdtemp(prefix="shards-")
+        os.makedirs(directory, exist_ok=True)
+        vocabulary = {}
+        for document in documents_frequencies:
+            for word in document.frequencies:
+                vocabulary[word] = vocabulary.get(word, 0) + 1
+        num_doc = len(documents_frequencies)
+        idf = {
+            word: math.log(num_doc / (1 + frecuency))
+            for word, frecuency in vocabulary.items()
+        }
+        self.vocabulary = set(vocabulary)
+        with open(os.path.join(directory, VOCABULARY), "w") as file:
+            file.writelines(f"{word}\n" for word in vocabulary)
+        offsets = shard_offsets(num_doc, num_shards)
+        names = []
+        for shard, (start, end) in enumerate(zip(offsets, offsets[1:])):
+            names.append(f"shard-{shard}.idx")
+            IRSystem2(documents_frequencies[start:end], idf).save(
+                os.path.join(directory, names[-1])
+            )
+        self.write_manifest(directory, "IRSystem2", offsets, names)
+        super().__init__(directory, workers)
+        if temporary:
+            self.mark_temporary()
+
+    @classmethod
+    def load(cls, directory: str, workers=None):
+        """Open shards saved by a previous ShardedIRSystem2
+
+        Args:
+            directory: Directory of the shards
+            workers: Number of processes, None uses one per shard up to
+                the number of CPUs
+
+        Returns: ShardedIRSystem2
+        """
+        ir_system = cls.__new__(cls)
+        ShardedSystem.__init__(ir_system, directory, workers)
+        with open(os.path.join(directory, VOCABULARY), "r") as file:
+            ir_system.vocabulary = {line.rstrip("\n") for line in file}
+        return ir_system
+
+    def find_batch(self, queries, k=10, vector=False):
+        """Retrieve the top k documents of every query across all shards
+
+        Args:
+            queries: List of Document, or of sparse query vectors if vector
+            k: Number of documents to retrieve per query
+            vector: Whether queries are already vectorized
+
+        Returns: List with the (doc_id, similarity) ranking of each query
+        """
+        if not vector:
+            queries = [
+                {word: 1 for word in query.frequencies if word in self.vocabulary}
+                for query in queries
+            ]
+        return self.scatter(queries, k, vector=True)
+
+    def search(self, query, k=10, vector=False):
+        return self.find_batch([query], k, vector)[0]
+
+
+class ShardedIRSystem4(ShardedSystem):
+    """IRSystem4 whose document embeddings are split into shards
+
+    Queries are vectorized once with the vocabulary and embeddings of the
+    whole collection; only the scoring is distributed.
+
+    Attributes:
+        ir_system: IRSystem4 used to vectorize the queries
+    """
+
+    def __init__(self, ir_system, num_shards=4, directory=None, workers=None) -> None:
+        """Save the document matrix of an IRSystem4 in shards
+
+        Args:
+            ir_system: IRSystem4
+            num_shards: Number of shards
+            directory: Output directory, a temporary one deleted on close
+                by default
+            workers: Number of processes, None uses one per shard up to
+                the number of CPUs
+        """
+        temporary = directory is None
+        if temporary:
+            directory = tempfile.mkdtemp(prefix="shards-")
+        os.makedirs(directory, exist_ok=True)
+        self.ir_system = ir_system
+        offsets = shard_offsets(len(ir_system.documents_matrix), num_shards)
+        names = []
+        for shard, (start, end) in enumerate(zip(offsets, offsets[1:])):
+            names.append(f"shard-{shard}.npy")
+            np.save(
+                os.path.join(directory, names[-1]),
+                ir_system.documents_matrix[start:end],
+            )
+        self.write_manifest(directory, "matrix", offsets, names)
+        super().__init__(directory, workers)
+        if temporary:
+            self.mark_temporary()
+
+    def find_batch(self, queries, k=10):
+        """Retrieve the top k documents of every query across all shards
+
+        Args:
+            queries: List of Document to search
+            k: Number of documents to retrieve per query
+
+        Returns: List with the (doc_id, similarity) ranking of each query
+        """
+        return self.scatter(self.ir_system.vectorize_queries(queries), k)
+
+    def search(self, query, k=10):
+        return self.find_batch([query], k)[0]
+
+
+if __name__ == "__main__":
+    queries_frequencies = load_frequencies(QUERIES, True)
+    with ShardedIRSystem2(load_frequencies(DOCUMENTS)) as ir_system:
+        print(f"{ir_system.num_shards} shards in {ir_system.directory}")
+        rankings = ir_system.find_batch(queries_frequencies, max(CUTOFFS))
+    print(format_trec_eval(evaluate_rankings(Qrels.load(DATASET + ".REL"), rankings)))
@@ -0,0 +1,102 @@
+# storage.py
+# Description: Versioned binary container for numpy arrays. Every array is
+# stored raw and aligned, so it can be memory-mapped when the file is loaded.
+
+import json
+import struct
+
+import numpy as np
+
+MAGIC = b"RIARRAYS"
+ALIGNMENT = 64
+# magic, header length
+PREFIX = struct.Struct("<8sQ")
+
+
+def pack_strings(strings) -> np.ndarray:
+    """Pack a list of strings without newlines into one utf-8 byte array"""
+    return np.frombuffer("\n".join(strings).encode("utf-8"), dtype=np.uint8)
+
+
+def unpack_strings(packed) -> list[str]:
+    """Inverse of pack_strings"""
+    if len(packed) == 0:
+        return []
+    return bytes(packed).decode("utf-8").split("\n")
+
+
+def write_arrays(
+    path: str, kind: str, version: int, arrays: dict, metadata=None
+) -> None:
+    """Write arrays in the container format
+
+    Args:
+        path: Output file
+        kind: Name of the structure stored, checked when reading
+        version: Format version of the structure, checked when reading
+        arrays: Dict with names and numpy arrays
+        metadata: JSON serializable dict stored in the header
+    """
+    arrays = {name: np.ascontiguousarray(data) for name, data in arrays.items()}
+    layout = {}
+    offset = 0
+    for name, data in arrays.items():
+        layout[name] = {
+            "dtype": data.dtype.str,
+            "shape": list(data.shape),
+            "offset": offset,
+        }
+        offset += -(-data.nbytes // ALIGNMENT) * ALIGNMENT
+    header = json.dumps(
+        {
+            "kind": kind,
+            "version": version,
+            "metadata": metadata or {},
+            "arrays": layout,
+        }
+    ).encode("utf-8")
+    start = -(-(PREFIX.size + len(header)) // ALIGNMENT) * ALIGNMENT
+    with open(path, "wb") as file:
+        file.write(PREFIX.pack(MAGIC, len(header)))
+        file.write(header)
+        for name, data in arrays.items():
+            file.seek(start + layout[name]["offset"])
+            file.write(data.tobytes())
+        file.truncate(start + offset)
+
+
+def read_arrays(path: str, kind: str, version: int, mmap=True) -> tuple[dict, dict]:
+    """Read a file written by write_arrays
+
+    Args:
+        path: Input file
+        kind: Expected structure name
+        version: Expected format version
+        mmap: Memory-map the arrays instead of reading them into memory
+
+    Returns: metadata and dict with names and arrays
+    """
+    with open(path, "rb") as file:
+        magic, header_size = PREFIX.unpack(file.read(PREFIX.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not an array container")
+        header = json.loads(file.read(header_size))
+        if header["kind"] != kind or header["version"] != version:
+            raise ValueError(
+                f"{path} stores {header['kind']} v{header['version']}, "
+                f"expected {kind} v{version}"
+            )
+        start = -(-(PREFIX.size + header_size) // ALIGNMENT) * ALIGNMENT
+        arrays = {}
+        for name, layout in header["arrays"].items():
+            dtype = np.dtype(layout["dtype"])
+            shape = tuple(layout["shape"])
+            if mmap and dtype.itemsize * int(np.prod(shape)) > 0:
+                arrays[name] = np.memmap(
+                    path, dtype, "r", start + layout["offset"], shape
+                )
+            else:
+                file.seek(start + layout["offset"])
+                count = int(np.prod(shape))
+                arrays[name] = np.fromfile(file, dtype, count).reshape(shape)
+    return header["metadata"], arrays
@@ -0,0 +1,175 @@
+# ann.py
+# Description: Inverted file (IVF) index for approximate nearest neighbor
+# search over L2-normalized vectors. Vectors are clustered with spherical
+# k-means and a query only scores the lists of its closest centroids.
+
+import math
+
+import numpy as np
+
+from Tarea3.practica3 import top_k_documents
+from Tarea3.storage import read_arrays, write_arrays
+
+ANN_VERSION = 1
+# Rows scored at once while assigning vectors to centroids
+CHUNK_SIZE = 65536
+
+
+class IVFIndex:
+    """IVF index with exact scoring inside the probed lists
+
+    Attributes:
+        centroids: float32 matrix with one normalized centroid per list
+        offsets: Start of each list in vectors, plus the total length
+        vectors: float32 matrix with the indexed vectors grouped by list
+        ids: Row of each vector in the original matrix
+        num_probes: Lists scored per query by default; more probes give
+            higher recall at higher latency
+    """
+
+    def __init__(
+        self,
+        vectors,
+        num_lists=None,
+        num_probes=8,
+        iterations=10,
+        sample_size=None,
+        seed=0,
+    ) -> None:
+        """Contructor
+
+        Args:
+            vectors: float32 matrix with one L2-normalized vector per row
+            num_lists: Number of clusters, defaults to sqrt(rows)
+            num_probes: Default number of lists scored per query
+            iterations: k-means iterations
+            sample_size: Rows used to train the centroids, defaults to
+                64 per list
+            seed: Seed of the random generator
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if num_lists is None:
+            num_lists = max(1, int(math.sqrt(len(vectors))))
+        num_lists = max(1, min(num_lists, len(vectors)))
+        self.num_probes = num_probes
+        self.centroids = self.__train(
+            vectors, num_lists, iterations, sample_size or 64 * num_lists, seed
+        )
+        assignments = self.__assign(vectors, self.centroids)
+        self.ids = np.argsort(assignments, kind="stable")
+        self.vectors = vectors[self.ids]
+        counts = np.bincount(assignments, minlength=num_lists)
+        self.offsets = np.concatenate(([0], np.cumsum(counts)))
+
+    @staticmethod
+    def __assign(vectors, centroids):
+        assignments = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), CHUNK_SIZE):
+            chunk = vectors[start : start + CHUNK_SIZE]
+            assignments[start : start + CHUNK_SIZE] = np.argmax(
+                chunk @ centroids.T, axis=1
+            )
+        return assignments
+
+    @staticmethod
+    def __train(vectors, num_lists, iterations, sample_size, seed):
+        """Spherical k-means over a random sample of the vectors"""
+        generator = np.random.default_rng(seed)
+        if sample_size < len(vectors):
+            sample = vectors[generator.choice(len(vectors), sample_size, replace=False)]
+        else:
+            sample = vectors
+        centroids = sample[generator.choice(len(sample), num_lists, replace=False)]
+        for _ in range(iterations):
+            assignments = IVFIndex.__assign(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            norms = np.linalg.norm(sums, axis=1)
+            # Empty clusters are reseeded with random vectors
+            empty = norms == 0
+            if empty.any():
+                sums[empty] = sample[generator.choice(len(sample), empty.sum())]
+                norms[empty] = np.linalg.norm(sums[empty], axis=1)
+            centroids = sums / np.where(norms == 0, 1, norms)[:, None]
+        return centroids.astype(np.float32)
+
+    def search_batch(self, queries, k=10, num_probes=None):
+        """Approximate top k of every query
+
+        Args:
+            queries: float32 matrix with one normalized query per row
+            k: Number of documents to retrieve per query
+            num_probes: Lists scored per query, defaults to self.num_probes
+
+        Returns: List with the (doc_id, similarity) ranking of each query
+        """
+        num_probes = min(num_probes or self.num_probes, len(self.centroids))
+        queries = np.asarray(queries, dtype=np.float32)
+        centroids_similarities = queries @ self.centroids.T
+        rankings = []
+        for query, similarities in zip(queries, centroids_similarities):
+            probes = np.argpartition(-similarities, num_probes - 1)[:num_probes]
+            rows = np.concatenate(
+                [np.arange(self.offsets[l], self.offsets[l + 1]) for l in probes]
+            )
+            # Sorting by original row keeps ties ordered by doc id
+            rows = rows[np.argsort(self.ids[rows], kind="stable")]
+            ranking = top_k_documents(self.vectors[rows] @ query, k)
+            rankings.append(
+                [(int(self.ids[rows[doc - 1]]) + 1, sim) for doc, sim in ranking]
+            )
+        return rankings
+
+    def exact_batch(self, queries, k=10):
+        """Brute-force top k of every query over all indexed vectors"""
+        similarities = np.asarray(queries, dtype=np.float32) @ self.vectors.T
+        return [
+            [(int(self.ids[doc - 1]) + 1, sim) for doc, sim in top_k_documents(row, k)]
+            for row in similarities
+        ]
+
+    def recall(self, queries, k=10, num_probes=None) -> float:
+        """Mean recall@k of the approximate search against brute force
+
+        Args:
+            queries: float32 matrix with one normalized query per row
+            k: Number of documents to retrieve per query
+            num_probes: Lists scored per query, defaults to self.num_probes
+
+        Returns: Fraction of the exact top k found, averaged over queries
+        """
+        approximate = self.search_batch(queries, k, num_probes)
+        exact = self.exact_batch(queries, k)
+        recalls = [
+            len({d for d, _ in a} & {d for d, _ in e}) / len(e)
+            for a, e in zip(approximate, exact)
+            if e
+        ]
+        return sum(recalls) / len(recalls) if recalls else 1.0
+
+    def save(self, path: str):
+        """Write the index to a versioned binary file"""
+        write_arrays(
+            path,
+            "IVFIndex",
+            ANN_VERSION,
+            {
+                "centroids": self.centroids,
+                "offsets": self.offsets,
+                "vectors": self.vectors,
+                "ids": self.ids,
+            },
+            {"num_probes": self.num_probes},
+        )
+
+    @classmethod
+    def load(cls, path: str):
+        """Load an index written by save, memory-mapping its vectors"""
+        metadata, arrays = read_arrays(path, "IVFIndex", ANN_VERSION)
+        index = cls.__new__(cls)
+        index.num_probes = metadata["num_probes"]
+        index.centroids = np.asarray(arrays["centroids"])
+        index.offsets = np.asarray(arrays["offsets"])
+        index.vectors = arrays["vectors"]
+        index.ids = np.asarray(arrays["ids"])
+        return index
@@ -0,0 +1,67 @@
+# embeddings.py
+# Description: Converts GloVe text files into a float32 matrix (.npy) plus a
+# word list (.vocab) once, so later runs memory-map the matrix and only read
+# the rows of the words they need.
+
+import os
+import sys
+
+import numpy as np
+
+from recuperacion.paths import GLOVE
+
+
+def convert_glove(glove_file: str, prefix: str) -> None:
+    """Convert a GloVe text file to prefix.npy and prefix.vocab
+
+    Args:
+        glove_file: Path of the GloVe text file
+        prefix: Path prefix of the output files
+    """
+    with open(glove_file, "r", encoding="utf-8") as f:
+        first = f.readline().rstrip().split(" ")
+        dimension = len(first) - 1
+        num_words = 1 + sum(1 for _ in f)
+    matrix = np.lib.format.open_memmap(
+        prefix + ".npy.tmp", mode="w+", dtype=np.float32, shape=(num_words, dimension)
+    )
+    with open(glove_file, "r", encoding="utf-8") as f, open(
+        prefix + ".vocab", "w", encoding="utf-8"
+    ) as vocab:
+        for row, line in enumerate(f):
+            # Some GloVe releases contain words with spaces
+            values = line.rstrip().rsplit(" ", dimension)
+            vocab.write(values[0] + "\n")
+            matrix[row] = np.array(values[1:], dtype=np.float32)
+    matrix.flush()
+    del matrix
+    os.replace(prefix + ".npy.tmp", prefix + ".npy")
+
+
+def load_embeddings(prefix: str, words=None) -> dict[str, np.ndarray]:
+    """Load the vectors of the given words from a converted GloVe file
+
+    The matrix is memory-mapped, so only the rows of the requested words are
+    read from disk.
+
+    Args:
+        prefix: Path prefix used in convert_glove
+        words: Words to load, None loads every word
+
+    Returns: Dict with words and float32 vectors
+    """
+    matrix = np.load(prefix + ".npy", mmap_mode="r")
+    wanted = None if words is None else set(words)
+    rows = {}
+    with open(prefix + ".vocab", "r", encoding="utf-8") as vocab:
+        for row, line in enumerate(vocab):
+            word = line.rstrip("\n")
+            if (wanted is None or word in wanted) and word not in rows:
+                rows[word] = row
+    vectors = np.array(matrix[list(rows.values())], dtype=np.float32)
+    return dict(zip(rows, vectors))
+
+
+if __name__ == "__main__":
+    glove_file = sys.argv[1] if len(sys.argv) > 1 else GLOVE + ".txt"
+    convert_glove(glove_file, os.path.splitext(glove_file)[0])
@@ -0,0 +1,142 @@
+# hybrid.py
+# Description: Two-stage retrieval. A lexical system retrieves a candidate
+# set cheaply and only those candidates are scored with the averaged GloVe
+# embeddings of IRSystem4; both rankings are then fused, by default with
+# reciprocal rank fusion.
+
+import os
+
+import numpy as np
+
+from recuperacion.paths import DATASET, DOCUMENTS, QUERIES, RESULT
+from Tarea3.bm25 import BM25IRSystem
+from Tarea3.evaluation import (
+    CUTOFFS,
+    RESULT_DEPTH,
+    Qrels,
+    evaluate_rankings,
+    format_trec_eval,
+)
+from Tarea3.practica3 import TestIR, load_frequencies
+
+from .practica4 import IRSystem4
+
+FUSIONS = ("rrf", "linear", "dense")
+
+
+class HybridIRSystem:
+    """Lexical candidate generation with embedding re-ranking
+
+    Like IRSystem4.find, only positive similarities count as embedding
+    matches: candidates with zero or negative similarity get no embedding
+    rank in RRF, no embedding score in linear fusion, and are dropped by
+    dense fusion.
+
+    Attributes:
+        lexical: System with find_batch(queries, k), such as IRSystem2,
+            BM25IRSystem or CompressedIndex, sharing doc ids with dense
+        dense: IRSystem4 used to re-rank the candidates
+        candidates: Number of lexical candidates re-ranked per query
+        fusion: "rrf" for reciprocal rank fusion, "linear" for a weighted
+            sum of max-normalized scores, "dense" for embedding scores only
+        rrf_k: Rank offset of reciprocal rank fusion
+        weight: Weight of the lexical score in linear fusion
+    """
+
+    def __init__(
+        self, lexical, dense, candidates=100, fusion="rrf", rrf_k=60, weight=0.5
+    ) -> None:
+        if fusion not in FUSIONS:
+            raise ValueError(f"fusion must be one of {FUSIONS}, not {fusion!r}")
+        self.lexical = lexical
+        self.dense = dense
+        self.candidates = candidates
+        self.fusion = fusion
+        self.rrf_k = rrf_k
+        self.weight = weight
+
+    def __fuse(self, lexical_ranking, dense_similarities):
+        doc_ids = np.array([doc_id for doc_id, _ in lexical_ranking], dtype=np.int64)
+        positive = dense_similarities > 0
+        if self.fusion == "dense":
+            return doc_ids[positive], dense_similarities[positive]
+        if self.fusion == "linear":
+            lexical_scores = np.array([score for _, score in lexical_ranking])
+            lexical_scores /= max(lexical_scores.max(), np.finfo(float).tiny)
+            dense_scores = np.where(positive, dense_similarities, 0.0)
+            dense_max = dense_scores.max()
+            if dense_max > 0:
+                dense_scores /= dense_max
+            return doc_ids, (
+                self.weight * lexical_scores + (1 - self.weight) * dense_scores
+            )
+        # Ranks start at 1 and positive similarities sort first; ties in
+        # similarity keep the lexical order
+        dense_ranks = np.empty(len(doc_ids))
+        dense_ranks[np.argsort(-dense_similarities, kind="stable")] = np.arange(
+            1, len(doc_ids) + 1
+        )
+        lexical_ranks = np.arange(1, len(doc_ids) + 1)
+        dense_scores = np.where(positive, 1 / (self.rrf_k + dense_ranks), 0.0)
+        return doc_ids, 1 / (self.rrf_k + lexical_ranks) + dense_scores
+
+    def find_batch(self, queries, k=10):
+        """Retrieve the top k documents of every query
+
+        Args:
+            queries: List of Document to search
+            k: Number of documents to retrieve per query
+
+        Returns: List with the (doc_id, fused score) ranking of each query
+        """
+        lexical_rankings = self.lexical.find_batch(queries, max(k, self.candidates))
+        queries_matrix = self.dense.vectorize_queries(queries)
+        rankings = []
+        for query_vector, lexical_ranking in zip(queries_matrix, lexical_rankings):
+            if not lexical_ranking:
+                rankings.append([])
+                continue
+            rows = [doc_id - 1 for doc_id, _ in lexical_ranking]
+            dense_similarities = self.dense.documents_matrix[rows] @ query_vector
+            doc_ids, scores = self.__fuse(
+                lexical_ranking, dense_similarities.astype(np.float64)
+            )
+            order = np.lexsort((doc_ids, -scores))[:k]
+            rankings.append([(int(doc_ids[i]), float(scores[i])) for i in order])
+        return rankings
+
+    def search(self, query, k=10):
+        """Retrieve the k best documents of a query
+
+        Args:
+            query: Document to search
+            k: Number of documents to retrieve
+
+        Returns: List of (doc_id, fused score) sorted by decreasing score
+        """
+        return self.find_batch([query], k)[0]
+
+
+if __name__ == "__main__":
+    test = TestIR(DATASET + ".REL")
+    queries_frequencies = load_frequencies(QUERIES, True)
+    documents_frequencies = load_frequencies(DOCUMENTS)
+    ir_system = HybridIRSystem(
+        BM25IRSystem(documents_frequencies), IRSystem4(documents_frequencies)
+    )
+    rankings = ir_system.find_batch(queries_frequencies, max(CUTOFFS))
+    with open(
+        os.path.join(RESULT, "retrieved_documents-hybrid.REL"), "w"
+    ) as output_file:
+        for qu_id, retrieved_documents_score in enumerate(rankings, start=1):
+            output_line = f"Q{qu_id} "
+            for doc_id, score in retrieved_documents_score[:RESULT_DEPTH]:
+                output_line += f"D{doc_id} {score} "
+            retrieved_documents = [
+                d for d, _ in retrieved_documents_score[:RESULT_DEPTH]
+            ]
+            precision, recall, f_measure, ap = test.evaluate(qu_id, retrieved_documents)
+            output_line += f"P{precision} R{recall} F{f_measure} AP{ap}\n"
+            print(output_line)
+            output_file.write(output_line)
+    print(format_trec_eval(evaluate_rankings(Qrels.load(DATASET + ".REL"), rankings)))
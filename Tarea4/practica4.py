@@ -3,31 +3,69 @@
 # Date: 09/04/2024
 # Versión: 1.0
 
-import math
-import sys
+import os
 
-sys.path.append("../Tarea3")
+import numpy as np
 
-from practica3 import Document, TestIR, load_frequencies
+from recuperacion.instrumentation import NO_METRICS
+from recuperacion.paths import DATASET, DOCUMENTS, GLOVE, QUERIES, RESULT
+from Tarea3.evaluation import (
+    CUTOFFS,
+    RESULT_DEPTH,
+    Qrels,
+    evaluate_rankings,
+    format_trec_eval,
+)
+from Tarea3.practica3 import Document, TestIR, load_frequencies, top_k_documents
+
+from .ann import IVFIndex
+from .embeddings import convert_glove, load_embeddings
 
 
 class IRSystem4:
-    def __init__(self, documents_frequencies) -> None:
-        self.word_embeddings = self.__load_embeddings()
+    """Retrieval system over averaged GloVe embeddings
+
+    Attributes:
+        documents_frequencies: List of DocumentFrequency
+        vocabulary: Dict with words and document frequencies
+        word_embeddings: Dict with vocabulary words and their vectors
+        documents_matrix: float32 matrix with one L2-normalized document
+            embedding per row, zero for documents without known words
+        ann_index: Optional IVFIndex used by find_batch and search instead of
+            scanning documents_matrix, setting it increases generation
+        generation: Counter increased whenever the rankings may change
+        metrics: Metrics collecting stage timings and counters, disabled
+            unless a Metrics instance is assigned
+    """
+
+    metrics = NO_METRICS
+
+    def __init__(
+        self,
+        documents_frequencies,
+        glove_prefix=GLOVE,
+        progress=None,
+    ) -> None:
+        """Contructor
+
+        Args:
+            documents_frequencies: List of DocumentFrequency
+            glove_prefix: Path prefix of the GloVe files
+            progress: Optional callable(done, total) called while documents
+                are vectorized
+        """
         self.documents_frequencies = documents_frequencies
         self.vocabulary = self.__get_vocabulary()
-        self.documents_vectors = self.__vectorize_documents()
-
-    def __load_embeddings(self):
-        glove_file = "../dataset/GloVe/glove.42B.300d.txt"
-        word_embeddings = {}
-        with open(glove_file, "r", encoding="utf-8") as f:
-            for line in f:
-                values = line.split()
-                word = values[0]
-                vector = [float(val) for val in values[1:]]
-                word_embeddings[word] = vector
-        return word_embeddings
+        self.word_embeddings = self.__load_embeddings(glove_prefix)
+        self.documents_matrix = self.__vectorize_documents(progress)
+        self.generation = 0
+        self.__ann_index = None
+
+    def __load_embeddings(self, glove_prefix):
+        # The text file is converted once into a memory-mappable matrix
+        if not os.path.exists(glove_prefix + ".npy"):
+            convert_glove(glove_prefix + ".txt", glove_prefix)
+        return load_embeddings(glove_prefix, self.vocabulary)
 
     def __get_vocabulary(self):
         vocabulary = {}
@@ -39,69 +77,141 @@ class IRSystem4:
                     vocabulary[word] = 1
         return vocabulary
 
-    def __vectorize_query(self, query: Document):
-        query_vector = [0.0] * len(next(iter(self.word_embeddings.values())))
-        num_words = 0
-        for word in self.vocabulary:
-            if word in query.frequencies and word in self.word_embeddings:
-                word_vector = self.word_embeddings[word]
-                query_vector = [x + y for x, y in zip(query_vector, word_vector)]
-                num_words += 1
-        if num_words != 0:
-            query_vector = [x / num_words for x in query_vector]
-        return query_vector
-
-    def __vectorize_documents(self):
-        documents_vectors = []
-        for doc_freq in self.documents_frequencies:
-            document_vector = [0.0] * len(next(iter(self.word_embeddings.values())))
-            print(len(document_vector))
-            num_words = 0
-            print(doc_freq.frequencies.keys())
-            for word in doc_freq.frequencies.keys():
-                if word in self.word_embeddings:
-                    word_vector = self.word_embeddings[word]
-                    document_vector = [
-                        x + y for x, y in zip(document_vector, word_vector)
-                    ]
-                    num_words += 1
-            if num_words != 0:
-                document_vector = [x / num_words for x in document_vector]
-            documents_vectors.append(document_vector)
-        return documents_vectors
-
-    def __cosine_similarity(self, query, document):
-        dot_product = sum(q * d for q, d in zip(query, document))
-        norm_query = math.sqrt(sum(q**2 for q in query))
-        norm_document = math.sqrt(sum(d**2 for d in document))
-        if norm_query * norm_document == 0:
-            return 0
-        return dot_product / (norm_query * norm_document)
+    @property
+    def dimension(self):
+        return len(next(iter(self.word_embeddings.values()), ()))
+
+    def __average_embedding(self, words):
+        vectors = [self.word_embeddings[w] for w in words if w in self.word_embeddings]
+        if not vectors:
+            return np.zeros(self.dimension, dtype=np.float32)
+        return np.mean(vectors, axis=0, dtype=np.float32)
+
+    @staticmethod
+    def __normalize_rows(matrix):
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms != 0)
+
+    def vectorize_queries(self, queries: list[Document]):
+        """Build the L2-normalized query matrix
+
+        Args:
+            queries: List of Document
+
+        Returns: float32 matrix with one row per query
+        """
+        queries_matrix = np.zeros((len(queries), self.dimension), dtype=np.float32)
+        for position, query in enumerate(queries):
+            queries_matrix[position] = self.__average_embedding(
+                w for w in query.frequencies if w in self.vocabulary
+            )
+        return self.__normalize_rows(queries_matrix)
+
+    def __vectorize_documents(self, progress):
+        total = len(self.documents_frequencies)
+        documents_matrix = np.zeros((total, self.dimension), dtype=np.float32)
+        for position, doc_freq in enumerate(self.documents_frequencies):
+            documents_matrix[position] = self.__average_embedding(doc_freq.frequencies)
+            if progress is not None:
+                progress(position + 1, total)
+        return self.__normalize_rows(documents_matrix)
+
+    @property
+    def ann_index(self):
+        return self.__ann_index
+
+    @ann_index.setter
+    def ann_index(self, ann_index):
+        # Switching between exact and approximate search changes the rankings
+        self.__ann_index = ann_index
+        self.generation += 1
+
+    def build_ann_index(self, num_lists=None, num_probes=8, iterations=10):
+        """Index the documents with an IVFIndex for approximate search
+
+        Args:
+            num_lists: Number of clusters, defaults to sqrt(documents)
+            num_probes: Clusters scored per query
+            iterations: k-means iterations
+
+        Returns: The IVFIndex, also stored in ann_index
+        """
+        self.ann_index = IVFIndex(
+            self.documents_matrix, num_lists, num_probes, iterations
+        )
+        return self.ann_index
 
     def find(self, query):
-        query = self.__vectorize_query(query)
-        for doc_id, document_vector in enumerate(self.documents_vectors, start=1):
-            similarity = self.__cosine_similarity(query, document_vector)
-            if similarity > 0:
-                yield doc_id, similarity
+        metrics = self.metrics
+        metrics.count("queries")
+        with metrics.profile():
+            with metrics.stage("vectorize"):
+                query_vector = self.vectorize_queries([query])[0]
+            with metrics.stage("score"):
+                similarities = self.documents_matrix @ query_vector
+            metrics.count("documents_scored", len(similarities))
+        for doc in np.flatnonzero(similarities > 0):
+            yield int(doc) + 1, float(similarities[doc])
 
+    def find_batch(self, queries, k=10):
+        """Retrieve the top k documents of every query with one matrix product
 
-if __name__ == "__main__":
-    import heapq
+        If ann_index is set, only the probed clusters are scored.
+
+        Args:
+            queries: List of Document to search
+            k: Number of documents to retrieve per query
+
+        Returns: List with the (doc_id, similarity) ranking of each query
+        """
+        metrics = self.metrics
+        metrics.count("queries", len(queries))
+        with metrics.profile():
+            with metrics.stage("vectorize"):
+                queries_matrix = self.vectorize_queries(queries)
+            if self.ann_index is not None:
+                # Probing and selection happen together inside the index
+                with metrics.stage("score"):
+                    return self.ann_index.search_batch(queries_matrix, k)
+            with metrics.stage("score"):
+                similarities = queries_matrix @ self.documents_matrix.T
+            metrics.count("documents_scored", similarities.size)
+            with metrics.stage("select"):
+                return [top_k_documents(row, k) for row in similarities]
 
-    test = TestIR("../dataset/TIME.REL")
-    queries_frequencies = load_frequencies("../freq/queries", True)
-    ir_system = IRSystem4(load_frequencies("../freq/documents"))
-    with open("../result/retrieved_documents-GloVe.REL", "w") as output_file:
-        for qu_id, query in enumerate(queries_frequencies[:10], start=1):
+    def search(self, query, k=10):
+        """Retrieve the k most similar documents
+
+        Args:
+            query: Document to search
+            k: Number of documents to retrieve
+
+        Returns: List of (doc_id, similarity) sorted by decreasing similarity
+        """
+        return self.find_batch([query], k)[0]
+
+
+if __name__ == "__main__":
+    test = TestIR(DATASET + ".REL")
+    queries_frequencies = load_frequencies(QUERIES, True)
+    ir_system = IRSystem4(
+        load_frequencies(DOCUMENTS),
+        progress=lambda done, total: print(f"\rVectorized {done}/{total}", end=""),
+    )
+    print()
+    rankings = ir_system.find_batch(queries_frequencies, max(CUTOFFS))
+    with open(
+        os.path.join(RESULT, "retrieved_documents-GloVe.REL"), "w"
+    ) as output_file:
+        for qu_id, retrieved_documents_similarity in enumerate(rankings, start=1):
             output_line = f"Q{qu_id} "
-            retrieved_documents_similarity = heapq.nlargest(
-                10, ir_system.find(query), key=lambda x: x[1]
-            )
-            for doc_id, sim in retrieved_documents_similarity:
+            for doc_id, sim in retrieved_documents_similarity[:RESULT_DEPTH]:
                 output_line += f"D{doc_id} {sim} "
-            retrieved_documents = [d for d, _ in retrieved_documents_similarity]
+            retrieved_documents = [
+                d for d, _ in retrieved_documents_similarity[:RESULT_DEPTH]
+            ]
             precision, recall, f_measure, _ = test.evaluate(qu_id, retrieved_documents)
             output_line += f"P{precision} R{recall} F{f_measure}\n"
             print(output_line)
             output_file.write(output_line)
+    print(format_trec_eval(evaluate_rankings(Qrels.load(DATASET + ".REL"), rankings)))
@@ -0,0 +1,225 @@
+# benchmark.py
+# Description: Measures index build time, memory footprint, per-query latency
+# percentiles and throughput of the TF-IDF (IRSystem2), Rocchio and GloVe
+# (IRSystem4) systems, on the TIME dataset and on synthetic corpora scaled
+# up from it. Results are written as JSON so runs can be compared.
+#
+# Usage: python -m benchmark.benchmark [--scales 1 10] [--output results.json]
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+
+from recuperacion.paths import DOCUMENTS, GLOVE, QUERIES
+from Tarea3.practica3 import (
+    DocumentFrequency,
+    IRSystem2,
+    MatrixIRSystem2,
+    load_frequencies,
+)
+
+BENCHMARK_VERSION = 1
+
+
+def scale_corpus(documents_frequencies, scale: int, seed=0):
+    """Synthetic corpus with scale times as many documents
+
+    Each synthetic document copies the length and number of distinct words of
+    a random real document, drawing its words from the corpus-wide word
+    distribution, so term statistics stay close to the original.
+
+    Args:
+        documents_frequencies: List of DocumentFrequency
+        scale: Size multiplier, 1 returns the corpus unchanged
+        seed: Seed of the random generators
+
+    Returns: List of DocumentFrequency
+    """
+    if scale == 1:
+        return documents_frequencies
+    totals = {}
+    for doc in documents_frequencies:
+        for word, frequency in doc.frequencies.items():
+            totals[word] = totals.get(word, 0) + frequency
+    words = np.array(list(totals))
+    probabilities = np.fromiter(totals.values(), dtype=np.float64)
+    probabilities /= probabilities.sum()
+    generator = np.random.default_rng(seed)
+    sampler = random.Random(seed)
+    synthetic = []
+    for position in range(len(documents_frequencies) * scale):
+        template = sampler.choice(documents_frequencies)
+        size = len(template.frequencies)
+        if size == 0:
+            # Empty documents stay empty, there are no words to spread
+            synthetic.append(
+                DocumentFrequency(
+                    id=f"Doc{position + 1}",
+                    id_psical=template.id_psical,
+                    frequencies={},
+                )
+            )
+            continue
+        chosen = np.unique(generator.choice(len(words), size, p=probabilities))
+        counts = generator.multinomial(
+            sum(template.frequencies.values()) - len(chosen),
+            np.full(len(chosen), 1 / len(chosen)),
+        )
+        synthetic.append(
+            DocumentFrequency(
+                id=f"Doc{position + 1}",
+                id_psical=template.id_psical,
+                frequencies={str(words[w]): int(c) + 1 for w, c in zip(chosen, counts)},
+            )
+        )
+    return synthetic
+
+
+def percentiles(latencies) -> dict:
+    milliseconds = np.array(latencies) * 1000
+    return {
+        "p50_ms": float(np.percentile(milliseconds, 50)),
+        "p95_ms": float(np.percentile(milliseconds, 95)),
+        "p99_ms": float(np.percentile(milliseconds, 99)),
+        "mean_ms": float(milliseconds.mean()),
+    }
+
+
+def measure_build(build, memory=True) -> tuple[object, dict]:
+    """Time a build and, optionally, its peak traced memory in a second run"""
+    start = time.perf_counter()
+    system = build()
+    result = {"build_s": time.perf_counter() - start}
+    if memory:
+        tracemalloc.start()
+        footprint = build()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del footprint
+        result["memory_mb"] = current / 2**20
+        result["peak_memory_mb"] = peak / 2**20
+    return system, result
+
+
+def measure_queries(run_query, run_batch, queries, repeat=1) -> dict:
+    """Latency percentiles of single queries and throughput of a batch"""
+    latencies = []
+    for _ in range(repeat):
+        for query in queries:
+            start = time.perf_counter()
+            run_query(query)
+            latencies.append(time.perf_counter() - start)
+    result = percentiles(latencies)
+    result["queries_per_s"] = len(latencies) / sum(latencies)
+    if run_batch is not None:
+        start = time.perf_counter()
+        run_batch(queries)
+        result["batch_queries_per_s"] = len(queries) / (time.perf_counter() - start)
+    return result
+
+
+def benchmark_systems(documents, queries, k, repeat, memory, glove_prefix):
+    results = {}
+
+    ir_system, build = measure_build(lambda: IRSystem2(documents), memory)
+    results["tfidf"] = build | measure_queries(
+        lambda q: ir_system.search(q, k),
+        lambda qs: ir_system.find_batch(qs, k),
+        queries,
+        repeat,
+    )
+    results["rocchio"] = build | measure_queries(
+        lambda q: ir_system.pseudo_relevance_feedback(q, k), None, queries, repeat
+    )
+    del ir_system
+
+    matrix_system, build = measure_build(lambda: MatrixIRSystem2(documents), memory)
+    results["tfidf_matrix"] = build | measure_queries(
+        lambda q: matrix_system.search(q, k),
+        lambda qs: matrix_system.find_batch(qs, k),
+        queries,
+        repeat,
+    )
+    del matrix_system
+
+    if glove_prefix and (
+        os.path.exists(glove_prefix + ".npy") or os.path.exists(glove_prefix + ".txt")
+    ):
+        from Tarea4.practica4 import IRSystem4
+
+        glove_system, build = measure_build(
+            lambda: IRSystem4(documents, glove_prefix), memory
+        )
+        results["glove"] = build | measure_queries(
+            lambda q: glove_system.search(q, k),
+            lambda qs: glove_system.find_batch(qs, k),
+            queries,
+            repeat,
+        )
+    else:
+        results["glove"] = {"skipped": f"no GloVe files at {glove_prefix}"}
+    return results
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--documents", default=DOCUMENTS)
+    parser.add_argument("--queries", default=QUERIES)
+    parser.add_argument("--glove", default=GLOVE)
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10])
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-memory", action="store_true")
+    parser.add_argument("--output", default="benchmark_results.json")
+    arguments = parser.parse_args()
+
+    documents = load_frequencies(arguments.documents)
+    queries = load_frequencies(arguments.queries, True)
+    report = {
+        "version": BENCHMARK_VERSION,
+        "date": datetime.now(timezone.utc).isoformat(),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "k": arguments.k,
+        "runs": [],
+    }
+    for scale in arguments.scales:
+        corpus = scale_corpus(documents, scale)
+        print(f"scale {scale}: {len(corpus)} documents", file=sys.stderr)
+        report["runs"].append(
+            {
+                "scale": scale,
+                "documents": len(corpus),
+                "queries": len(queries),
+                "systems": benchmark_systems(
+                    corpus,
+                    queries,
+                    arguments.k,
+                    arguments.repeat,
+                    not arguments.no_memory,
+                    arguments.glove,
+                ),
+            }
+        )
+    with open(arguments.output, "w") as output_file:
+        json.dump(report, output_file, indent=2)
+    print(json.dumps(report["runs"], indent=2))
@@ -0,0 +1,73 @@
+# startup.py
+# Description: Measures the startup time of the command line entry point:
+# interpreter start plus the imports of the package and of each subcommand,
+# in fresh processes, and checks it against a budget. Exits with status 1
+# when a command exceeds its budget.
+#
+# Usage: python -m benchmark.startup [--repeat 5] [--budget 0.3]
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from recuperacion.paths import ROOT
+
+# Code run in a fresh interpreter; each entry imports what the command needs
+# before it touches any data
+COMMANDS = {
+    "python": "pass",
+    "help": "from recuperacion.cli import build_parser; build_parser()",
+    "evaluate": "from recuperacion import Qrels, evaluate, format_trec_eval",
+    "query": "from recuperacion import IRSystem2, load_frequencies",
+    "bm25": "from recuperacion import BM25IRSystem",
+    "preprocess": "from recuperacion import Preprocessor; Preprocessor([])",
+}
+
+# Commands not held to the budget: the bare interpreter is the baseline and
+# text preprocessing loads NLTK on purpose
+UNBUDGETED = {"python", "preprocess"}
+
+
+def best_time(code: str, repeat: int) -> float:
+    """Fastest wall time of repeat fresh interpreters running code, in seconds"""
+    environment = dict(os.environ, PYTHONPATH=ROOT)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], check=True, env=environment)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=0.3,
+        help="Seconds a command may take beyond the bare interpreter",
+    )
+    arguments = parser.parse_args()
+
+    timings = {
+        name: best_time(code, arguments.repeat) for name, code in COMMANDS.items()
+    }
+    baseline = timings["python"]
+    over_budget = [
+        name
+        for name, timing in timings.items()
+        if name not in UNBUDGETED and timing - baseline > arguments.budget
+    ]
+    report = {
+        "budget_s": arguments.budget,
+        "startup_s": timings,
+        "import_s": {name: timing - baseline for name, timing in timings.items()},
+        "over_budget": over_budget,
+    }
+    print(json.dumps(report, indent=2))
+    if over_budget:
+        sys.exit(1)
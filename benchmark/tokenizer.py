@@ -0,0 +1,66 @@
+# tokenizer.py
+# Description: Compares the compiled tokenizer of Preprocessor with the
+# re.sub + word_tokenize path on the TIME documents and queries: checks that
+# both produce the same tokens and terms, and times tokenization alone and
+# the whole preprocessing.
+#
+# Usage: python -m benchmark.tokenizer [--repeat 3]
+
+import argparse
+import json
+import sys
+import time
+
+from recuperacion.paths import DATASET
+from Tarea1.practica1 import Preprocessor, iter_documents, iter_queries, load_stopwords
+
+
+def best_time(function, texts, repeat) -> float:
+    """Fastest of repeat passes of function over every text, in seconds"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in texts:
+            function(text)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset", default=DATASET)
+    parser.add_argument("--repeat", type=int, default=3)
+    arguments = parser.parse_args()
+
+    texts = [
+        document.Content for document in iter_documents(arguments.dataset + ".ALL")
+    ]
+    texts += list(iter_queries(arguments.dataset + ".QUE"))
+    stop_words = load_stopwords(arguments.dataset + ".STP")
+    nltk_preprocessor = Preprocessor(stop_words, fast=False)
+    fast_preprocessor = Preprocessor(stop_words, fast=True)
+    nltk_preprocessor.warm_up()
+    fast_preprocessor.warm_up()
+
+    mismatches = [
+        position
+        for position, text in enumerate(texts)
+        if nltk_preprocessor(text) != fast_preprocessor(text)
+    ]
+    report = {"texts": len(texts), "mismatches": mismatches}
+    for name, preprocessor in (
+        ("nltk", nltk_preprocessor),
+        ("fast", fast_preprocessor),
+    ):
+        # The term cache is warm after the comparison, so preprocessing times
+        # measure tokenization and stopword removal plus cache lookups
+        report[name] = {
+            "tokenize_s": best_time(preprocessor.tokenize, texts, arguments.repeat),
+            "preprocess_s": best_time(preprocessor, texts, arguments.repeat),
+        }
+    report["tokenize_speedup"] = (
+        report["nltk"]["tokenize_s"] / report["fast"]["tokenize_s"]
+    )
+    print(json.dumps(report, indent=2))
+    if mismatches:
+        sys.exit(1)
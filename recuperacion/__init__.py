@@ -0,0 +1,55 @@
+# recuperacion
+# Description: Importable entry point of the retrieval systems of the Tarea1,
+# Tarea3 and Tarea4 packages. Each system, and NLTK, NumPy or SciPy behind
+# it, is imported the first time one of its names is accessed.
+#
+# Usage: from recuperacion import IRSystem2
+#        python -m recuperacion --help
+
+import importlib
+
+# Public names and the module defining each of them
+EXPORTS = {
+    "Preprocessor": "Tarea1.practica1",
+    "IRSystem1": "Tarea1.practica1",
+    "load_stopwords": "Tarea1.practica1",
+    "iter_documents": "Tarea1.practica1",
+    "iter_queries": "Tarea1.practica1",
+    "FrequencyWriter": "Tarea1.practica1",
+    "Document": "Tarea3.practica3",
+    "DocumentFrequency": "Tarea3.practica3",
+    "IRSystem2": "Tarea3.practica3",
+    "MatrixIRSystem2": "Tarea3.practica3",
+    "TestIR": "Tarea3.practica3",
+    "load_frequencies": "Tarea3.practica3",
+    "BM25IRSystem": "Tarea3.bm25",
+    "CompressedIndex": "Tarea3.compressed",
+    "IncrementalIndex": "Tarea3.incremental",
+    "QueryCache": "Tarea3.query_cache",
+    "ShardedIRSystem2": "Tarea3.sharding",
+    "ShardedIRSystem4": "Tarea3.sharding",
+    "SearchServer": "Tarea3.server",
+    "Metrics": "recuperacion.instrumentation",
+    "Qrels": "Tarea3.evaluation",
+    "evaluate": "Tarea3.evaluation",
+    "format_trec_eval": "Tarea3.evaluation",
+    "load_run": "Tarea3.evaluation",
+    "IRSystem4": "Tarea4.practica4",
+    "IVFIndex": "Tarea4.ann",
+    "HybridIRSystem": "Tarea4.hybrid",
+}
+
+__all__ = sorted(EXPORTS)
+
+
+def __getattr__(name: str):
+    if name not in EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(EXPORTS[name]), name)
+    # Cache the name so later accesses skip __getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(EXPORTS))
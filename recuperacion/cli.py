@@ -0,0 +1,183 @@
+# cli.py
+# Description: Command line entry point with index, query and evaluate
+# subcommands. Every input and output is a path argument, so the commands run
+# from any directory, and each subcommand imports only the systems it uses.
+#
+# Usage: python -m recuperacion index --dataset dataset/TIME --output freq
+#        python -m recuperacion query --documents freq/documents
+#            --queries freq/queries --output result/run.REL
+#        python -m recuperacion evaluate dataset/TIME.REL result/run.REL
+
+import argparse
+import os
+import sys
+
+from recuperacion.paths import DATASET, DOCUMENTS, FREQ, QUERIES
+
+MODELS = ("tfidf", "bm25", "compressed")
+# Extension of the saved index of each model, as written by its driver
+INDEX_EXTENSIONS = {"tfidf": ".idx", "compressed": ".cidx"}
+
+
+def index_command(arguments):
+    """Preprocess a dataset into .FRQ files and save its IRSystem2 index"""
+    from recuperacion import IRSystem1, IRSystem2, load_frequencies
+
+    os.makedirs(arguments.output, exist_ok=True)
+    documents_name = os.path.join(arguments.output, "documents")
+    ir_system = IRSystem1(arguments.dataset, arguments.cache)
+    num_documents = ir_system.extract_vocabulary(
+        arguments.workers, documents_name=documents_name, mode="w"
+    )
+    if os.path.exists(ir_system.queries_path):
+        ir_system.extract_queries(
+            arguments.workers,
+            queries_name=os.path.join(arguments.output, "queries"),
+            mode="w",
+        )
+    ir_system.save_cache()
+    IRSystem2(load_frequencies(documents_name)).save(documents_name + ".idx")
+    print(f"Indexed {num_documents} documents into {arguments.output}")
+
+
+def load_system(arguments):
+    """System of the query subcommand
+
+    Saved indexes are rebuilt from the document frequencies when missing or
+    older than them, as the drivers do. Without --index, tfidf uses
+    documents.idx and compressed documents.cidx next to the frequencies.
+    """
+    from recuperacion import load_frequencies
+
+    if arguments.model == "bm25":
+        from recuperacion import BM25IRSystem
+
+        return BM25IRSystem(load_frequencies(arguments.documents))
+    if arguments.model == "tfidf":
+        from recuperacion import IRSystem2 as system_class
+    else:
+        from recuperacion import CompressedIndex as system_class
+    index_path = arguments.index
+    if index_path is None:
+        index_path = arguments.documents + INDEX_EXTENSIONS[arguments.model]
+    frequencies_path = arguments.documents + ".FRQ"
+    if not os.path.exists(frequencies_path):
+        frequencies_path += ".gz"
+    if os.path.exists(index_path) and (
+        not os.path.exists(frequencies_path)
+        or os.path.getmtime(index_path) >= os.path.getmtime(frequencies_path)
+    ):
+        return system_class.load(index_path)
+    ir_system = system_class(load_frequencies(arguments.documents))
+    ir_system.save(index_path)
+    return ir_system
+
+
+def load_queries(arguments):
+    """Queries of the query subcommand, as (query id, Document) pairs"""
+    from recuperacion import Document, load_frequencies
+
+    if not arguments.text:
+        return list(enumerate(load_frequencies(arguments.queries, True), start=1))
+    if arguments.stopwords is None:
+        sys.exit("query: --stopwords is required to preprocess query text")
+    from recuperacion import Preprocessor, load_stopwords
+
+    preprocessor = Preprocessor(load_stopwords(arguments.stopwords))
+    queries = []
+    for id, text in enumerate(arguments.text, start=1):
+        frequencies = {}
+        for word in preprocessor(text):
+            frequencies[word] = frequencies.get(word, 0) + 1
+        queries.append((id, Document(id=str(id), frequencies=frequencies)))
+    return queries
+
+
+def query_command(arguments):
+    """Rank the queries and write them in the format of the drivers"""
+    queries = load_queries(arguments)
+    ir_system = load_system(arguments)
+    rankings = ir_system.find_batch([query for _, query in queries], arguments.k)
+    output_file = (
+        open(arguments.output, "w") if arguments.output is not None else sys.stdout
+    )
+    try:
+        for (qu_id, _), ranking in zip(queries, rankings):
+            output_file.write(
+                f"Q{qu_id}"
+                + "".join(f" D{doc_id} {score}" for doc_id, score in ranking)
+                + "\n"
+            )
+    finally:
+        if output_file is not sys.stdout:
+            output_file.close()
+
+
+def evaluate_command(arguments):
+    """Print the trec_eval summary of a run"""
+    from recuperacion import Qrels, evaluate, format_trec_eval, load_run
+
+    print(
+        format_trec_eval(
+            evaluate(Qrels.load(arguments.qrels), load_run(arguments.run)),
+            arguments.per_query,
+        )
+    )
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="recuperacion", description="Information retrieval over TIME"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    index = subparsers.add_parser("index", help="Preprocess and index a dataset")
+    index.add_argument(
+        "--dataset",
+        default=DATASET,
+        help="Dataset prefix with .ALL, .STP and optionally .QUE files",
+    )
+    index.add_argument("--output", default=FREQ, help="Directory of the indexes")
+    index.add_argument(
+        "--workers", type=int, default=1, help="Processes, 0 uses every CPU"
+    )
+    index.add_argument("--cache", help="File to load and save the TermCache")
+    index.set_defaults(handler=index_command)
+
+    query = subparsers.add_parser("query", help="Rank queries against an index")
+    query.add_argument("text", nargs="*", help="Query texts, needs --stopwords")
+    query.add_argument("--model", choices=MODELS, default="tfidf")
+    query.add_argument(
+        "--index",
+        help="Saved IRSystem2 (tfidf) or CompressedIndex (compressed), by"
+        " default --documents with .idx or .cidx",
+    )
+    query.add_argument(
+        "--documents",
+        default=DOCUMENTS,
+        help="Document frequencies, without extension, that bm25 indexes and"
+        " that rebuild a missing or stale --index",
+    )
+    query.add_argument(
+        "--queries",
+        default=QUERIES,
+        help="Query frequencies, without extension, used without text",
+    )
+    query.add_argument("--stopwords", help="Stopwords file to preprocess text")
+    query.add_argument("-k", type=int, default=10)
+    query.add_argument("--output", help="Run file, standard output by default")
+    query.set_defaults(handler=query_command)
+
+    evaluate = subparsers.add_parser("evaluate", help="trec_eval measures of a run")
+    evaluate.add_argument("qrels", help="Relevance judgments (.REL)")
+    evaluate.add_argument("run", help="Run of the drivers or in TREC format")
+    evaluate.add_argument("-q", dest="per_query", action="store_true")
+    evaluate.set_defaults(handler=evaluate_command)
+    return parser
+
+
+def main(argv=None):
+    arguments = build_parser().parse_args(argv)
+    if getattr(arguments, "workers", 1) == 0:
+        arguments.workers = None
+    arguments.handler(arguments)
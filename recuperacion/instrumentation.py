@@ -0,0 +1,144 @@
+# instrumentation.py
+# Description: Opt-in metrics shared by the retrieval systems of every task.
+# A system records per-stage timings and counters (postings traversed,
+# documents scored) into its metrics attribute, which by default is a shared
+# no-op object, so instrumentation costs a few attribute lookups per query
+# when disabled.
+
+import cProfile
+import io
+import pstats
+import time
+from contextlib import contextmanager, nullcontext
+
+_NO_STAGE = nullcontext()
+
+
+class NoMetrics:
+    """Disabled metrics, every call is a no-op"""
+
+    enabled = False
+
+    def stage(self, name: str):
+        return _NO_STAGE
+
+    def count(self, name: str, value=1):
+        pass
+
+    def profile(self):
+        return _NO_STAGE
+
+
+NO_METRICS = NoMetrics()
+
+
+class Metrics:
+    """Per-stage timers, counters and optional cProfile capture
+
+    Enable on one system with `ir_system.metrics = Metrics()`.
+
+    Attributes:
+        timings: Dict with stage names and [calls, total seconds]
+        counters: Dict with counter names and their totals
+        profiler: cProfile.Profile collecting the profiled calls, or None
+    """
+
+    enabled = True
+
+    def __init__(self, profile=False) -> None:
+        """Contructor
+
+        Args:
+            profile: Whether profile() runs its block under cProfile
+        """
+        self.timings = {}
+        self.counters = {}
+        self.profiler = cProfile.Profile() if profile else None
+        self.__profile_depth = 0
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time the enclosed block and add it to the named stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            timing = self.timings.get(name)
+            if timing is None:
+                self.timings[name] = [1, elapsed]
+            else:
+                timing[0] += 1
+                timing[1] += elapsed
+
+    def count(self, name: str, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    @contextmanager
+    def profile(self):
+        """Run the enclosed block under cProfile, if profiling is enabled
+
+        Nested blocks are captured by the outermost one.
+        """
+        if self.profiler is None or self.__profile_depth:
+            yield
+            return
+        self.__profile_depth += 1
+        self.profiler.enable()
+        try:
+            yield
+        finally:
+            self.profiler.disable()
+            self.__profile_depth -= 1
+
+    def reset(self):
+        self.timings.clear()
+        self.counters.clear()
+        if self.profiler is not None:
+            self.profiler = cProfile.Profile()
+
+    def report(self) -> dict:
+        """Snapshot of the collected metrics
+
+        Returns: Dict with "stages" (calls, total and mean milliseconds per
+            stage) and "counters"
+        """
+        return {
+            "stages": {
+                name: {
+                    "calls": calls,
+                    "total_ms": seconds * 1000,
+                    "mean_ms": seconds * 1000 / calls,
+                }
+                for name, (calls, seconds) in self.timings.items()
+            },
+            "counters": dict(self.counters),
+        }
+
+    def profile_stats(self, sort="cumulative", limit=20) -> str:
+        """Format the cProfile capture with pstats
+
+        Args:
+            sort: pstats sort key
+            limit: Number of functions listed
+
+        Returns: pstats report, empty if profiling is disabled or empty
+        """
+        if self.profiler is None:
+            return ""
+        output = io.StringIO()
+        try:
+            stats = pstats.Stats(self.profiler, stream=output)
+        except TypeError:
+            # Nothing was profiled yet
+            return ""
+        stats.sort_stats(sort).print_stats(limit)
+        return output.getvalue()
+
+    def __str__(self) -> str:
+        lines = [
+            f"{name:<20} {calls:>8} calls {seconds * 1000:>12.3f} ms"
+            for name, (calls, seconds) in self.timings.items()
+        ]
+        lines += [f"{name:<20} {value:>12}" for name, value in self.counters.items()]
+        return "\n".join(lines)
@@ -0,0 +1,14 @@
+# paths.py
+# Description: Default locations of the TIME dataset, the frequency files and
+# the results in a source checkout, shared by the drivers, the benchmarks and
+# the command line.
+
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATASET = os.path.join(ROOT, "dataset", "TIME")
+GLOVE = os.path.join(ROOT, "dataset", "GloVe", "glove.42B.300d")
+FREQ = os.path.join(ROOT, "freq")
+DOCUMENTS = os.path.join(FREQ, "documents")
+QUERIES = os.path.join(FREQ, "queries")
+RESULT = os.path.join(ROOT, "result")
@@ -0,0 +1,61 @@
+import random
+
+import pytest
+
+from Tarea3.practica3 import Document, DocumentFrequency
+
+WORDS = [f"w{number}" for number in range(40)]
+
+
+def random_frequencies(generator, num_words):
+    return {
+        word: generator.randint(1, 5) for word in generator.sample(WORDS, num_words)
+    }
+
+
+@pytest.fixture
+def documents():
+    """Small synthetic collection, skewed so some words are frequent"""
+    generator = random.Random(0)
+    return [
+        DocumentFrequency(
+            id=str(doc_id),
+            frequencies=random_frequencies(generator, generator.randint(3, 12)),
+            id_psical=f"{doc_id:03d}",
+        )
+        for doc_id in range(1, 81)
+    ]
+
+
+@pytest.fixture
+def queries():
+    generator = random.Random(1)
+    return [
+        Document(id=str(qu_id), frequencies=random_frequencies(generator, 3))
+        for qu_id in range(1, 21)
+    ]
+
+
+@pytest.fixture
+def glove_prefix(tmp_path):
+    """Path prefix of a GloVe text file with random vectors for WORDS"""
+    generator = random.Random(2)
+    prefix = str(tmp_path / "glove")
+    with open(prefix + ".txt", "w", encoding="utf-8") as file:
+        for word in WORDS:
+            vector = " ".join(f"{generator.gauss(0, 1):.5f}" for _ in range(8))
+            file.write(f"{word} {vector}\n")
+    return prefix
+
+
+@pytest.fixture(scope="session")
+def nltk_data():
+    """Skip tests that need the WordNet and Punkt data of NLTK when missing"""
+    from nltk import word_tokenize
+    from nltk.stem.wordnet import WordNetLemmatizer
+
+    try:
+        WordNetLemmatizer().lemmatize("documents")
+        word_tokenize("retrieval")
+    except LookupError as error:
+        pytest.skip(f"NLTK data not installed: {error}")
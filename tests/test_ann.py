@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from Tarea4.ann import IVFIndex
+
+
+def doc_ids(rankings):
+    return [[doc_id for doc_id, _ in ranking] for ranking in rankings]
+
+
+@pytest.fixture
+def vectors():
+    generator = np.random.default_rng(0)
+    # Clustered vectors, so a few lists hold most neighbours of a query
+    centers = generator.normal(size=(8, 16))
+    vectors = centers[generator.integers(0, 8, 600)] + 0.3 * generator.normal(
+        size=(600, 16)
+    )
+    return (vectors / np.linalg.norm(vectors, axis=1)[:, None]).astype(np.float32)
+
+
+@pytest.fixture
+def query_vectors(vectors):
+    generator = np.random.default_rng(1)
+    queries = vectors[generator.choice(len(vectors), 20)] + 0.1 * generator.normal(
+        size=(20, 16)
+    )
+    return (queries / np.linalg.norm(queries, axis=1)[:, None]).astype(np.float32)
+
+
+def test_exact_batch_is_brute_force(vectors, query_vectors):
+    index = IVFIndex(vectors, num_lists=8)
+    similarities = query_vectors @ vectors.T
+    for ranking, row in zip(index.exact_batch(query_vectors, 5), similarities):
+        assert [doc_id for doc_id, _ in ranking] == list(np.argsort(-row)[:5] + 1)
+
+
+def test_recall_grows_with_the_probes(vectors, query_vectors):
+    index = IVFIndex(vectors, num_lists=16, num_probes=1)
+    recalls = [index.recall(query_vectors, 10, probes) for probes in (1, 2, 4, 16)]
+    assert all(0 <= recall <= 1 for recall in recalls)
+    assert recalls == sorted(recalls)
+    assert recalls[0] < 1
+    # Probing every list is an exhaustive search
+    assert recalls[-1] == 1.0
+    assert doc_ids(index.search_batch(query_vectors, 10, 16)) == doc_ids(
+        index.exact_batch(query_vectors, 10)
+    )
+
+
+def test_save_and_load(vectors, query_vectors, tmp_path):
+    index = IVFIndex(vectors, num_lists=12, num_probes=3)
+    path = str(tmp_path / "vectors.ivf")
+    index.save(path)
+    loaded = IVFIndex.load(path)
+    assert loaded.num_probes == 3
+    assert np.array_equal(loaded.centroids, index.centroids)
+    assert loaded.search_batch(query_vectors, 10) == index.search_batch(
+        query_vectors, 10
+    )
+    assert loaded.recall(query_vectors, 10) == index.recall(query_vectors, 10)
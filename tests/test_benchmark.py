@@ -0,0 +1,16 @@
+from benchmark.benchmark import scale_corpus
+from Tarea3.practica3 import DocumentFrequency
+
+
+def test_scale_corpus_keeps_lengths(documents):
+    scaled = scale_corpus(documents, 3)
+    assert len(scaled) == 3 * len(documents)
+    lengths = {sum(doc.frequencies.values()) for doc in documents}
+    assert {sum(doc.frequencies.values()) for doc in scaled} <= lengths
+
+
+def test_scale_corpus_with_empty_documents(documents):
+    empty = DocumentFrequency(id="Doc0", id_psical="0", frequencies={})
+    scaled = scale_corpus([empty] + documents[:3], 4)
+    assert len(scaled) == 16
+    assert any(not doc.frequencies for doc in scaled)
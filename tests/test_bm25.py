@@ -0,0 +1,26 @@
+import heapq
+
+from Tarea3.bm25 import BM25IRSystem
+from Tarea3 import practica3
+from Tarea3.practica3 import Document
+
+
+def test_search_matches_exhaustive_scoring(documents, queries):
+    system = BM25IRSystem(documents, delta=0.5)
+    for query in queries:
+        expected = heapq.nlargest(10, system.find(query), key=lambda x: (x[1], -x[0]))
+        assert [doc_id for doc_id, _ in system.search(query, 10)] == [
+            doc_id for doc_id, _ in expected
+        ]
+
+
+def test_unknown_terms_give_an_empty_ranking_that_evaluates(documents, tmp_path):
+    system = BM25IRSystem(documents)
+    ranking = system.find_batch([Document(id="1", frequencies={"unseen": 1})])[0]
+    assert ranking == []
+    qrels_file = tmp_path / "qrels.REL"
+    qrels_file.write_text("1 3 5\n")
+    precision, recall, f_measure, ap = practica3.TestIR(str(qrels_file)).evaluate(
+        1, ranking
+    )
+    assert (precision, recall, f_measure, ap) == (0, 0, 0, 0)
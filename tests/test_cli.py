@@ -0,0 +1,91 @@
+import os
+
+import pytest
+
+from recuperacion import cli
+from recuperacion.cli import main
+from Tarea1.practica1 import FrequencyWriter
+from Tarea3.compressed import CompressedIndex
+from Tarea3.practica3 import IRSystem2
+
+
+@pytest.fixture
+def index_dir(tmp_path, documents, queries):
+    """Directory with the .FRQ files that the index subcommand writes"""
+    with FrequencyWriter(str(tmp_path / "documents"), mode="w") as writer:
+        for doc in documents:
+            writer.write(f"{doc.id}-{doc.id_psical}", doc.frequencies)
+    with FrequencyWriter(str(tmp_path / "queries"), "Que", mode="w") as writer:
+        for query in queries:
+            writer.write(query.id, query.frequencies)
+    return tmp_path
+
+
+def run_query(index_dir, *options):
+    run = str(index_dir / "run.REL")
+    main(
+        [
+            "query",
+            "--documents",
+            str(index_dir / "documents"),
+            "--queries",
+            str(index_dir / "queries"),
+            "--output",
+            run,
+            *options,
+        ]
+    )
+    with open(run) as file:
+        return [line.split() for line in file]
+
+
+def test_models_share_the_default_paths(index_dir, queries, monkeypatch):
+    monkeypatch.setattr(cli, "DOCUMENTS", str(index_dir / "documents"))
+    monkeypatch.setattr(cli, "QUERIES", str(index_dir / "queries"))
+    run = str(index_dir / "run.REL")
+    # Each model keeps its own saved index, so they can run one after another
+    for model in ("tfidf", "compressed", "tfidf", "compressed", "bm25"):
+        main(["query", "--model", model, "--output", run])
+        with open(run) as file:
+            assert len(file.readlines()) == len(queries)
+    assert IRSystem2.load(str(index_dir / "documents.idx"))
+    assert CompressedIndex.load(str(index_dir / "documents.cidx"))
+
+
+def test_query_writes_the_rankings(index_dir, documents, queries):
+    lines = run_query(index_dir, "-k", "5")
+    rankings = IRSystem2(documents).find_batch(queries, 5)
+    assert [line[0] for line in lines] == [f"Q{qu_id}" for qu_id in range(1, 21)]
+    for line, ranking in zip(lines, rankings):
+        assert line[1::2] == [f"D{doc_id}" for doc_id, _ in ranking]
+    # The missing index was built and saved
+    assert os.path.exists(index_dir / "documents.idx")
+
+
+def test_compressed_model_rebuilds_a_stale_index(index_dir, documents, queries):
+    index_path = str(index_dir / "documents.cidx")
+    CompressedIndex(documents[:10]).save(index_path)
+    past = os.path.getmtime(index_dir / "documents.FRQ") - 10
+    os.utime(index_path, (past, past))
+    lines = run_query(index_dir, "--model", "compressed", "--index", index_path)
+    rankings = IRSystem2(documents).find_batch(queries, 10)
+    for line, ranking in zip(lines, rankings):
+        assert line[1::2] == [f"D{doc_id}" for doc_id, _ in ranking]
+    assert len(CompressedIndex.load(index_path).documents_norms) == len(documents)
+
+
+def test_query_text_needs_stopwords(index_dir):
+    with pytest.raises(SystemExit):
+        run_query(index_dir, "some text")
+
+
+def test_evaluate_prints_the_summary(index_dir, capsys):
+    run_query(index_dir)
+    qrels = index_dir / "qrels.REL"
+    qrels.write_text(
+        "".join(f"{qu_id} {qu_id} {qu_id + 1}\n" for qu_id in range(1, 21))
+    )
+    capsys.readouterr()
+    main(["evaluate", str(qrels), str(index_dir / "run.REL")])
+    output = capsys.readouterr().out
+    assert "map" in output and "P_10" in output
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from Tarea3.compressed import (
+    CompressedIndex,
+    decode_varbyte,
+    encode_varbyte,
+    merge_scores,
+)
+from Tarea3.practica3 import IRSystem2
+
+
+def test_varbyte_round_trip():
+    values = [0, 1, 127, 128, 300, 16383, 16384, 2**35, 2**63 - 1]
+    encoded = encode_varbyte(values)
+    assert encoded.dtype == np.uint8
+    assert len(encode_varbyte([127])) == 1 and len(encode_varbyte([128])) == 2
+    assert decode_varbyte(encoded).tolist() == values
+    assert decode_varbyte(encode_varbyte([])).tolist() == []
+
+
+@pytest.mark.parametrize("k", [1, 10, 100])
+@pytest.mark.parametrize("block_size", [1, 4, 128])
+def test_search_matches_irsystem2(documents, queries, block_size, k):
+    expected = IRSystem2(documents)
+    index = CompressedIndex(documents, block_size)
+    for query in queries:
+        ranking = index.search(query, k)
+        reference = expected.search(query, k)
+        assert [doc_id for doc_id, _ in ranking] == [doc_id for doc_id, _ in reference]
+        assert [score for _, score in ranking] == pytest.approx(
+            [score for _, score in reference]
+        )
+        assert dict(index.find(query)) == pytest.approx(dict(expected.find(query)))
+
+
+def test_merge_scores():
+    doc_ids, scores = merge_scores(
+        np.array([2, 5, 9]), np.array([1.0, 2.0, 3.0]), np.array([1, 5, 10]), np.ones(3)
+    )
+    assert doc_ids.tolist() == [1, 2, 5, 9, 10]
+    assert scores.tolist() == [1.0, 1.0, 3.0, 3.0, 1.0]
+
+
+def test_postings_round_trip(documents):
+    index = CompressedIndex(documents, block_size=4)
+    doc_ids, weights = index.postings("w0")
+    expected = [
+        position
+        for position, doc in enumerate(documents, start=1)
+        if "w0" in doc.frequencies
+    ]
+    assert doc_ids.tolist() == expected
+    assert (weights > 0).all()
+
+
+def test_save_and_load(documents, queries, tmp_path):
+    index = CompressedIndex(documents, block_size=8)
+    path = str(tmp_path / "documents.cidx")
+    index.save(path)
+    loaded = CompressedIndex.load(path)
+    assert loaded.block_size == 8
+    assert loaded.find_batch(queries, 10) == index.find_batch(queries, 10)
@@ -0,0 +1,57 @@
+import math
+
+import pytest
+
+from Tarea3.evaluation import Qrels, evaluate, evaluate_rankings, load_run
+
+
+def dcg(gains):
+    return sum(gain / math.log2(rank + 1) for rank, gain in enumerate(gains, start=1))
+
+
+def test_measures_of_a_small_run():
+    qrels = Qrels({1: [2, 4], 2: [7]})
+    results = evaluate(qrels, {1: [1, 2, 3, 4], 2: [5, 6]}, cutoffs=(2, 4))
+    assert list(results["query_ids"]) == [1, 2]
+    assert results["map"][0] == pytest.approx((1 / 2 + 2 / 4) / 2)
+    assert results["map"][1] == 0
+    assert results["recip_rank"][0] == pytest.approx(1 / 2)
+    assert results["P_2"][0] == pytest.approx(1 / 2)
+    assert results["P_4"][0] == pytest.approx(2 / 4)
+    assert results["num_rel_ret"].tolist() == [2, 0]
+    assert results["ndcg"][0] == pytest.approx(dcg([0, 1, 0, 1]) / dcg([1, 1]))
+
+
+def test_ndcg_ideal_holds_relevant_documents_past_depth():
+    qrels = Qrels({1: [1, 2, 3, 4, 5]})
+    results = evaluate(qrels, {1: [1, 2]}, cutoffs=(1, 2))
+    assert results["ndcg"][0] == pytest.approx(dcg([1, 1]) / dcg([1] * 5))
+    assert results["ndcg_cut_2"][0] == pytest.approx(1.0)
+    assert results["Rprec"][0] == pytest.approx(2 / 5)
+
+
+def test_trec_run_is_sorted_by_score(tmp_path):
+    run_file = tmp_path / "run.txt"
+    run_file.write_text(
+        "1 Q0 10 1 0.2 tag\n"
+        "1 Q0 20 2 0.9 tag\n"
+        "1 Q0 30 3 0.5 tag\n"
+        "1 Q0 40 4 0.5 tag\n"
+        "2 Q0 5 1 1.0 tag\n"
+    )
+    assert load_run(str(run_file)) == {1: [20, 40, 30, 10], 2: [5]}
+
+
+def test_drivers_run_format(tmp_path):
+    run_file = tmp_path / "run.REL"
+    run_file.write_text("Q1 D308 0.36 D257 0.33 P0.5 R1.0 F0.6 AP0.5\nQ2 \n")
+    assert load_run(str(run_file)) == {1: [308, 257], 2: []}
+
+
+def test_evaluate_rankings_matches_evaluate():
+    qrels = Qrels({1: [3], 2: [1, 2]})
+    rankings = [[(3, 0.9), (1, 0.5)], [(2, 0.7)]]
+    by_rankings = evaluate_rankings(qrels, rankings, cutoffs=(1,))
+    by_run = evaluate(qrels, {1: [3, 1], 2: [2]}, cutoffs=(1,))
+    for measure in ("map", "ndcg", "P_1"):
+        assert by_rankings[measure].tolist() == by_run[measure].tolist()
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from Tarea3.bm25 import BM25IRSystem
+from Tarea4.hybrid import HybridIRSystem
+from Tarea4.practica4 import IRSystem4
+
+
+@pytest.fixture
+def systems(documents, glove_prefix):
+    return BM25IRSystem(documents), IRSystem4(documents, glove_prefix)
+
+
+def candidate_similarities(lexical, dense, query, candidates):
+    lexical_ranking = lexical.search(query, candidates)
+    query_vector = dense.vectorize_queries([query])[0]
+    return lexical_ranking, {
+        doc_id: float(dense.documents_matrix[doc_id - 1] @ query_vector)
+        for doc_id, _ in lexical_ranking
+    }
+
+
+def test_rrf_ignores_non_positive_similarities(systems, queries):
+    lexical, dense = systems
+    hybrid = HybridIRSystem(lexical, dense, candidates=30, rrf_k=60)
+    checked = 0
+    for query, ranking in zip(queries, hybrid.find_batch(queries, 30)):
+        lexical_ranking, similarities = candidate_similarities(
+            lexical, dense, query, 30
+        )
+        lexical_ranks = {
+            doc_id: rank for rank, (doc_id, _) in enumerate(lexical_ranking, 1)
+        }
+        for doc_id, score in ranking:
+            if similarities[doc_id] <= 0:
+                assert score == pytest.approx(1 / (60 + lexical_ranks[doc_id]))
+                checked += 1
+    assert checked > 0
+
+
+def test_dense_fusion_keeps_positive_similarities(systems, queries):
+    lexical, dense = systems
+    hybrid = HybridIRSystem(lexical, dense, candidates=30, fusion="dense")
+    for query, ranking in zip(queries, hybrid.find_batch(queries, 30)):
+        _, similarities = candidate_similarities(lexical, dense, query, 30)
+        expected = sorted(
+            (doc_id for doc_id, similarity in similarities.items() if similarity > 0),
+            key=lambda doc_id: (-similarities[doc_id], doc_id),
+        )
+        assert [doc_id for doc_id, _ in ranking] == expected
+
+
+def test_linear_fusion_scores_are_bounded(systems, queries):
+    lexical, dense = systems
+    hybrid = HybridIRSystem(lexical, dense, candidates=30, fusion="linear")
+    for ranking in hybrid.find_batch(queries, 10):
+        scores = np.array([score for _, score in ranking])
+        assert ((scores >= 0) & (scores <= 1 + 1e-9)).all()
+
+
+def test_unknown_fusion_is_rejected(systems):
+    with pytest.raises(ValueError):
+        HybridIRSystem(*systems, fusion="sum")
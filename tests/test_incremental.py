@@ -0,0 +1,80 @@
+import pytest
+
+from Tarea3.incremental import IncrementalIndex
+from Tarea3.practica3 import IRSystem2
+
+
+def live_postings(index):
+    return {
+        doc_id
+        for segment in index.segments
+        for postings in segment.postings.values()
+        for doc_id in postings.doc_ids
+    }
+
+
+def assert_matches_rebuild(index, live, queries):
+    """Scores equal those of an IRSystem2 built over the live documents only"""
+    doc_ids = sorted(live)
+    rebuilt = IRSystem2([live[doc_id] for doc_id in doc_ids])
+    assert index.num_documents == len(doc_ids)
+    for query in queries:
+        expected = {
+            doc_ids[position - 1]: similarity
+            for position, similarity in rebuilt.find(query)
+        }
+        assert dict(index.find(query)) == pytest.approx(expected)
+        ranking = index.search(query, 5)
+        assert [similarity for _, similarity in ranking] == pytest.approx(
+            [similarity for _, similarity in rebuilt.search(query, 5)]
+        )
+
+
+def test_interleaved_updates_match_a_rebuild(documents, queries):
+    index = IncrementalIndex(merge_factor=3)
+    live = {}
+    for start in range(0, len(documents), 8):
+        batch = documents[start : start + 8]
+        live.update(zip(index.add_documents(batch), batch))
+        # Delete some old and some just added documents
+        doomed = sorted(live)[::5]
+        index.delete_documents(doomed + doomed[:1])
+        for doc_id in doomed:
+            del live[doc_id]
+        assert_matches_rebuild(index, live, queries)
+    # Tail merges keep the segments logarithmic in the number of additions
+    assert len(index.segments) < len(documents) // 8
+    index.force_merge()
+    assert len(index.segments) == 1
+    assert_matches_rebuild(index, live, queries)
+
+
+def test_merges_purge_deleted_documents(documents, queries):
+    index = IncrementalIndex(merge_factor=3)
+    first = index.add_documents(documents[:10])
+    index.add_documents(documents[10:20])
+    index.delete_documents(first[:4])
+    assert index.deleted == set(first[:4])
+    assert set(first[:4]) <= live_postings(index)
+    # The third segment of the level triggers a merge of the tail
+    index.add_documents(documents[20:30])
+    assert len(index.segments) == 1
+    assert index.deleted == set()
+    assert live_postings(index).isdisjoint(first[:4])
+    index.delete_documents(first[4:])
+    index.force_merge()
+    assert index.deleted == set()
+    assert set(index.segments[0].terms) == set(range(11, 31))
+    assert live_postings(index) <= set(range(11, 31))
+
+
+def test_deleting_every_document(documents, queries):
+    index = IncrementalIndex(documents[:5])
+    generation = index.generation
+    index.delete_documents(range(1, 6))
+    index.delete_documents([99])
+    assert index.generation == generation + 5
+    assert index.num_documents == 0 and index.vocabulary == {}
+    assert index.find_batch(queries, 5) == [[] for _ in queries]
+    index.force_merge()
+    assert index.segments == [] and index.deleted == set()
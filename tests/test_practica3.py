@@ -0,0 +1,126 @@
+import heapq
+
+import numpy as np
+import pytest
+from scipy.sparse import issparse
+
+from Tarea3.practica3 import Document, IRSystem2, MatrixIRSystem2, top_k_documents
+
+
+@pytest.mark.parametrize("k", [1, 5, 30])
+def test_max_score_search_matches_exhaustive_scoring(documents, queries, k):
+    system = IRSystem2(documents)
+    for query in queries:
+        expected = heapq.nlargest(k, system.find(query), key=lambda x: (x[1], -x[0]))
+        ranking = system.search(query, k)
+        assert [doc_id for doc_id, _ in ranking] == [doc_id for doc_id, _ in expected]
+        assert [score for _, score in ranking] == pytest.approx(
+            [score for _, score in expected]
+        )
+
+
+def test_matrix_batch_matches_irsystem2(documents, queries):
+    expected = IRSystem2(documents)
+    system = MatrixIRSystem2(documents)
+    batch = queries * 50
+    rankings = system.find_batch(batch, 10)
+    assert len(rankings) == len(batch)
+    for query, ranking in zip(batch, rankings):
+        reference = expected.search(query, 10)
+        assert [doc_id for doc_id, _ in ranking] == [doc_id for doc_id, _ in reference]
+        assert [score for _, score in ranking] == pytest.approx(
+            [score for _, score in reference]
+        )
+        assert dict(system.find(query)) == pytest.approx(dict(expected.find(query)))
+
+
+def test_matrix_similarities_stay_sparse(documents, queries):
+    system = MatrixIRSystem2(documents)
+    similarities = system.similarities(system.vectorize_queries(queries))
+    assert issparse(similarities)
+    assert similarities.shape == (len(queries), len(documents))
+    assert similarities.nnz < similarities.shape[0] * similarities.shape[1]
+
+
+def test_top_k_over_a_subset_of_documents():
+    similarities = np.array([0.5, 0.0, 0.9, 0.5])
+    assert top_k_documents(similarities, 3) == [(3, 0.9), (1, 0.5), (4, 0.5)]
+    doc_ids = np.array([11, 7, 8, 2])
+    assert top_k_documents(similarities, 2, doc_ids) == [(8, 0.9), (2, 0.5)]
+    assert top_k_documents(similarities, 3, doc_ids) == [(8, 0.9), (2, 0.5), (11, 0.5)]
+
+
+def test_save_and_load(documents, queries, tmp_path):
+    system = IRSystem2(documents)
+    path = str(tmp_path / "documents.idx")
+    system.save(path)
+    loaded = IRSystem2.load(path)
+    assert loaded.find_batch(queries, 10) == system.find_batch(queries, 10)
+    assert [dict(loaded.find(query)) for query in queries] == [
+        dict(system.find(query)) for query in queries
+    ]
+    stored = loaded.documents_frequencies
+    assert len(stored) == len(documents)
+    assert list(stored) == documents
+    assert stored[3:6] == documents[3:6]
+
+
+def test_stored_documents_follow_the_sequence_contract(documents, tmp_path):
+    path = str(tmp_path / "documents.idx")
+    IRSystem2(documents).save(path)
+    stored = IRSystem2.load(path).documents_frequencies
+    assert stored[-1] == documents[-1]
+    assert stored[-len(documents)] == documents[0]
+    assert stored[np.int64(2)] == documents[2]
+    for position in (len(documents), -len(documents) - 1):
+        with pytest.raises(IndexError):
+            stored[position]
+    with pytest.raises(TypeError):
+        stored[1.0]
+
+
+def tfidf_vector(system, document):
+    size = sum(document.frequencies.values())
+    return {
+        word: frequency / size * system.idf[word]
+        for word, frequency in document.frequencies.items()
+    }
+
+
+def test_rocchio_feedback_moves_the_query(documents, queries):
+    system = IRSystem2(documents)
+    query = queries[0]
+    relevant = [tfidf_vector(system, documents[i - 1]) for i in (2, 5)]
+    irrelevant = tfidf_vector(system, documents[6])
+    expanded = system.rocchio_feedback(query, [2, 5], [7], 1, 0.75, 0.25)
+    words = set(query.frequencies) | set().union(*relevant) | set(irrelevant)
+    expected = {
+        word: (word in query.frequencies)
+        + 0.75 * sum(vector.get(word, 0.0) for vector in relevant) / 2
+        - 0.25 * irrelevant.get(word, 0.0)
+        for word in words
+    }
+    assert expanded == pytest.approx(expected)
+    trimmed = system.rocchio_feedback(query, [2, 5], [7], 1, 0.75, 0.25, 4)
+    assert trimmed == {
+        word: expanded[word]
+        for word in sorted(expanded, key=expanded.get, reverse=True)[:4]
+    }
+    # A query made of a document alone finds that document first
+    alone = system.rocchio_feedback(query, [9], [], 0, 1, 0)
+    assert system.search(alone, 1, vector=True)[0][0] == 9
+
+
+def test_pseudo_relevance_feedback(documents, queries, tmp_path):
+    system = IRSystem2(documents)
+    path = str(tmp_path / "documents.idx")
+    system.save(path)
+    loaded = IRSystem2.load(path)
+    for query in queries:
+        top = [doc_id for doc_id, _ in system.search(query, 5)]
+        expanded = system.rocchio_feedback(query, top[:3], top[3:5], 1, 0.75, 0.25, 50)
+        expected = system.search(expanded, 10, vector=True)
+        assert system.pseudo_relevance_feedback(query, 10, 3, 2) == expected
+        assert loaded.pseudo_relevance_feedback(query, 10, 3, 2) == expected
+    unknown = Document(id="0", frequencies={"unseen": 1})
+    assert system.pseudo_relevance_feedback(unknown) == []
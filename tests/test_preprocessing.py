@@ -0,0 +1,46 @@
+from itertools import islice
+
+import pytest
+
+from recuperacion.paths import DATASET
+from Tarea1.practica1 import IRSystem1, iter_documents
+
+pytestmark = pytest.mark.usefixtures("nltk_data")
+
+
+@pytest.fixture
+def texts():
+    documents = islice(iter_documents(DATASET + ".ALL"), 40)
+    return [document.Content for document in documents]
+
+
+def test_parallel_frequencies_match_serial(texts):
+    serial = list(IRSystem1(DATASET).term_frequencies(texts))
+    parallel = list(IRSystem1(DATASET).term_frequencies(texts, workers=2))
+    assert parallel == serial
+
+
+def test_workers_share_the_parent_cache(texts):
+    ir_system = IRSystem1(DATASET)
+    serial = list(ir_system.term_frequencies(texts))
+    cache = ir_system.preprocessor.cache
+    cache.hits = cache.misses = 0
+    parallel = list(ir_system.term_frequencies(texts, workers=2, chunksize=2))
+    assert parallel == serial
+    # Every token was normalized by the serial pass, so workers never miss
+    assert cache.misses == 0
+    assert cache.hits == sum(sum(frequencies.values()) for frequencies in serial)
+
+
+def test_new_worker_terms_reach_the_parent(texts):
+    ir_system = IRSystem1(DATASET)
+    parallel = list(ir_system.term_frequencies(texts, workers=2))
+    cache = ir_system.preprocessor.cache
+    # Workers may each miss the same token once before the parent learns it
+    assert cache.misses >= len(cache.terms) > 0
+    assert cache.hits + cache.misses == sum(
+        sum(frequencies.values()) for frequencies in parallel
+    )
+    serial_system = IRSystem1(DATASET)
+    list(serial_system.term_frequencies(texts))
+    assert dict(cache.terms) == dict(serial_system.preprocessor.cache.terms)
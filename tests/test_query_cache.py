@@ -0,0 +1,106 @@
+import pytest
+
+from Tarea3.bm25 import BM25IRSystem
+from Tarea3.incremental import IncrementalIndex
+from Tarea3.practica3 import IRSystem2, MatrixIRSystem2
+from Tarea3.query_cache import QueryCache
+from Tarea4.practica4 import IRSystem4
+
+BACKENDS = {
+    "IRSystem2": lambda documents, glove_prefix: IRSystem2(documents),
+    "MatrixIRSystem2": lambda documents, glove_prefix: MatrixIRSystem2(documents),
+    "IRSystem4": lambda documents, glove_prefix: IRSystem4(documents, glove_prefix),
+    "IncrementalIndex": lambda documents, glove_prefix: IncrementalIndex(documents),
+    "BM25IRSystem": lambda documents, glove_prefix: BM25IRSystem(documents),
+}
+
+
+class ShortRankings:
+    """System whose rankings stop short of k, like pruned or ANN searches"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def search(self, query, k=10):
+        self.calls += 1
+        return [(doc_id, 1.0 / doc_id) for doc_id in range(1, min(k, 3) + 1)]
+
+    def find_batch(self, queries, k=10):
+        return [self.search(query, k) for query in queries]
+
+
+def doc_ids(rankings):
+    return [[doc_id for doc_id, _ in ranking] for ranking in rankings]
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_backend_rankings(backend, documents, queries, glove_prefix):
+    system = BACKENDS[backend](documents, glove_prefix)
+    cache = QueryCache(system)
+    expected = system.find_batch(queries, 5)
+    assert doc_ids(cache.find_batch(queries, 5)) == doc_ids(expected)
+    assert cache.misses == len(queries) and cache.hits == 0
+    assert doc_ids(cache.find_batch(queries, 5)) == doc_ids(expected)
+    assert doc_ids([cache.search(queries[0], 3)]) == doc_ids([expected[0][:3]])
+    assert cache.hits == len(queries) + 1
+
+
+def test_short_ranking_is_not_reused_for_larger_k(queries):
+    system = ShortRankings()
+    cache = QueryCache(system)
+    cache.search(queries[0], 2)
+    cache.search(queries[0], 10)
+    assert system.calls == 2
+    cache.search(queries[0], 10)
+    cache.search(queries[0], 5)
+    assert system.calls == 2
+
+
+def test_changing_ann_index_invalidates(documents, queries, glove_prefix):
+    system = IRSystem4(documents, glove_prefix)
+    cache = QueryCache(system)
+    cache.search(queries[0], 5)
+    system.build_ann_index(num_lists=4, num_probes=1)
+    cache.search(queries[0], 5)
+    assert cache.invalidations == 1
+    system.ann_index = None
+    assert doc_ids([cache.search(queries[0], 5)]) == doc_ids(
+        [system.search(queries[0], 5)]
+    )
+    assert cache.invalidations == 2 and cache.hits == 0
+
+
+def test_incremental_updates_invalidate(documents, queries):
+    system = IncrementalIndex(documents[:40])
+    cache = QueryCache(system)
+    cache.find_batch(queries, 5)
+    system.add_documents(documents[40:])
+    assert doc_ids(cache.find_batch(queries, 5)) == doc_ids(
+        system.find_batch(queries, 5)
+    )
+    assert cache.hits == 0
+
+
+def test_bm25_parameters_invalidate(documents, queries):
+    system = BM25IRSystem(documents)
+    cache = QueryCache(system)
+    cache.find_batch(queries, 5)
+    system.set_parameters(k1=2.0, b=0.2, delta=1.0)
+    expected = system.find_batch(queries, 5)
+    rankings = cache.find_batch(queries, 5)
+    assert doc_ids(rankings) == doc_ids(expected)
+    assert [score for _, score in rankings[0]] == [score for _, score in expected[0]]
+    assert cache.invalidations == 1 and cache.hits == 0
+
+
+def test_lru_eviction_and_ttl(documents, queries):
+    cache = QueryCache(IRSystem2(documents), max_size=2)
+    for query in queries[:3]:
+        cache.search(query)
+    assert cache.evictions == 1 and len(cache.rankings) == 2
+    cache.search(queries[0])
+    assert cache.hits == 0
+    expiring = QueryCache(IRSystem2(documents), ttl=0)
+    expiring.search(queries[0])
+    expiring.search(queries[0])
+    assert expiring.expirations == 1 and expiring.hits == 0
@@ -0,0 +1,134 @@
+import asyncio
+import http.client
+import json
+import threading
+from contextlib import contextmanager
+
+import pytest
+
+from Tarea3.practica3 import IRSystem2
+from Tarea3.server import SearchServer
+
+
+@pytest.fixture
+def index_path(documents, tmp_path):
+    path = str(tmp_path / "documents.idx")
+    IRSystem2(documents).save(path)
+    return path
+
+
+@contextmanager
+def running(search_server):
+    """Serve on a free port from an event loop in a background thread"""
+    ready = threading.Event()
+    started = {}
+
+    def on_ready(port):
+        started.update(
+            port=port, loop=asyncio.get_running_loop(), task=asyncio.current_task()
+        )
+        ready.set()
+
+    def run():
+        try:
+            # asyncio.run also cancels the connection handlers left behind
+            asyncio.run(search_server.serve("127.0.0.1", 0, on_ready))
+        except asyncio.CancelledError:
+            pass
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    assert ready.wait(10)
+    try:
+        yield started["port"]
+    finally:
+        started["loop"].call_soon_threadsafe(started["task"].cancel)
+        thread.join(10)
+        assert not thread.is_alive()
+
+
+class SplitPreprocessor:
+    """Stand-in for Preprocessor that records the threads it runs on"""
+
+    def __init__(self):
+        self.threads = []
+
+    def __call__(self, text):
+        self.threads.append(threading.current_thread().name)
+        return text.split()
+
+
+def request(port, method, path, body=None):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    try:
+        connection.request(method, path, None if body is None else json.dumps(body))
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        connection.close()
+
+
+def test_search_matches_the_index(documents, queries, index_path):
+    system = IRSystem2(documents)
+    with running(SearchServer(index_path, workers=2)) as port:
+        assert request(port, "GET", "/health") == (200, {"status": "ok"})
+        for query in queries[:5]:
+            status, payload = request(
+                port, "POST", "/search", {"terms": query.frequencies, "k": 5}
+            )
+            assert status == 200
+            assert [result["doc_id"] for result in payload["results"]] == [
+                doc_id for doc_id, _ in system.search(query, 5)
+            ]
+        status, metrics = request(port, "GET", "/metrics")
+        assert status == 200 and metrics["requests"] == 5
+
+
+@pytest.mark.parametrize("k", [0, -3, "five", 2.5, True, None])
+def test_invalid_k_is_a_bad_request(index_path, k):
+    with running(SearchServer(index_path, workers=1)) as port:
+        status, payload = request(port, "POST", "/search", {"terms": ["w1"], "k": k})
+    assert status == 400 and '"k"' in payload["error"]
+
+
+def test_process_pool_leaves_the_index_to_the_workers(documents, queries, index_path):
+    search_server = SearchServer(index_path, workers=1, processes=True)
+    assert search_server.ir_system is None
+    with running(search_server) as port:
+        status, payload = request(
+            port, "POST", "/search", {"terms": queries[0].frequencies, "k": 3}
+        )
+    assert status == 200
+    assert [result["doc_id"] for result in payload["results"]] == [
+        doc_id for doc_id, _ in IRSystem2(documents).search(queries[0], 3)
+    ]
+
+
+@pytest.mark.parametrize("processes", [False, True])
+def test_text_is_preprocessed_off_the_event_loop(
+    documents, queries, index_path, processes
+):
+    preprocessor = SplitPreprocessor()
+    search_server = SearchServer(
+        index_path, workers=2, processes=processes, preprocessor=preprocessor
+    )
+    expected = IRSystem2(documents)
+    with running(search_server) as port:
+        for query in queries[:3]:
+            status, payload = request(
+                port, "POST", "/search", {"text": " ".join(query.frequencies), "k": 5}
+            )
+            assert status == 200
+            assert [result["doc_id"] for result in payload["results"]] == [
+                doc_id for doc_id, _ in expected.search(query, 5)
+            ]
+        status, payload = request(port, "POST", "/search", {"text": ["w1"]})
+        assert status == 400
+    if processes:
+        # Each worker preprocesses with its own copy
+        assert preprocessor.threads == []
+    else:
+        assert len(preprocessor.threads) == 3
+        assert all(
+            name.startswith("ThreadPoolExecutor") for name in preprocessor.threads
+        )
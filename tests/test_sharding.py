@@ -0,0 +1,71 @@
+import gc
+import os
+
+import pytest
+
+from Tarea3.practica3 import IRSystem2
+from Tarea3.sharding import ShardedIRSystem2, ShardedIRSystem4
+from Tarea4.practica4 import IRSystem4
+
+
+def doc_ids(rankings):
+    return [[doc_id for doc_id, _ in ranking] for ranking in rankings]
+
+
+def pool_processes(ir_system):
+    return list(ir_system._ShardedSystem__pool._pool)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_sharded_rankings_match_unsharded(documents, queries, workers):
+    expected = IRSystem2(documents).find_batch(queries, 10)
+    with ShardedIRSystem2(documents, num_shards=3, workers=workers) as ir_system:
+        rankings = ir_system.find_batch(queries, 10)
+    assert doc_ids(rankings) == doc_ids(expected)
+    for ranking, expected_ranking in zip(rankings, expected):
+        assert [s for _, s in ranking] == pytest.approx(
+            [s for _, s in expected_ranking]
+        )
+
+
+def test_saved_shards_load(documents, queries, tmp_path):
+    directory = str(tmp_path / "shards")
+    with ShardedIRSystem2(documents, num_shards=4, directory=directory, workers=1):
+        pass
+    assert os.path.exists(directory)
+    with ShardedIRSystem2.load(directory, workers=1) as ir_system:
+        assert doc_ids(ir_system.find_batch(queries, 5)) == doc_ids(
+            IRSystem2(documents).find_batch(queries, 5)
+        )
+
+
+def test_sharded_embeddings_match(documents, queries, glove_prefix):
+    dense = IRSystem4(documents, glove_prefix)
+    with ShardedIRSystem4(dense, num_shards=3, workers=1) as ir_system:
+        assert doc_ids(ir_system.find_batch(queries, 5)) == doc_ids(
+            dense.find_batch(queries, 5)
+        )
+
+
+def test_close_stops_workers_and_deletes_temporary_shards(documents, queries):
+    ir_system = ShardedIRSystem2(documents, num_shards=2, workers=2)
+    ir_system.find_batch(queries, 5)
+    processes = pool_processes(ir_system)
+    directory = ir_system.directory
+    ir_system.close()
+    assert not any(process.is_alive() for process in processes)
+    assert not os.path.exists(directory)
+    ir_system.close()
+
+
+def test_discarded_system_stops_workers(documents, queries):
+    ir_system = ShardedIRSystem2(documents, num_shards=2, workers=2)
+    ir_system.find_batch(queries, 5)
+    processes = pool_processes(ir_system)
+    directory = ir_system.directory
+    del ir_system
+    gc.collect()
+    for process in processes:
+        process.join(10)
+    assert not any(process.is_alive() for process in processes)
+    assert not os.path.exists(directory)
@@ -0,0 +1,34 @@
+import nltk
+import pytest
+from nltk.tokenize import NLTKWordTokenizer
+
+from recuperacion.paths import DATASET
+from Tarea1.practica1 import Preprocessor
+
+# TIME documents and queries, compared line by line
+EXTENSIONS = (".ALL", ".QUE")
+
+
+def mismatches(extension):
+    """Lines where the fast tokenizer and the word_tokenize path disagree"""
+    fast_preprocessor = Preprocessor([], fast=True)
+    nltk_preprocessor = Preprocessor([], fast=False)
+    with open(DATASET + extension, encoding="utf-8") as f:
+        return [
+            line
+            for line in f
+            if fast_preprocessor.tokenize(line) != nltk_preprocessor.tokenize(line)
+        ]
+
+
+@pytest.mark.usefixtures("nltk_data")
+@pytest.mark.parametrize("extension", EXTENSIONS)
+def test_fast_tokenize_matches_word_tokenize(extension):
+    assert mismatches(extension) == []
+
+
+@pytest.mark.parametrize("extension", EXTENSIONS)
+def test_fast_tokenize_matches_the_treebank_tokenizer(extension, monkeypatch):
+    # word_tokenize without the Punkt sentence splitter, which needs nltk_data
+    monkeypatch.setattr(nltk, "word_tokenize", NLTKWordTokenizer().tokenize)
+    assert mismatches(extension) == []